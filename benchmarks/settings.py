@@ -0,0 +1,10 @@
+"""
+Настройки сервера для нагрузочного теста.
+
+Таблицы создаются напрямую по моделям (migrate --run-syncdb), поэтому
+тест не зависит от локально сгенерированных миграций.
+"""
+
+from fstr_api.settings import *  # noqa: F401,F403
+
+MIGRATION_MODULES = {'passes': None}
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест REST API метода submitData.
+
+Отправляет POST /submitData/ с заданной параллельностью и набором
+изображений разного числа и размера и для каждого сценария считает
+пропускную способность, задержки p50/p95/p99, пиковый RSS сервера и
+число SQL-запросов на запрос (по /metrics). Результаты сохраняются
+в JSON и могут сравниваться с базовым прогоном.
+
+По умолчанию запускает собственный сервер на временной базе SQLite:
+
+    python benchmarks/submit_data.py --output results.json
+    python benchmarks/submit_data.py --baseline results.json
+
+С --db postgresql сервер использует базу из переменных FSTR_DB_*
+(только одноразовую: тест создает записи). С --url тест идет на уже
+запущенный сервер.
+"""
+
+import argparse
+import base64
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRIC_RE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+# Показатели, которые сравниваются с базовым прогоном: (поле, чем меньше - тем лучше)
+COMPARED = [
+    ('throughput_rps', False),
+    ('latency_p95_ms', True),
+    ('latency_p99_ms', True),
+    ('queries_per_request', True),
+    ('peak_rss_mb', True),
+]
+
+
+def parse_size(value):
+    """Размер вида 200k, 1m или 5000 в байтах"""
+    value = value.strip().lower()
+    multiplier = {'k': 1024, 'm': 1024 ** 2}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def parse_list(value, convert=int):
+    return [convert(item) for item in value.split(',') if item.strip()]
+
+
+def make_jpeg(target_bytes, rng):
+    """JPEG из шума размером примерно target_bytes"""
+    side = max(8, int((target_bytes / 2) ** 0.5))
+    for _ in range(3):
+        noise = rng.randbytes(side * side * 3)
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (side, side), noise).save(buffer, 'JPEG', quality=90)
+        size = buffer.tell()
+        if abs(size - target_bytes) <= target_bytes * 0.1:
+            break
+        side = max(8, int(side * (target_bytes / size) ** 0.5))
+    return buffer.getvalue()
+
+
+def make_payloads(count, images, image_size, rng):
+    """
+    Тела запросов сценария.
+
+    Координаты и названия различаются, чтобы поиск дубликатов и проверка
+    идемпотентности работали как на реальных данных. Изображения одного
+    размера делаются из общего JPEG с разными байтами после конца файла,
+    поэтому их содержимое (и хеш) различается.
+    """
+    base_image = make_jpeg(image_size, rng) if images else b''
+    payloads = []
+    for index in range(count):
+        payload = {
+            'beauty_title': 'пер. ',
+            'title': f'Перевал {rng.randrange(10 ** 9)}',
+            'other_titles': '',
+            'connect': '',
+            'user': {
+                'email': f'bench{index % 50}@example.com',
+                'fam': 'Тестов',
+                'name': 'Тест',
+                'otc': '',
+                'phone': '+7 000 000 00 00',
+            },
+            'coords': {
+                'latitude': f'{rng.uniform(-80, 80):.6f}',
+                'longitude': f'{rng.uniform(-179, 179):.6f}',
+                'height': rng.randrange(100, 7000),
+            },
+            'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+            'images': [
+                {
+                    'data': base64.b64encode(base_image + rng.randbytes(16)).decode(),
+                    'title': f'Фото {number}',
+                }
+                for number in range(images)
+            ],
+        }
+        payloads.append(json.dumps(payload, ensure_ascii=False).encode())
+    return payloads
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def fetch_metrics(base_url):
+    """Гистограммы submitData с /metrics: {(имя, метки): значение}"""
+    try:
+        with urllib.request.urlopen(f'{base_url}/metrics', timeout=30) as response:
+            text = response.read().decode()
+    except (urllib.error.URLError, OSError):
+        return {}
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_RE.match(line)
+        if not match:
+            continue
+        labels = dict(LABEL_RE.findall(match['labels'] or ''))
+        if labels.get('view') not in (None, 'submit_data') or 'le' in labels:
+            continue
+        key = (match['name'], labels.get('stage', ''))
+        values[key] = values.get(key, 0.0) + float(match['value'])
+    return values
+
+
+def metrics_delta(before, after):
+    """Запросы к БД на запрос и среднее время этапов за сценарий"""
+    def delta(name, stage=''):
+        return after.get((name, stage), 0.0) - before.get((name, stage), 0.0)
+
+    requests_count = delta('fstr_request_queries_count')
+    result = {
+        'queries_per_request': (
+            round(delta('fstr_request_queries_sum') / requests_count, 2)
+            if requests_count else None
+        ),
+        'stages_ms': {},
+    }
+    for stage in ('validation', 'transaction', 'image_decode', 'file_write'):
+        count = delta('fstr_stage_duration_seconds_count', stage)
+        if count:
+            total = delta('fstr_stage_duration_seconds_sum', stage)
+            result['stages_ms'][stage] = round(total / count * 1000, 3)
+    return result
+
+
+def reset_peak_rss(pid):
+    # Запись 5 в clear_refs сбрасывает пиковый RSS процесса (Linux)
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def read_peak_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def run_scenario(url, payloads, concurrency, timeout):
+    """Отправляет payloads в concurrency потоков"""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    queue = iter(payloads)
+
+    def worker():
+        while True:
+            with lock:
+                body = next(queue, None)
+            if body is None:
+                return
+            request = urllib.request.Request(
+                url, data=body, method='POST',
+                headers={'Content-Type': 'application/json'}
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    code = response.status
+            except urllib.error.HTTPError as e:
+                e.read()
+                code = e.code
+            except (urllib.error.URLError, OSError):
+                code = 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[str(code)] = statuses.get(str(code), 0) + 1
+                if code == 200:
+                    latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    duration = time.perf_counter() - start
+    return latencies, statuses, duration
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir):
+    """Запускает сервер разработки на временной базе и медиа-каталоге"""
+    env = dict(os.environ)
+    env.update({
+        'DEBUG': 'False',
+        'FSTR_MEDIA_ROOT': os.path.join(workdir, 'media'),
+        'FSTR_METRICS_DIR': '',
+        'PYTHONUNBUFFERED': '1',
+        'DJANGO_SETTINGS_MODULE': 'benchmarks.settings',
+    })
+    if args.db == 'sqlite':
+        env['FSTR_DB_ENGINE'] = 'sqlite'
+        env['FSTR_DB_NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    else:
+        env['FSTR_DB_ENGINE'] = 'postgresql'
+
+    manage = [sys.executable, os.path.join(ROOT_DIR, 'manage.py')]
+    subprocess.run(
+        manage + ['migrate', '--run-syncdb', '--verbosity', '0'],
+        env=env, cwd=ROOT_DIR, check=True
+    )
+    port = free_port()
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        manage + ['runserver', f'127.0.0.1:{port}', '--noreload'],
+        env=env, cwd=ROOT_DIR, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился, см. {log.name}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Сервер не запустился за 60 секунд")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    Сравнивает сценарии с базовым прогоном.
+
+    Returns:
+        list: Описания регрессий
+    """
+    base_scenarios = {scenario['name']: scenario for scenario in baseline['scenarios']}
+    regressions = []
+    for scenario in results['scenarios']:
+        base = base_scenarios.get(scenario['name'])
+        if base is None:
+            continue
+        for field, lower_is_better in COMPARED:
+            current, previous = scenario.get(field), base.get(field)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(
+                    f"{scenario['name']}: {field} {previous} -> {current} ({change:+.1%})"
+                )
+        if scenario['error_rate'] > base['error_rate']:
+            regressions.append(
+                f"{scenario['name']}: error_rate {base['error_rate']} -> {scenario['error_rate']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help="Адрес запущенного сервера; по умолчанию запускается свой")
+    parser.add_argument('--server-pid', type=int, help="PID запущенного сервера для замера RSS")
+    parser.add_argument('--db', choices=['sqlite', 'postgresql'], default='sqlite',
+                        help="База для собственного сервера (postgresql - из FSTR_DB_*)")
+    parser.add_argument('--concurrency', default='1,4,16', help="Число параллельных клиентов, через запятую")
+    parser.add_argument('--images', default='0,2', help="Число изображений в запросе, через запятую")
+    parser.add_argument('--image-size', default='100k', help="Размер изображения (100k, 1m), через запятую")
+    parser.add_argument('--requests', type=int, default=200, help="Запросов в сценарии")
+    parser.add_argument('--warmup', type=int, default=10, help="Прогревочных запросов перед сценариями")
+    parser.add_argument('--timeout', type=float, default=60, help="Таймаут запроса в секундах")
+    parser.add_argument('--seed', type=int, default=1, help="Зерно генерации данных")
+    parser.add_argument('--output', help="Файл для результатов в JSON")
+    parser.add_argument('--baseline', help="JSON базового прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Допустимое ухудшение показателей относительно базового прогона")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = None
+    server = None
+    server_pid = args.server_pid
+    base_url = args.url.rstrip('/') if args.url else None
+    try:
+        if base_url is None:
+            workdir = tempfile.mkdtemp(prefix='fstr-bench-')
+            server, base_url = start_server(args, workdir)
+            server_pid = server.pid
+        submit_url = f'{base_url}/submitData/'
+
+        if args.warmup:
+            run_scenario(submit_url, make_payloads(args.warmup, 1, 10 * 1024, rng), 1, args.timeout)
+
+        scenarios = []
+        image_counts = parse_list(args.images)
+        image_sizes = parse_list(args.image_size, parse_size)
+        for concurrency, images, image_size in itertools.product(
+            parse_list(args.concurrency), image_counts, image_sizes
+        ):
+            if images == 0 and image_size != image_sizes[0]:
+                continue  # Без изображений размер не важен
+            name = f'c{concurrency}-i{images}' + (f'-s{image_size}' if images else '')
+            payloads = make_payloads(args.requests, images, image_size, rng)
+
+            metrics_before = fetch_metrics(base_url)
+            if server_pid:
+                reset_peak_rss(server_pid)
+            latencies, statuses, duration = run_scenario(
+                submit_url, payloads, concurrency, args.timeout
+            )
+            metrics_after = fetch_metrics(base_url)
+
+            succeeded = statuses.get('200', 0)
+            scenario = {
+                'name': name,
+                'concurrency': concurrency,
+                'images': images,
+                'image_bytes': image_size if images else 0,
+                'requests': len(payloads),
+                'statuses': statuses,
+                'error_rate': round(1 - succeeded / len(payloads), 4),
+                'duration_s': round(duration, 3),
+                'throughput_rps': round(succeeded / duration, 2) if duration else None,
+                'payload_bytes_mean': sum(map(len, payloads)) // len(payloads),
+                'peak_rss_mb': read_peak_rss_mb(server_pid) if server_pid else None,
+            }
+            for label, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+                value = percentile(latencies, fraction)
+                scenario[f'latency_{label}_ms'] = round(value * 1000, 2) if value is not None else None
+            scenario.update(metrics_delta(metrics_before, metrics_after))
+            scenarios.append(scenario)
+
+            print(
+                f"{name:>22}: {scenario['throughput_rps']} req/s, "
+                f"p50 {scenario['latency_p50_ms']} ms, p95 {scenario['latency_p95_ms']} ms, "
+                f"p99 {scenario['latency_p99_ms']} ms, RSS {scenario['peak_rss_mb']} MB, "
+                f"SQL {scenario['queries_per_request']}/запрос, ошибок {scenario['error_rate']:.1%}"
+            )
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'db': args.db if not args.url else None,
+            'url': args.url,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+        },
+        'scenarios': scenarios,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Регрессии относительно {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"Регрессий относительно {args.baseline} нет")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
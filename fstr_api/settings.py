@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'passes.middleware.metrics_middleware',
+    'passes.middleware.database_routing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,6 +93,61 @@ DATABASES = {
     }
 }
 
+# FSTR_DB_ENGINE=sqlite - локальная база в файле FSTR_DB_NAME
+# (для разработки и нагрузочных тестов без PostgreSQL)
+if os.getenv('FSTR_DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            # Транзакции BEGIN IMMEDIATE: SQLite допускает одного писателя,
+            # параллельные запросы ждут блокировку до OPTIONS['timeout']
+            'ENGINE': 'passes.backends.sqlite3',
+            'NAME': os.getenv('FSTR_DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+
+# Постоянные соединения: соединение переиспользуется до FSTR_DB_CONN_MAX_AGE
+# секунд и проверяется перед повторным использованием
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.getenv('FSTR_DB_CONN_MAX_AGE', '60'))
+    database['CONN_HEALTH_CHECKS'] = True
+
+# Реплика для чтения: те же параметры, что у основной БД, кроме заданных
+# переменными FSTR_DB_REPLICA_*. Для SQLite достаточно FSTR_DB_REPLICA_NAME
+# (например, тот же файл - две независимые БД-связи для локальной проверки)
+FSTR_DB_REPLICA_ALIAS = 'replica'
+if os.getenv('FSTR_DB_REPLICA_HOST') or os.getenv('FSTR_DB_REPLICA_NAME'):
+    DATABASES[FSTR_DB_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('FSTR_DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.getenv('FSTR_DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        'PORT': os.getenv('FSTR_DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        'USER': os.getenv('FSTR_DB_REPLICA_LOGIN', DATABASES['default'].get('USER', '')),
+        'PASSWORD': os.getenv('FSTR_DB_REPLICA_PASS', DATABASES['default'].get('PASSWORD', '')),
+        # В тестах реплика - это тестовая основная БД
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DATABASES['default']['ENGINE'] == 'passes.backends.sqlite3':
+        # Тестовая БД SQLite в памяти недоступна второму соединению
+        DATABASES['default']['TEST'] = {'NAME': DATABASES['default']['NAME'] + '.test'}
+
+DATABASE_ROUTERS = ['passes.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи клиент читает с основной БД
+FSTR_DB_PIN_SECONDS = int(os.getenv('FSTR_DB_PIN_SECONDS', '5'))
+
+# Кеш: FSTR_REDIS_URL (например, redis://redis:6379/0) - общий кеш всех
+# воркеров. Без него у каждого процесса свой LocMemCache, и сброс записи
+# при изменении данных виден только в процессе, который их изменил
+FSTR_REDIS_URL = os.getenv('FSTR_REDIS_URL', '')
+if FSTR_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': FSTR_REDIS_URL,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -131,7 +188,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # Media files
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.getenv('FSTR_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+# Файловое хранилище с замером времени записи файлов для /metrics
+STORAGES = {
+    'default': {
+        'BACKEND': 'passes.storage.InstrumentedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -147,3 +214,147 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
 }
+
+# Пакетная загрузка перевалов (POST /submitData/batch/)
+FSTR_BATCH_MAX_RECORDS = int(os.getenv('FSTR_BATCH_MAX_RECORDS', '100'))
+
+# Импорт каталогов (import_passes): наибольший объем строк в байтах
+# в пакетах, декодируемых заранее, пока записывается текущий
+FSTR_IMPORT_PREFETCH_BYTES = int(os.getenv('FSTR_IMPORT_PREFETCH_BYTES', str(256 * 1024 * 1024)))
+
+# Ограничения на изображения, передаваемые в base64
+FSTR_IMAGE_MAX_BYTES = int(os.getenv('FSTR_IMAGE_MAX_BYTES', str(15 * 1024 * 1024)))
+FSTR_REQUEST_IMAGES_MAX_BYTES = int(os.getenv('FSTR_REQUEST_IMAGES_MAX_BYTES', str(50 * 1024 * 1024)))
+# Размер блока декодирования; определяет пиковый объем памяти на изображение
+FSTR_IMAGE_DECODE_CHUNK_SIZE = int(os.getenv('FSTR_IMAGE_DECODE_CHUNK_SIZE', str(64 * 1024)))
+
+# Загрузка изображений по частям (POST /uploads/); по умолчанию MEDIA_ROOT/uploads
+FSTR_UPLOAD_DIR = os.getenv('FSTR_UPLOAD_DIR', '')
+FSTR_UPLOAD_TTL = int(os.getenv('FSTR_UPLOAD_TTL', str(24 * 60 * 60)))
+
+# Фоновая обработка изображений (manage.py process_images)
+FSTR_IMAGE_WORKERS = int(os.getenv('FSTR_IMAGE_WORKERS', str(os.cpu_count() or 1)))
+FSTR_IMAGE_THUMBNAIL_SIZE = int(os.getenv('FSTR_IMAGE_THUMBNAIL_SIZE', '320'))
+FSTR_IMAGE_MEDIUM_SIZE = int(os.getenv('FSTR_IMAGE_MEDIUM_SIZE', '1280'))
+FSTR_IMAGE_WEBP_QUALITY = int(os.getenv('FSTR_IMAGE_WEBP_QUALITY', '80'))
+FSTR_IMAGE_JOB_TIMEOUT = int(os.getenv('FSTR_IMAGE_JOB_TIMEOUT', '600'))
+FSTR_IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('FSTR_IMAGE_JOB_MAX_ATTEMPTS', '3'))
+
+# Хранение изображений: 'files' - отдельный файл на каждое изображение,
+# 'cas' - контентная адресация, одинаковые файлы хранятся один раз
+FSTR_IMAGE_STORAGE_MODE = os.getenv('FSTR_IMAGE_STORAGE_MODE', 'files')
+
+# Постраничная навигация списков перевалов
+FSTR_PAGE_SIZE = int(os.getenv('FSTR_PAGE_SIZE', '20'))
+FSTR_PAGE_MAX_SIZE = int(os.getenv('FSTR_PAGE_MAX_SIZE', '100'))
+
+# Выгрузка перевалов (GET /export/, manage.py export_passes): размер порции
+# чтения курсором на стороне сервера
+FSTR_EXPORT_CHUNK_SIZE = int(os.getenv('FSTR_EXPORT_CHUNK_SIZE', '2000'))
+
+# Отдача медиафайлов (GET /media/...): FSTR_MEDIA_ACCEL = 'x-accel-redirect'
+# (nginx, internal location FSTR_MEDIA_ACCEL_PREFIX с alias на MEDIA_ROOT)
+# или 'x-sendfile' (Apache mod_xsendfile, lighttpd) передает файл прокси;
+# 'off' - файл отдает приложение (по умолчанию только при DEBUG: без
+# прокси каждая загрузка изображения занимает воркер). Имена файлов
+# не повторяются, поэтому ответы кешируются на FSTR_MEDIA_MAX_AGE секунд
+FSTR_MEDIA_ACCEL = os.getenv('FSTR_MEDIA_ACCEL', 'off' if DEBUG else 'x-accel-redirect')
+if FSTR_MEDIA_ACCEL not in ('x-accel-redirect', 'x-sendfile', 'off'):
+    raise ValueError(f"Некорректное значение FSTR_MEDIA_ACCEL: {FSTR_MEDIA_ACCEL}")
+FSTR_MEDIA_ACCEL_PREFIX = os.getenv('FSTR_MEDIA_ACCEL_PREFIX', '/protected-media/')
+FSTR_MEDIA_MAX_AGE = int(os.getenv('FSTR_MEDIA_MAX_AGE', str(365 * 24 * 3600)))
+
+# Статистика перевалов (GET /stats/): ширина диапазона высот, м;
+# после изменения выполните manage.py rebuild_stats
+FSTR_STATS_HEIGHT_BAND = int(os.getenv('FSTR_STATS_HEIGHT_BAND', '500'))
+
+# Поиск перевалов по координатам
+FSTR_GEO_MAX_RESULTS = int(os.getenv('FSTR_GEO_MAX_RESULTS', '500'))
+FSTR_NEAREST_START_RADIUS_KM = float(os.getenv('FSTR_NEAREST_START_RADIUS_KM', '2'))
+# Радиус поиска ближайших растет в 4 раза за шаг: при 2 км и 6 шагах - до 2048 км
+FSTR_NEAREST_MAX_STEPS = int(os.getenv('FSTR_NEAREST_MAX_STEPS', '6'))
+
+# Поиск возможных дубликатов при добавлении перевала
+FSTR_DUPLICATE_RADIUS_KM = float(os.getenv('FSTR_DUPLICATE_RADIUS_KM', '1'))
+FSTR_DUPLICATE_MIN_SIMILARITY = float(os.getenv('FSTR_DUPLICATE_MIN_SIMILARITY', '0.4'))
+# Ближайших кандидатов на каждую запись
+FSTR_DUPLICATE_MAX_CANDIDATES = int(os.getenv('FSTR_DUPLICATE_MAX_CANDIDATES', '1000'))
+
+# Асинхронный прием перевалов для ASGI-развертывания
+FSTR_ASYNC_SUBMIT = os.getenv('FSTR_ASYNC_SUBMIT', 'False').lower() == 'true'
+FSTR_ASYNC_IO_WORKERS = int(os.getenv('FSTR_ASYNC_IO_WORKERS', '16'))
+
+# Идемпотентность повторных запросов submitData
+FSTR_IDEMPOTENCY_TTL = int(os.getenv('FSTR_IDEMPOTENCY_TTL', str(24 * 60 * 60)))
+# Ключ из хеша тела без заголовка Idempotency-Key: намеренная повторная
+# отправка тех же данных тоже вернет прежний перевал, поэтому выключено
+FSTR_IDEMPOTENCY_DERIVE_KEY = os.getenv('FSTR_IDEMPOTENCY_DERIVE_KEY', 'False').lower() == 'true'
+
+# Кеш пользователей по email при приеме перевалов, секунды; 0 - без кеша.
+# Требует общего кеша (FSTR_REDIS_URL), поэтому без него по умолчанию выключен
+FSTR_USER_CACHE_TTL = int(os.getenv(
+    'FSTR_USER_CACHE_TTL', str(60 * 60) if FSTR_REDIS_URL else '0'
+))
+
+# Очередь модерации: время аренды записей модератором в секундах
+FSTR_MODERATION_LEASE = int(os.getenv('FSTR_MODERATION_LEASE', str(30 * 60)))
+
+# Админка: начиная с какого числа строк по статистике PostgreSQL
+# показывать оценку вместо точного COUNT(*)
+FSTR_ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('FSTR_ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000'))
+
+# Метрики /metrics: каталог снимков процессов (общий для всех воркеров,
+# очищается при развертывании) и интервал записи снимка в секундах.
+# Без каталога /metrics отдает метрики только обслужившего запрос процесса
+FSTR_METRICS_DIR = os.getenv('FSTR_METRICS_DIR', '')
+FSTR_METRICS_FLUSH_INTERVAL = float(os.getenv('FSTR_METRICS_FLUSH_INTERVAL', '1'))
+
+# Журналирование: формат text или json, уровень, файл (по умолчанию stderr)
+# и доля записей для частых событий, например "submit_data.received=0.1".
+# Записи пишутся фоновым потоком через очередь размером FSTR_LOG_QUEUE_SIZE
+FSTR_LOG_FORMAT = os.getenv('FSTR_LOG_FORMAT', 'text')
+FSTR_LOG_SAMPLE_RATES = {
+    event.strip(): float(rate)
+    for event, rate in (
+        item.split('=', 1)
+        for item in os.getenv('FSTR_LOG_SAMPLE_RATES', '').split(',')
+        if '=' in item
+    )
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            '()': 'passes.logs.KeyValueFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+        'json': {
+            '()': 'passes.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'passes.logs.SamplingFilter',
+            'rates': FSTR_LOG_SAMPLE_RATES,
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'passes.logs.QueueLogHandler',
+            'filename': os.getenv('FSTR_LOG_FILE') or None,
+            'max_queue': int(os.getenv('FSTR_LOG_QUEUE_SIZE', '10000')),
+            'formatter': FSTR_LOG_FORMAT,
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        # Сводки submitData пишутся с уровнем INFO и включаются через FSTR_LOG_LEVEL
+        'passes': {
+            'handlers': ['queue'],
+            'level': os.getenv('FSTR_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -15,15 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from passes.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('passes.urls')),  # Подключаем маршруты приложения passes
+    # Медиафайлы с ETag, Range и кешированием; при FSTR_MEDIA_ACCEL
+    # файл передает nginx или Apache
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.+)$', serve_media, name='media'),
 ]
-
-# Обслуживание медиа файлов в режиме разработки
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,51 +1,142 @@
 from django.contrib import admin
-from .models import User, Coords, Level, Pass, Image
+from .models import User, Coords, Pass, Image, ImageBlob, ImageJob
+from .paginators import EstimatedCountPaginator
+from . import stats
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Базовый класс для админки больших таблиц: оценка числа строк вместо
+    COUNT(*) и без подсчета общего числа записей при фильтрации.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Стабильный порядок по первичному ключу для постраничного вывода
+    ordering = ['-id']
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScalableModelAdmin):
     list_display = ['email', 'fam', 'name', 'phone']
-    list_filter = ['fam']
     search_fields = ['email', 'fam', 'name']
 
 
 @admin.register(Coords)
-class CoordsAdmin(admin.ModelAdmin):
+class CoordsAdmin(ScalableModelAdmin):
     list_display = ['latitude', 'longitude', 'height']
 
 
-@admin.register(Level)  
-class LevelAdmin(admin.ModelAdmin):
-    list_display = ['winter', 'summer', 'autumn', 'spring']
-
-
 class ImageInline(admin.TabularInline):
     model = Image
     extra = 1
+    raw_id_fields = ['blob']
+    readonly_fields = ['width', 'height', 'thumbnail', 'medium']
 
 
 @admin.register(Pass)
-class PassAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'status', 'add_time']
-    list_filter = ['status', 'add_time']
-    search_fields = ['title', 'beauty_title', 'user__email']
-    readonly_fields = ['add_time']
+class PassAdmin(ScalableModelAdmin):
+    list_display = ['title', 'user', 'status', 'claimed_by', 'add_time', 'duplicate_of']
+    list_filter = ['status', 'level_summer', 'add_time', ('duplicate_of', admin.EmptyFieldListFilter)]
+    list_select_related = ['user', 'duplicate_of']
+    ordering = ['-add_time', '-id']
+    # Поиск выполняется по полнотекстовому индексу, а по email пользователя -
+    # по точному совпадению, см. get_search_results
+    search_fields = ['title', 'beauty_title', 'other_titles', 'connect']
+    readonly_fields = ['add_time', 'duplicate_of', 'duplicate_score']
+    autocomplete_fields = ['user']
+    raw_id_fields = ['coords']
     inlines = [ImageInline]
+    actions = ['mark_new', 'mark_pending', 'mark_accepted', 'mark_rejected']
     
     fieldsets = (
         ('Основная информация', {
             'fields': ('beauty_title', 'title', 'other_titles', 'connect')
         }),
         ('Связанные данные', {
-            'fields': ('user', 'coords', 'level')
+            'fields': ('user', 'coords')
+        }),
+        ('Категория трудности', {
+            'fields': ('level_winter', 'level_summer', 'level_autumn', 'level_spring')
         }),
         ('Модерация', {
-            'fields': ('status', 'add_time')
+            'fields': (
+                'status', 'add_time', 'claimed_by', 'claim_expires_at',
+                'duplicate_of', 'duplicate_score'
+            )
         }),
     )
 
 
+    def get_search_results(self, request, queryset, search_term):
+        # Email ищем точным совпадением по уникальному индексу пользователей,
+        # а не через JOIN с LIKE по всей таблице
+        if '@' in search_term:
+            user_ids = User.objects.filter(email__iexact=search_term.strip()).values('id')
+            return queryset.filter(user_id__in=user_ids), False
+        # Названия и описание ищем по тому же индексу, что и GET /submitData/search/,
+        # а не через LIKE '%...%' по четырем столбцам
+        if search_term.strip():
+            return queryset.search(search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def save_model(self, request, obj, form, change):
+        # Статус, категории, высота могли измениться: переносим перевал
+        # из прежних счетчиков статистики в новые
+        old_keys = []
+        if change:
+            old_keys = stats.pass_keys(Pass.objects.select_related('coords').get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        stats.record_change(old_keys, stats.pass_keys(obj))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Номер изменения берем последним: строка счетчика блокируется
+        # до конца транзакции
+        Pass.objects.filter(pk=form.instance.pk).mark_changed()
+
+    def _set_status(self, request, queryset, new_status):
+        # Один UPDATE на все выбранные записи с новым номером изменения
+        updated = queryset.set_status(new_status)
+        self.message_user(request, f"Обновлено записей: {updated}")
+
+    @admin.action(description='Сменить статус на "Новая запись"')
+    def mark_new(self, request, queryset):
+        self._set_status(request, queryset, 'new')
+
+    @admin.action(description='Взять в работу')
+    def mark_pending(self, request, queryset):
+        self._set_status(request, queryset, 'pending')
+
+    @admin.action(description='Модерация прошла успешно')
+    def mark_accepted(self, request, queryset):
+        self._set_status(request, queryset, 'accepted')
+
+    @admin.action(description='Модерация не прошла')
+    def mark_rejected(self, request, queryset):
+        self._set_status(request, queryset, 'rejected')
+
+
 @admin.register(Image)
-class ImageAdmin(admin.ModelAdmin):
-    list_display = ['title', 'pass_instance']
-    list_filter = ['pass_instance']
+class ImageAdmin(ScalableModelAdmin):
+    list_display = ['title', 'pass_instance', 'width', 'height']
+    list_select_related = ['pass_instance']
+    search_fields = ['title']
+    autocomplete_fields = ['pass_instance']
+    raw_id_fields = ['blob']
+    readonly_fields = ['width', 'height', 'thumbnail', 'medium']
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(ScalableModelAdmin):
+    list_display = ['image', 'status', 'attempts', 'updated_at']
+    list_filter = ['status']
+    list_select_related = ['image__pass_instance']
+    raw_id_fields = ['image']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(ScalableModelAdmin):
+    list_display = ['sha256', 'size', 'ref_count', 'created_at']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'file', 'size', 'ref_count', 'created_at']
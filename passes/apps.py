@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PassesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'passes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import install_search
+
+        # Поисковый столбец и индексы зависят от БД, поэтому создаются
+        # после migrate, а не в миграциях
+        post_migrate.connect(install_search, sender=self)
@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.http import JsonResponse
+
+from . import idempotency, metrics
+from .logs import summarize_submission
+from .bulk import bulk_create_passes
+from .duplicates import afind_duplicate_kwargs
+from .images import ImageBudget, ImageTooLarge, UnsupportedImageType
+from .uploads import UploadError, load_images
+from .serializers import PassSerializer
+from .views import get_missing_fields, submit_data
+
+logger = logging.getLogger(__name__)
+
+# Ограниченный пул потоков для блокирующей работы: разбор JSON, валидация,
+# декодирование изображений и запись в БД и хранилище. Медленная загрузка
+# тела запроса поток не занимает - ее читает ASGI-обработчик в цикле событий.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.FSTR_ASYNC_IO_WORKERS,
+    thread_name_prefix='fstr-io'
+)
+
+
+def _run_with_connection(func, *args):
+    # Потоки пула живут дольше запроса: соединения с БД закрываются так же,
+    # как Django делает это в начале и в конце запроса
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args):
+    """Выполняет блокирующую функцию в пуле потоков FSTR_ASYNC_IO_WORKERS"""
+    loop = asyncio.get_running_loop()
+    # Копия контекста нужна для подсчета SQL-запросов в метриках запроса
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _executor, functools.partial(context.run, _run_with_connection, func, *args)
+    )
+
+
+def _response(status, message, pass_id=None, **extra):
+    response_data = {'status': status, 'message': message, 'id': pass_id, **extra}
+    return JsonResponse(
+        response_data, status=status, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def _parse(request):
+    """
+    Разбирает тело запроса submitData.
+
+    ASGI-обработчик к этому моменту уже прочитал тело во временный файл,
+    но для больших тел обращение к нему - дисковое чтение, поэтому оно
+    выполняется в пуле.
+
+    Returns:
+        tuple: (body: bytes, data: dict|None, error: str|None)
+    """
+    body = request.body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body, None, "Некорректный JSON"
+    if not isinstance(data, dict):
+        return body, None, "Некорректные данные"
+    return body, data, None
+
+
+def _validate(data):
+    """
+    Валидирует данные запроса submitData.
+
+    Returns:
+        tuple: (validated_data: dict|None, error: str|None)
+    """
+    logger.info(
+        "Получен асинхронный запрос submitData",
+        extra={'event': 'submit_data.received', **summarize_submission(data)}
+    )
+
+    missing_fields = get_missing_fields(data)
+    if missing_fields:
+        return None, f"Недостаточно полей. Отсутствуют: {', '.join(missing_fields)}"
+
+    serializer = PassSerializer(data=data)
+    with metrics.timer('validation'):
+        is_valid = serializer.is_valid()
+    if not is_valid:
+        logger.error("Ошибка валидации: %s", serializer.errors)
+        return None, "Недостаточно полей или некорректные данные"
+    return serializer.validated_data, None
+
+
+def _decode_images(images):
+    """Декодирует изображения записи во временные файлы или открывает загрузки"""
+    with metrics.timer('image_decode'):
+        files = load_images(images, budget=ImageBudget())
+    return [(image['title'], file) for image, file in zip(images, files)]
+
+
+def _save(record, idempotency_key, body_hash):
+    """
+    Сохраняет запись; при гонке с параллельным повтором возвращает
+    id уже созданного перевала.
+
+    Returns:
+        tuple: (pass_id: int, duplicate_of_id: int|None)
+    """
+    try:
+        with metrics.timer('transaction'), transaction.atomic():
+            pass_instance = bulk_create_passes([record])[0]
+            if idempotency_key:
+                idempotency.remember(idempotency_key, pass_instance.id, body_hash)
+                transaction.on_commit(lambda: idempotency.cache_result(
+                    idempotency_key, pass_instance.id, body_hash
+                ))
+    except IntegrityError:
+        existing_id = (
+            idempotency.lookup(idempotency_key, body_hash) if idempotency_key else None
+        )
+        if existing_id is None:
+            raise
+        logger.info("Повторный запрос, перевал уже создан ID: %s", existing_id)
+        return existing_id, None
+    return pass_instance.id, pass_instance.duplicate_of_id
+
+
+async def submit_data_async(request):
+    """
+    Асинхронный REST API метод POST submitData для ASGI.
+
+    Формат запроса и ответа совпадает с submit_data. Поток из пула
+    занимается только на время блокирующих шагов, поэтому один процесс
+    обслуживает много одновременных медленных загрузок. GET-запросы
+    передаются синхронному submit_data.
+
+    Endpoint: POST /submitData (при FSTR_ASYNC_SUBMIT=True)
+
+    Returns:
+        JSON response with status, message and id fields
+    """
+    if request.method != 'POST':
+        return await sync_to_async(submit_data)(request)
+
+    try:
+        body, data, error = await run_blocking(_parse, request)
+        if error:
+            return _response(400, error)
+
+        # Хеш тела считается в пуле: для больших тел это заметная работа
+        idempotency_key, body_hash = await run_blocking(
+            idempotency.get_request_key, request, body, data
+        )
+        if idempotency_key:
+            existing_id = await idempotency.alookup(idempotency_key, body_hash)
+            if existing_id is not None:
+                logger.info(
+                    "Повторный запрос submitData, перевал ID: %s", existing_id,
+                    extra={'event': 'submit_data.replayed', 'pass_id': existing_id}
+                )
+                response = _response(200, None, existing_id)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+        record, error = await run_blocking(_validate, data)
+        if error:
+            return _response(400, error)
+
+        try:
+            record['images'] = await run_blocking(_decode_images, record['images'])
+        except (ImageTooLarge, UnsupportedImageType, UploadError) as e:
+            return _response(400, f"Недостаточно полей или некорректные данные: {e}")
+        except (ValueError, TypeError) as e:
+            logger.error("Ошибка декодирования изображений: %s", e)
+            return _response(400, "Недостаточно полей или некорректные данные")
+
+        # Поиск похожих перевалов только читает данные - через асинхронный ORM
+        record.update((await afind_duplicate_kwargs([record]))[0])
+
+        pass_id, duplicate_of_id = await run_blocking(
+            _save, record, idempotency_key, body_hash
+        )
+        logger.info(
+            "Создан новый перевал ID: %s", pass_id,
+            extra={
+                'event': 'submit_data.created',
+                'pass_id': pass_id,
+                'duplicate_of': duplicate_of_id,
+            }
+        )
+
+        extra = {}
+        if duplicate_of_id:
+            extra['duplicate_of'] = duplicate_of_id
+        return _response(200, None, pass_id, **extra)
+
+    except idempotency.KeyReused as e:
+        logger.warning("Отклонен повтор submitData: %s", e)
+        return _response(422, str(e))
+
+    except Exception as e:
+        error_message = f"Ошибка сервера/БД: {str(e)}"
+        logger.error(error_message)
+        return _response(500, error_message)
+
+
+# Django 4.2 не умеет оборачивать корутины в csrf_exempt, поэтому отмечаем вручную
+submit_data_async.csrf_exempt = True
@@ -0,0 +1,16 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite с транзакциями BEGIN IMMEDIATE.
+
+    Обычная (DEFERRED) транзакция берет блокировку записи только при
+    первой записи; если к этому моменту другая транзакция уже пишет,
+    SQLite сразу возвращает "database is locked", не дожидаясь таймаута.
+    IMMEDIATE берет блокировку в начале транзакции, поэтому параллельные
+    запросы ждут своей очереди в пределах OPTIONS['timeout'].
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
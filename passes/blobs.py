@@ -0,0 +1,179 @@
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+
+from .models import Image, ImageBlob, blob_upload_to
+
+
+def is_enabled():
+    """Включен ли режим контентной адресации изображений"""
+    return settings.FSTR_IMAGE_STORAGE_MODE == 'cas'
+
+
+def get_sha256(content):
+    """Хеш содержимого файла; берется из декодера или считается по блокам"""
+    sha256 = getattr(content, 'sha256', None)
+    if sha256 is None:
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        sha256 = digest.hexdigest()
+    return sha256
+
+
+def attach_blobs(images):
+    """
+    Привязывает несохраненные изображения к общим файлам по хешу содержимого.
+
+    Новое содержимое записывается в хранилище один раз, для уже известного
+    увеличивается счетчик ссылок. После вызова поле data изображений
+    указывает на файл блоба и повторно не записывается. Вызывать внутри
+    transaction.atomic(). В режиме FSTR_IMAGE_STORAGE_MODE = 'files'
+    ничего не делает.
+
+    Args:
+        images (list): Несохраненные объекты Image с файлами в поле data
+    """
+    if not is_enabled() or not images:
+        return
+
+    contents = {}
+    refs = Counter()
+    image_hashes = []
+    for image in images:
+        content = image.data.file
+        sha256 = get_sha256(content)
+        contents.setdefault(sha256, content)
+        refs[sha256] += 1
+        image_hashes.append(sha256)
+
+    # Блокируем найденные блобы, чтобы параллельное удаление последней
+    # ссылки не удалило файл, на который мы сейчас сошлемся
+    blobs = {
+        blob.sha256: blob
+        for blob in ImageBlob.objects.select_for_update().filter(sha256__in=list(refs))
+    }
+
+    storage = ImageBlob._meta.get_field('file').storage
+    new_blobs = []
+    for sha256, content in contents.items():
+        if sha256 in blobs:
+            continue
+        blob = ImageBlob(sha256=sha256, size=content.size, ref_count=0)
+        name = blob_upload_to(blob, content.name)
+        # Файл с таким хешем мог остаться от удаленного блоба
+        if not storage.exists(name):
+            name = storage.save(name, content)
+        blob.file = name
+        new_blobs.append(blob)
+
+    if new_blobs:
+        # Параллельная загрузка того же содержимого могла успеть создать
+        # строку, поэтому конфликты игнорируем и перечитываем блобы
+        ImageBlob.objects.bulk_create(new_blobs, ignore_conflicts=True)
+        blobs.update(
+            (blob.sha256, blob)
+            for blob in ImageBlob.objects.select_for_update().filter(
+                sha256__in=[blob.sha256 for blob in new_blobs]
+            )
+        )
+
+    # Одно обновление на каждое встречающееся число новых ссылок
+    increments = {}
+    for sha256, blob in blobs.items():
+        increments.setdefault(refs[sha256], []).append(blob.id)
+    for amount, blob_ids in increments.items():
+        ImageBlob.objects.filter(id__in=blob_ids).update(
+            ref_count=F('ref_count') + amount
+        )
+
+    for image, sha256 in zip(images, image_hashes):
+        blob = blobs[sha256]
+        image.blob = blob
+        image.data = blob.file.name
+
+
+def replace_content(blob_id, content):
+    """
+    Переносит все ссылки на блоб на файл с новым содержимым.
+
+    Общий файл не перезаписывается на месте: его имя - хеш содержимого.
+    Изображения блоба переходят на блоб нового содержимого (существующий
+    или созданный), прежний блоб освобождается и удаляется вместе с
+    файлом после фиксации транзакции.
+
+    Args:
+        blob_id (int): id прежнего блоба
+        content (bytes): Новое содержимое файла
+
+    Returns:
+        ImageBlob|None: Блоб нового содержимого; None, если прежнего блоба
+            уже нет (ссылки перенесены параллельной обработкой)
+    """
+    sha256 = hashlib.sha256(content).hexdigest()
+    with transaction.atomic():
+        old = ImageBlob.objects.select_for_update().filter(id=blob_id).first()
+        if old is None or old.sha256 == sha256:
+            return old
+
+        blob = ImageBlob(sha256=sha256, size=len(content), ref_count=0)
+        name = blob_upload_to(blob, old.file.name)
+        storage = ImageBlob._meta.get_field('file').storage
+        if not storage.exists(name):
+            name = storage.save(name, ContentFile(content))
+        blob.file = name
+        ImageBlob.objects.bulk_create([blob], ignore_conflicts=True)
+        blob = ImageBlob.objects.select_for_update().get(sha256=sha256)
+
+        moved = Image.objects.filter(blob_id=blob_id).update(
+            blob=blob, data=blob.file.name
+        )
+        ImageBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + moved)
+        release_blobs([blob_id] * moved)
+    return blob
+
+
+def release_blobs(blob_ids):
+    """
+    Уменьшает счетчики ссылок блобов удаленных изображений.
+
+    Блобы без ссылок удаляются вместе с файлами после фиксации транзакции.
+
+    Args:
+        blob_ids (list): id блобов, по одному на каждое удаленное изображение
+    """
+    refs = Counter(blob_id for blob_id in blob_ids if blob_id is not None)
+    if not refs:
+        return
+
+    with transaction.atomic():
+        blobs = list(
+            ImageBlob.objects.select_for_update().filter(id__in=list(refs))
+        )
+        orphaned = []
+        for blob in blobs:
+            blob.ref_count = max(blob.ref_count - refs[blob.id], 0)
+            if blob.ref_count == 0:
+                orphaned.append(blob)
+        ImageBlob.objects.bulk_update(
+            [blob for blob in blobs if blob.ref_count], ['ref_count']
+        )
+        if orphaned:
+            ImageBlob.objects.filter(id__in=[blob.id for blob in orphaned]).delete()
+            names = [blob.file.name for blob in orphaned]
+            transaction.on_commit(lambda: _delete_files(names))
+
+
+def _delete_files(names):
+    storage = ImageBlob._meta.get_field('file').storage
+    # Пока удаление ждало фиксации, то же содержимое могли загрузить снова
+    reused = set(
+        ImageBlob.objects.filter(file__in=names).values_list('file', flat=True)
+    )
+    for name in names:
+        if name not in reused:
+            storage.delete(name)
@@ -0,0 +1,70 @@
+from .models import Coords, Pass, Image
+from .processing import enqueue_images
+from .stats import record_created
+from .blobs import attach_blobs
+from .uploads import consume_uploads
+from .users import resolve_users
+
+
+def bulk_create_passes(records):
+    """
+    Создает перевалы со связанными сущностями пакетными вставками.
+
+    Вызывать внутри transaction.atomic(). Изображения должны быть
+    уже декодированы в файлы.
+
+    Args:
+        records (list): Провалидированные данные PassSerializer, у которых
+            в 'images' лежат пары (title, file); duplicate_of_index - позиция
+            похожей записи того же пакета; остальные ключи, кроме user
+            и coords, передаются в Pass как есть
+
+    Returns:
+        list: Созданные объекты Pass в порядке records
+    """
+    user_ids = resolve_users([record['user'] for record in records])
+
+    coords = [Coords(**record['coords']) for record in records]
+    for coords_instance in coords:
+        coords_instance.update_geohash()
+    coords = Coords.objects.bulk_create(coords)
+
+    passes = []
+    for record, coords_instance in zip(records, coords):
+        pass_data = {
+            key: value for key, value in record.items()
+            if key not in ('user', 'coords', 'images', 'duplicate_of_index')
+        }
+        passes.append(Pass(
+            user_id=user_ids[record['user']['email']],
+            coords=coords_instance,
+            status='new',  # Согласно ТЗ, по умолчанию статус "new"
+            **pass_data
+        ))
+    passes = Pass.objects.bulk_create(passes)
+
+    # Дубликаты более ранних записей пакета получают их id после вставки
+    batch_duplicates = []
+    for record, pass_instance in zip(records, passes):
+        index = record.get('duplicate_of_index')
+        if index is not None:
+            pass_instance.duplicate_of_id = passes[index].id
+            batch_duplicates.append(pass_instance)
+    if batch_duplicates:
+        Pass.objects.bulk_update(batch_duplicates, ['duplicate_of'])
+
+    images = [
+        Image(title=title, data=data, pass_instance=pass_instance)
+        for record, pass_instance in zip(records, passes)
+        for title, data in record['images']
+    ]
+    attach_blobs(images)
+    images = Image.objects.bulk_create(images)
+    enqueue_images(images)
+    consume_uploads([data for record in records for _, data in record['images']])
+    # Строки счетчиков статистики блокируются до конца транзакции
+    record_created(passes)
+    # Один номер изменения на пакет - последним, после записи файлов
+    # изображений: строка счетчика изменений тоже блокируется до конца транзакции
+    Pass.objects.filter(id__in=[pass_instance.id for pass_instance in passes]).mark_changed()
+    return passes
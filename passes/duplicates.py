@@ -0,0 +1,175 @@
+import re
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import geo
+from .models import Pass
+
+# Слова, которые не отличают один перевал от другого
+STOP_WORDS = {'пер', 'перевал', 'седловина', 'вершина', 'им', 'имени'}
+WORD_RE = re.compile(r'\w+')
+NAME_SEPARATORS_RE = re.compile(r'[,;/]')
+
+
+def normalize_name(name):
+    """
+    Нормализует название: нижний регистр, ё -> е, без пунктуации
+    и служебных слов вроде "пер.".
+    """
+    words = WORD_RE.findall(name.lower().replace('ё', 'е'))
+    return ' '.join(word for word in words if word not in STOP_WORDS)
+
+
+def get_names(title, other_titles):
+    """Нормализованные варианты названия перевала"""
+    names = {normalize_name(title)}
+    names.update(
+        normalize_name(name) for name in NAME_SEPARATORS_RE.split(other_titles or '')
+    )
+    names.discard('')
+    return names
+
+
+def trigrams(name):
+    """Триграммы названия, как в pg_trgm: слова дополняются пробелами"""
+    result = set()
+    for word in name.split():
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(names, other_names):
+    """Наибольшее триграммное сходство (0..1) между вариантами названий"""
+    best = 0.0
+    for name in names:
+        name_trigrams = trigrams(name)
+        for other in other_names:
+            if name == other:
+                return 1.0
+            other_trigrams = trigrams(other)
+            union = name_trigrams | other_trigrams
+            if union:
+                best = max(best, len(name_trigrams & other_trigrams) / len(union))
+    return best
+
+
+def to_search_records(validated_records):
+    """Данные для поиска дубликатов из провалидированных данных PassSerializer"""
+    return [
+        {
+            'title': record['title'],
+            'other_titles': record.get('other_titles', ''),
+            'latitude': record['coords']['latitude'],
+            'longitude': record['coords']['longitude'],
+        }
+        for record in validated_records
+    ]
+
+
+def get_candidates(records):
+    """
+    Перевалы рядом с новыми записями, одним запросом по индексу geohash.
+
+    Для каждой записи берется не больше FSTR_DUPLICATE_MAX_CANDIDATES
+    ближайших перевалов: ограничение применяется к подзапросу записи,
+    упорядоченному по расстоянию, поэтому плотный район одной записи
+    не вытесняет кандидатов других.
+
+    Args:
+        records (list): dict с ключами title, other_titles, latitude, longitude
+
+    Returns:
+        QuerySet: Кортежи (id, title, other_titles, latitude, longitude)
+    """
+    radius_km = settings.FSTR_DUPLICATE_RADIUS_KM
+    condition = Q()
+    for record in records:
+        nearest = (
+            Pass.objects.within_boxes(
+                geo.bounding_box(record['latitude'], record['longitude'], radius_km)
+            )
+            .order_by_distance(record['latitude'], record['longitude'])
+            .values('id')[:settings.FSTR_DUPLICATE_MAX_CANDIDATES]
+        )
+        condition |= Q(id__in=nearest)
+    return (
+        Pass.objects.filter(condition)
+        .order_by()
+        .values_list(
+            'id', 'title', 'other_titles',
+            'coords__latitude', 'coords__longitude'
+        )
+    )
+
+
+def match_duplicates(records, candidates):
+    """
+    Для каждой записи находит кандидата в радиусе FSTR_DUPLICATE_RADIUS_KM
+    с наибольшим сходством названий не ниже FSTR_DUPLICATE_MIN_SIMILARITY.
+
+    Кандидатами служат и более ранние записи того же пакета: у них еще
+    нет id, поэтому для них возвращается позиция записи в пакете. При
+    равном сходстве предпочитается уже сохраненный перевал.
+
+    Returns:
+        list: Для каждой записи dict с полями duplicate_of_id (или
+            duplicate_of_index для записи пакета) и duplicate_score для
+            создания Pass; пустой, если дубликат не найден
+    """
+    radius_km = settings.FSTR_DUPLICATE_RADIUS_KM
+    min_similarity = settings.FSTR_DUPLICATE_MIN_SIMILARITY
+    saved = [
+        ('duplicate_of_id', pass_id, latitude, longitude, get_names(title, other_titles))
+        for pass_id, title, other_titles, latitude, longitude in candidates
+    ]
+    batch = [
+        (
+            'duplicate_of_index', index, record['latitude'], record['longitude'],
+            get_names(record['title'], record.get('other_titles'))
+        )
+        for index, record in enumerate(records)
+    ]
+    results = []
+    for index, record in enumerate(records):
+        names = batch[index][4]
+        best = None
+        for field, value, latitude, longitude, other_names in saved + batch[:index]:
+            distance = geo.distance_km(
+                record['latitude'], record['longitude'], latitude, longitude
+            )
+            if distance > radius_km:
+                continue
+            score = similarity(names, other_names)
+            if score >= min_similarity and (best is None or score > best[2]):
+                best = (field, value, round(score, 3))
+        results.append({best[0]: best[1], 'duplicate_score': best[2]} if best else {})
+    return results
+
+
+def find_duplicate_kwargs(validated_records):
+    """
+    Ищет уже добавленные перевалы и более ранние записи пакета,
+    похожие на новые записи.
+
+    Args:
+        validated_records (list): Провалидированные данные PassSerializer
+
+    Returns:
+        list: Для каждой записи dict с полями для создания Pass;
+            duplicate_of_index заменяет на id bulk_create_passes
+    """
+    if not validated_records:
+        return []
+    records = to_search_records(validated_records)
+    return match_duplicates(records, list(get_candidates(records)))
+
+
+async def afind_duplicate_kwargs(validated_records):
+    """Асинхронный вариант find_duplicate_kwargs"""
+    if not validated_records:
+        return []
+    records = to_search_records(validated_records)
+    candidates = [row async for row in get_candidates(records)]
+    return match_duplicates(records, candidates)
@@ -0,0 +1,188 @@
+"""
+Потоковая выгрузка перевалов в CSV, GeoJSON и JSONL.
+
+Перевалы читаются курсором на стороне сервера (QuerySet.iterator) порциями
+по FSTR_EXPORT_CHUNK_SIZE, ссылки на изображения - одним запросом на
+порцию. Строки формируются и отдаются по одной, поэтому память не
+зависит от размера таблицы. Персональные данные пользователей в выгрузку
+не попадают.
+"""
+
+import csv
+import json
+from collections import defaultdict
+from datetime import datetime, time
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import router
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+
+from .models import Difficulty, Image, Pass, LEVEL_SEASONS
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'geojson': 'application/geo+json',
+    'jsonl': 'application/x-ndjson',
+}
+
+PASS_FIELDS = [
+    'id', 'beauty_title', 'title', 'other_titles', 'connect', 'status',
+    'add_time', 'updated_at', 'coords__latitude', 'coords__longitude',
+    'coords__height', *LEVEL_SEASONS.values(),
+]
+CSV_COLUMNS = [
+    'id', 'beauty_title', 'title', 'other_titles', 'connect', 'status',
+    'add_time', 'updated_at', 'latitude', 'longitude', 'height',
+    *LEVEL_SEASONS, 'images',
+]
+
+
+def parse_moment(value, name):
+    """Дата или дата и время из параметра фильтра"""
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"Некорректное значение {name}: {value}")
+        moment = datetime.combine(date, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_status(value):
+    """Статус из параметра фильтра; all - все статусы"""
+    if value == 'all':
+        return None
+    if value not in dict(Pass.STATUS_CHOICES):
+        raise ValueError(f"Некорректный статус: {value}")
+    return value
+
+
+def get_queryset(status='accepted', since=None, until=None):
+    """
+    Перевалы для выгрузки в порядке id.
+
+    БД выбирается маршрутизатором при создании выборки и закрепляется за
+    ней: строки ответа формируются уже после выхода из промежуточного слоя,
+    но GET-запрос выгрузки все равно читает с реплики.
+
+    Args:
+        status (str|None): Статус модерации; None - все статусы
+        since (datetime|None): Добавленные не раньше
+        until (datetime|None): Добавленные раньше
+    """
+    queryset = Pass.objects.using(router.db_for_read(Pass)).order_by('id')
+    if status:
+        queryset = queryset.filter(status=status)
+    if since:
+        queryset = queryset.filter(add_time__gte=since)
+    if until:
+        queryset = queryset.filter(add_time__lt=until)
+    return queryset
+
+
+def iter_records(queryset, base_url=''):
+    """
+    Записи выгрузки: dict с полями перевала, координатами, категориями
+    трудности и ссылками на изображения.
+
+    Args:
+        queryset (QuerySet): Результат get_queryset
+        base_url (str): Префикс ссылок на изображения (схема и хост)
+    """
+    chunk_size = settings.FSTR_EXPORT_CHUNK_SIZE
+    rows = queryset.values(*PASS_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        images = defaultdict(list)
+        for pass_id, name in (
+            Image.objects.using(queryset.db)
+            .filter(pass_instance_id__in=[row['id'] for row in chunk])
+            .order_by('id')
+            .values_list('pass_instance_id', 'data')
+        ):
+            images[pass_id].append(base_url + default_storage.url(name))
+
+        for row in chunk:
+            record = {
+                'id': row['id'],
+                'beauty_title': row['beauty_title'],
+                'title': row['title'],
+                'other_titles': row['other_titles'],
+                'connect': row['connect'],
+                'status': row['status'],
+                'add_time': row['add_time'].isoformat(),
+                'updated_at': row['updated_at'].isoformat(),
+                'latitude': float(row['coords__latitude']),
+                'longitude': float(row['coords__longitude']),
+                'height': row['coords__height'],
+            }
+            for season, field in LEVEL_SEASONS.items():
+                record[season] = Difficulty(row[field]).label if row[field] else ''
+            record['images'] = images[row['id']]
+            yield record
+
+
+class _Line:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(records):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in records:
+        yield writer.writerow(
+            [' '.join(record['images']) if column == 'images' else record[column]
+             for column in CSV_COLUMNS]
+        )
+
+
+def render_jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def render_geojson(records):
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ''
+    for record in records:
+        coordinates = [record.pop('longitude'), record.pop('latitude'), record.pop('height')]
+        feature = {
+            'type': 'Feature',
+            'id': record['id'],
+            'geometry': {'type': 'Point', 'coordinates': coordinates},
+            'properties': record,
+        }
+        yield separator + json.dumps(feature, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'geojson': render_geojson,
+    'jsonl': render_jsonl,
+}
+
+
+def render(export_format, queryset, base_url=''):
+    """
+    Строки выгрузки в формате export_format.
+
+    Raises:
+        ValueError: Неизвестный формат
+    """
+    if export_format not in RENDERERS:
+        raise ValueError(
+            f"Некорректный формат: {export_format}. Допустимые: {', '.join(RENDERERS)}"
+        )
+    return RENDERERS[export_format](iter_records(queryset, base_url))
@@ -0,0 +1,165 @@
+import math
+
+# Алфавит geohash; в нем нет букв a, i, l, o
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+BASE32_INDEX = {char: index for index, char in enumerate(BASE32)}
+
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash точки заданной длины"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lon_range[0] = mid
+            else:
+                bits = bits * 2
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_range[0] = mid
+            else:
+                bits = bits * 2
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Размер ячейки geohash в градусах: (широта, долгота)"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def prefix_upper_bound(prefix):
+    """
+    Наименьшая строка, большая всех geohash с данным префиксом.
+
+    Используется вместо LIKE 'prefix%', чтобы условие было диапазоном
+    по B-tree индексу в любой БД и при любой сортировке строк.
+    Для префикса из одних 'z' возвращает None (диапазон открыт сверху).
+    """
+    chars = list(prefix)
+    while chars:
+        index = BASE32_INDEX[chars[-1]]
+        if index < len(BASE32) - 1:
+            chars[-1] = BASE32[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def covering_ranges(min_lat, min_lon, max_lat, max_lon, max_cells=32):
+    """
+    Диапазоны geohash, покрывающие прямоугольник.
+
+    Точность подбирается так, чтобы ячеек было не больше max_cells;
+    соседние по порядку geohash ячейки объединяются в один диапазон.
+    Прямоугольник не должен пересекать антимеридиан.
+
+    Returns:
+        list: Пары (нижняя граница включительно, верхняя граница не включительно|None)
+    """
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(candidate)
+        rows = math.floor((max_lat + 90) / lat_step) - math.floor((min_lat + 90) / lat_step) + 1
+        cols = math.floor((max_lon + 180) / lon_step) - math.floor((min_lon + 180) / lon_step) + 1
+        if rows * cols <= max_cells:
+            precision = candidate
+            break
+
+    lat_step, lon_step = cell_size(precision)
+    first_row = math.floor((min_lat + 90) / lat_step)
+    last_row = min(math.floor((max_lat + 90) / lat_step), round(180 / lat_step) - 1)
+    first_col = math.floor((min_lon + 180) / lon_step)
+    last_col = min(math.floor((max_lon + 180) / lon_step), round(360 / lon_step) - 1)
+
+    prefixes = sorted({
+        encode(
+            -90 + (row + 0.5) * lat_step,
+            -180 + (col + 0.5) * lon_step,
+            precision
+        )
+        for row in range(first_row, last_row + 1)
+        for col in range(first_col, last_col + 1)
+    })
+
+    ranges = []
+    for prefix in prefixes:
+        upper = prefix_upper_bound(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], upper)
+        else:
+            ranges.append((prefix, upper))
+    return ranges
+
+
+def split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+    """Разбивает прямоугольник, пересекающий антимеридиан (min_lon > max_lon), на два"""
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [
+        (min_lat, min_lon, max_lat, 180.0),
+        (min_lat, -180.0, max_lat, max_lon),
+    ]
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу (формула гаверсинусов)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, map(float, (lat1, lon1, lat2, lon2)))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Прямоугольник, содержащий круг заданного радиуса.
+
+    Returns:
+        list: Один или два прямоугольника (min_lat, min_lon, max_lat, max_lon)
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(latitude - delta_lat, -90.0)
+    max_lat = min(latitude + delta_lat, 90.0)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # Круг содержит полюс: нужны все долготы
+        return [(min_lat, -180.0, max_lat, 180.0)]
+
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    delta_lon = math.degrees(radius_km / EARTH_RADIUS_KM / max(cos_lat, 1e-12))
+    if delta_lon >= 180.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    min_lon = longitude - delta_lon
+    max_lon = longitude + delta_lon
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    return split_antimeridian(min_lat, min_lon, max_lat, max_lon)
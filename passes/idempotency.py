@@ -0,0 +1,137 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+CACHE_PREFIX = 'fstr:idempotency:'
+
+
+class KeyReused(ValueError):
+    """Ключ идемпотентности уже использован с другим телом запроса"""
+
+
+def get_scope_email(data):
+    """Email пользователя из данных submitData для области действия ключа"""
+    user = data.get('user') if isinstance(data, dict) else None
+    email = user.get('email') if isinstance(user, dict) else None
+    return str(email or '').strip().lower()
+
+
+def get_request_key(request, body, data):
+    """
+    Ключ идемпотентности запроса и хеш его тела.
+
+    Ключ берется из заголовка Idempotency-Key, а если его нет и включен
+    FSTR_IDEMPOTENCY_DERIVE_KEY - из хеша тела запроса. Ключ действует
+    только для email пользователя из данных и пути запроса: одинаковые
+    заголовки разных клиентов не пересекаются.
+
+    Args:
+        request (HttpRequest): Запрос
+        body (bytes): Тело запроса; в DRF его нужно прочитать до
+            request.data, после разбора оно недоступно
+        data (dict): Разобранные данные запроса
+
+    Returns:
+        tuple: (key, body_hash) - SHA-256 ключа и тела; (None, None),
+            если ключа нет
+    """
+    header = request.META.get('HTTP_IDEMPOTENCY_KEY')
+    if not header and not (settings.FSTR_IDEMPOTENCY_DERIVE_KEY and body):
+        return None, None
+    body_hash = hashlib.sha256(body).hexdigest()
+    source = f'header:{header}' if header else f'body:{body_hash}'
+    scope = f'{get_scope_email(data)}\n{request.path}\n{source}'
+    return hashlib.sha256(scope.encode()).hexdigest(), body_hash
+
+
+def check_replay(stored, body_hash):
+    """
+    id перевала для повтора запроса.
+
+    Raises:
+        KeyReused: Тело запроса отличается от сохраненного с этим ключом
+    """
+    if stored is None:
+        return None
+    pass_id, stored_hash = stored
+    if stored_hash != body_hash:
+        raise KeyReused("Ключ идемпотентности уже использован с другими данными")
+    return pass_id
+
+
+def lookup(key, body_hash):
+    """
+    Перевал, уже созданный по этому ключу.
+
+    Сначала проверяется локальный кеш, затем таблица ключей.
+
+    Returns:
+        int|None: id перевала
+
+    Raises:
+        KeyReused: Ключ сохранен с другим телом запроса
+    """
+    stored = cache.get(CACHE_PREFIX + key)
+    if stored is None:
+        stored = (
+            IdempotencyKey.objects
+            .filter(key=key, expires_at__gt=timezone.now())
+            .values_list('pass_instance_id', 'body_hash')
+            .first()
+        )
+        if stored is not None:
+            cache.set(CACHE_PREFIX + key, stored, settings.FSTR_IDEMPOTENCY_TTL)
+    return check_replay(stored, body_hash)
+
+
+async def alookup(key, body_hash):
+    """Асинхронный вариант lookup"""
+    stored = await cache.aget(CACHE_PREFIX + key)
+    if stored is None:
+        stored = await (
+            IdempotencyKey.objects
+            .filter(key=key, expires_at__gt=timezone.now())
+            .values_list('pass_instance_id', 'body_hash')
+            .afirst()
+        )
+        if stored is not None:
+            await cache.aset(CACHE_PREFIX + key, stored, settings.FSTR_IDEMPOTENCY_TTL)
+    return check_replay(stored, body_hash)
+
+
+def remember(key, pass_id, body_hash):
+    """
+    Сохраняет ключ и хеш тела запроса для созданного перевала.
+
+    Вызывать в той же транзакции, что и создание перевала: при гонке
+    двух повторов второй получит IntegrityError и откатится.
+    """
+    # Просроченная запись с тем же ключом не должна мешать новой
+    IdempotencyKey.objects.filter(key=key, expires_at__lte=timezone.now()).delete()
+    IdempotencyKey.objects.create(
+        key=key,
+        pass_instance_id=pass_id,
+        body_hash=body_hash,
+        expires_at=timezone.now() + timedelta(seconds=settings.FSTR_IDEMPOTENCY_TTL)
+    )
+
+
+def cache_result(key, pass_id, body_hash):
+    """Кладет ключ в локальный кеш после фиксации транзакции"""
+    cache.set(CACHE_PREFIX + key, (pass_id, body_hash), settings.FSTR_IDEMPOTENCY_TTL)
+
+
+def forget(key):
+    """Удаляет ключ из локального кеша"""
+    cache.delete(CACHE_PREFIX + key)
+
+
+def purge_expired():
+    """Удаляет просроченные ключи; возвращает число удаленных"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
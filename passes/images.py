@@ -0,0 +1,135 @@
+import binascii
+import hashlib
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+
+# Символы, не входящие в алфавит base64 (переводы строк, пробелы и т.п.),
+# b64decode их отбрасывает, поэтому отбрасываем и мы
+NON_BASE64_RE = re.compile(r'[^A-Za-z0-9+/=]')
+
+# Допустимые расширения изображений. Файлы отдаются из /media/ с типом
+# по расширению, поэтому HTML, SVG и другие активные форматы не принимаются
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp')
+
+
+class ImageTooLarge(ValueError):
+    """Превышен допустимый размер изображения или изображений запроса"""
+
+
+class ImageBudget:
+    """
+    Учет суммарного объема изображений в рамках одного запроса.
+
+    Передается через context сериализатора и уменьшается по мере
+    декодирования изображений.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = settings.FSTR_REQUEST_IMAGES_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, size):
+        self.used += size
+        if self.used > self.max_bytes:
+            raise ImageTooLarge(
+                f"Превышен суммарный размер изображений запроса: {self.max_bytes} байт"
+            )
+
+
+class UnsupportedImageType(ValueError):
+    """Тип изображения не входит в IMAGE_EXTENSIONS"""
+
+
+def image_extension(ext):
+    """
+    Расширение файла изображения из типа data URI или имени загрузки.
+
+    Args:
+        ext (str): Расширение без точки или подтип image/...; пустое - jpg
+
+    Returns:
+        str: Расширение из IMAGE_EXTENSIONS
+
+    Raises:
+        UnsupportedImageType: Недопустимый тип изображения
+    """
+    ext = ext.lower() or 'jpg'
+    if ext not in IMAGE_EXTENSIONS:
+        raise UnsupportedImageType(f"Недопустимый тип изображения: {ext[:20]}")
+    return ext
+
+
+def decode_base64_image(data, title, budget=None):
+    """
+    Декодирует изображение из base64 строки (в том числе data URI).
+
+    Строка декодируется блоками фиксированного размера во временный файл,
+    поэтому объем памяти на изображение не зависит от его размера.
+    Ограничения на размер изображения и запроса проверяются по ходу
+    декодирования.
+
+    Args:
+        data (str): base64 строка или data URI вида data:image/png;base64,...
+        title (str): Название изображения, используется в имени файла
+        budget (ImageBudget|None): Учет объема изображений запроса
+
+    Returns:
+        File: Файл изображения для сохранения в ImageField; в атрибуте
+            sha256 хранится хеш декодированного содержимого
+
+    Raises:
+        ImageTooLarge: Превышен размер изображения или запроса
+        UnsupportedImageType: Тип в data URI не входит в IMAGE_EXTENSIONS
+        binascii.Error: Некорректные base64 данные
+    """
+    ext = 'jpg'
+    start = 0
+    if data.startswith('data:image'):
+        header_end = data.index(';base64,')
+        # data:image/<тип>, подтип целиком: data:image/x/html не станет html
+        ext = image_extension(data[len('data:image/'):header_end])
+        start = header_end + len(';base64,')
+
+    max_bytes = settings.FSTR_IMAGE_MAX_BYTES
+    # Размер блока в символах кратен 4, чтобы блоки декодировались независимо
+    chunk_chars = settings.FSTR_IMAGE_DECODE_CHUNK_SIZE // 3 * 4
+
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FSTR_IMAGE_DECODE_CHUNK_SIZE
+    )
+    digest = hashlib.sha256()
+    try:
+        size = 0
+        tail = ''
+        for offset in range(start, len(data), chunk_chars):
+            chunk = tail + NON_BASE64_RE.sub('', data[offset:offset + chunk_chars])
+            # Неполную четверку символов переносим в следующий блок
+            cut = len(chunk) - len(chunk) % 4
+            chunk, tail = chunk[:cut], chunk[cut:]
+            if not chunk:
+                continue
+            decoded = binascii.a2b_base64(chunk)
+            size += len(decoded)
+            if size > max_bytes:
+                raise ImageTooLarge(
+                    f"Превышен размер изображения '{title}': {max_bytes} байт"
+                )
+            if budget is not None:
+                budget.consume(len(decoded))
+            digest.update(decoded)
+            output.write(decoded)
+        if tail:
+            raise binascii.Error("Incorrect padding")
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+
+    image_file = File(output, name=f'{title}.{ext}')
+    image_file.sha256 = digest.hexdigest()
+    return image_file
@@ -0,0 +1,249 @@
+"""
+Импорт исторических каталогов перевалов из JSONL (manage.py import_passes).
+
+Каждая строка файла - запись в формате submitData с изображениями в base64.
+Файл читается построчно. Разбор JSON, декодирование и проверка изображений
+выполняются в пуле процессов, запись - пакетами через bulk_create_passes,
+по транзакции на пакет. В той же транзакции сохраняется позиция в файле
+(ImportCheckpoint), поэтому после сбоя импорт продолжается с первой
+незафиксированной строки и записи не дублируются.
+"""
+
+import binascii
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .bulk import bulk_create_passes
+from .duplicates import find_duplicate_kwargs
+from .images import image_extension
+from .models import ImportCheckpoint
+from .processing import create_executor
+from .serializers import PassSerializer
+
+logger = logging.getLogger(__name__)
+
+# Сколько пакетов декодируется в пуле, пока записывается текущий
+PREFETCH_BATCHES = 2
+
+# Ошибки в данных записи: запись пропускается, импорт продолжается
+RECORD_ERRORS = (ValueError, TypeError, AttributeError, KeyError)
+
+
+def decode_image(data, max_bytes):
+    """
+    Декодирует и проверяет изображение. Выполняется в дочернем процессе.
+
+    Args:
+        data (str): base64 строка или data URI
+        max_bytes (int): Допустимый размер изображения
+
+    Returns:
+        tuple: (content: bytes, ext: str, sha256: str)
+
+    Raises:
+        ValueError: Некорректные данные, не изображение или превышен размер
+    """
+    from PIL import Image as PILImage
+
+    if data.startswith('data:image'):
+        header_end = data.index(';base64,')
+        data = data[header_end + len(';base64,'):]
+
+    content = binascii.a2b_base64(data)
+    if len(content) > max_bytes:
+        raise ValueError(f"Превышен размер изображения: {max_bytes} байт")
+    try:
+        with PILImage.open(io.BytesIO(content)) as img:
+            img_format = img.format
+            img.verify()
+    except Exception as e:
+        raise ValueError(f"Некорректное изображение: {e}") from e
+
+    # Расширение - по формату, определенному Pillow, а не по типу из data URI
+    ext = image_extension('jpg' if img_format == 'JPEG' else img_format.lower())
+    return content, ext, hashlib.sha256(content).hexdigest()
+
+
+def decode_line(line, max_bytes):
+    """
+    Разбирает строку файла и декодирует изображения записи.
+    Выполняется в дочернем процессе.
+
+    Returns:
+        tuple|None: (данные submitData, список (content, ext, sha256)) или
+            None для пустой строки. В данных поле data изображений заменено
+            хешем содержимого, чтобы не передавать base64 обратно.
+
+    Raises:
+        ValueError: Некорректный JSON или изображение
+    """
+    if not line.strip():
+        return None
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("Некорректные данные записи")
+    images = data.get('images') or []
+    if not isinstance(images, list):
+        raise ValueError("Поле images должно быть списком")
+
+    decoded = []
+    for image in images:
+        if not isinstance(image, dict) or not isinstance(image.get('data'), str):
+            raise ValueError(
+                "Изображение без data: загрузки по токену при импорте не поддерживаются"
+            )
+        content, ext, sha256 = decode_image(image['data'], max_bytes)
+        image['data'] = sha256
+        decoded.append((content, ext, sha256))
+    return data, decoded
+
+
+def read_lines(file, offset):
+    """Строки файла начиная с позиции offset: пары (позиция после строки, строка)"""
+    file.seek(offset)
+    for line in iter(file.readline, b''):
+        offset += len(line)
+        yield offset, line
+
+
+def read_batches(lines, batch_size, max_bytes):
+    """
+    Пакеты строк: не больше batch_size строк и max_bytes байт
+    (пакет из одной строки может быть больше max_bytes).
+
+    Yields:
+        tuple: (список пар (позиция после строки, строка), размер пакета в байтах)
+    """
+    batch = []
+    size = 0
+    for offset, line in lines:
+        if batch and (len(batch) >= batch_size or size + len(line) > max_bytes):
+            yield batch, size
+            batch = []
+            size = 0
+        batch.append((offset, line))
+        size += len(line)
+    if batch:
+        yield batch, size
+
+
+def build_record(data, decoded):
+    """
+    Проверяет запись сериализатором и готовит ее для bulk_create_passes.
+
+    Raises:
+        ValueError: Запись не прошла проверку
+    """
+    serializer = PassSerializer(data=data)
+    if not serializer.is_valid():
+        raise ValueError(f"Недостаточно полей или некорректные данные: {serializer.errors}")
+
+    record = serializer.validated_data
+    images = []
+    for image, (content, ext, sha256) in zip(record['images'], decoded):
+        image_file = ContentFile(content, name=f"{image['title']}.{ext}")
+        image_file.sha256 = sha256
+        images.append((image['title'], image_file))
+    record['images'] = images
+    return record
+
+
+def write_batch(checkpoint, batch):
+    """
+    Записывает пакет и новую позицию импорта в одной транзакции.
+
+    Записи с ошибками пропускаются и учитываются в checkpoint.failed.
+
+    Args:
+        checkpoint (ImportCheckpoint): Позиция импорта
+        batch (list): Пары (позиция после строки, Future с результатом decode_line)
+    """
+    records = []
+    failed = 0
+    for index, (_, future) in enumerate(batch, start=checkpoint.lines + 1):
+        try:
+            result = future.result()
+            if result is not None:
+                records.append(build_record(*result))
+        except RECORD_ERRORS as e:
+            logger.error("Строка %s пропущена: %s", index, e)
+            failed += 1
+
+    with transaction.atomic():
+        if records:
+            for record, duplicate in zip(records, find_duplicate_kwargs(records)):
+                record.update(duplicate)
+            bulk_create_passes(records)
+        checkpoint.offset = batch[-1][0]
+        checkpoint.lines += len(batch)
+        checkpoint.imported += len(records)
+        checkpoint.failed += failed
+        checkpoint.save()
+
+
+def import_passes(path, source=None, batch_size=200, workers=None, restart=False, progress=None):
+    """
+    Импортирует перевалы из JSONL файла, продолжая с сохраненной позиции.
+
+    Args:
+        path (str): Путь к файлу
+        source (str|None): Имя источника для позиции импорта; по умолчанию
+            абсолютный путь к файлу
+        batch_size (int): Число строк в пакете записи
+        workers (int|None): Число процессов декодирования;
+            по умолчанию FSTR_IMAGE_WORKERS
+        restart (bool): Начать с начала файла, а не с сохраненной позиции
+        progress (callable|None): Вызывается после каждого пакета
+            с позицией импорта и скоростью в строках в секунду
+
+    Returns:
+        ImportCheckpoint: Итоговая позиция импорта
+    """
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+        source=source or os.path.abspath(path)
+    )
+    if restart:
+        checkpoint.offset = checkpoint.lines = checkpoint.imported = checkpoint.failed = 0
+        checkpoint.save()
+
+    max_bytes = settings.FSTR_IMAGE_MAX_BYTES
+    started = time.monotonic()
+    start_lines = checkpoint.lines
+
+    def flush(batch):
+        write_batch(checkpoint, batch)
+        if progress is not None:
+            elapsed = time.monotonic() - started
+            progress(checkpoint, (checkpoint.lines - start_lines) / elapsed if elapsed else 0)
+
+    # Декодированные изображения пакетов в очереди хранятся в памяти:
+    # очередь ограничена и числом пакетов, и объемом их строк
+    prefetch_bytes = settings.FSTR_IMPORT_PREFETCH_BYTES
+    with open(path, 'rb') as file, create_executor(workers) as executor:
+        lines = read_lines(file, checkpoint.offset)
+        pending = deque()
+        pending_bytes = 0
+        for chunk, size in read_batches(lines, batch_size, prefetch_bytes):
+            while pending and (
+                len(pending) > PREFETCH_BATCHES or pending_bytes + size > prefetch_bytes
+            ):
+                batch, batch_bytes = pending.popleft()
+                flush(batch)
+                pending_bytes -= batch_bytes
+            pending.append(([
+                (offset, executor.submit(decode_line, line, max_bytes))
+                for offset, line in chunk
+            ], size))
+            pending_bytes += size
+        while pending:
+            flush(pending.popleft()[0])
+    return checkpoint
@@ -0,0 +1,209 @@
+"""
+Журналирование приема перевалов.
+
+Вместо полного тела запроса (с многомегабайтными base64-изображениями)
+в журнал пишется краткая сводка: имена полей, число и размеры
+изображений, хеш email пользователя. Записи передаются в очередь и
+форматируются и пишутся фоновым потоком, поэтому поток запроса не ждет
+ввода-вывода журнала.
+
+Модуль подключается из LOGGING в настройках до загрузки приложений,
+поэтому не импортирует модели.
+"""
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+# Атрибуты LogRecord, которые есть у любой записи и не выводятся как поля
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'taskName'
+}
+
+
+def email_hash(email):
+    """Хеш email для журнала: позволяет связать записи одного пользователя, не раскрывая адрес"""
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(), str(email).strip().lower().encode(), hashlib.sha256
+    )
+    return digest.hexdigest()[:16]
+
+
+def base64_size(data):
+    """Размер декодированных данных base64 (или data URI) без декодирования"""
+    if not isinstance(data, str):
+        return None
+    start = data.find(';base64,')
+    length = len(data) - (start + len(';base64,') if start != -1 else 0)
+    padding = data.endswith('==') + data.endswith('=')
+    return max(length * 3 // 4 - padding, 0)
+
+
+def summarize_submission(data):
+    """
+    Краткая сводка данных submitData для журнала.
+
+    Returns:
+        dict: fields, images, image_bytes и user_email_hash
+    """
+    if not isinstance(data, dict):
+        return {'fields': [], 'images': 0, 'image_bytes': []}
+    images = data.get('images')
+    images = images if isinstance(images, list) else []
+    user = data.get('user')
+    summary = {
+        'fields': sorted(data),
+        'images': len(images),
+        'image_bytes': [
+            base64_size(image.get('data')) if isinstance(image, dict) else None
+            for image in images
+        ],
+    }
+    if isinstance(user, dict) and user.get('email'):
+        summary['user_email_hash'] = email_hash(user['email'])
+    return summary
+
+
+def summarize_batch(records):
+    """Краткая сводка пакета записей submitData/batch"""
+    summaries = [summarize_submission(record) for record in records]
+    return {
+        'records': len(summaries),
+        'images': sum(summary['images'] for summary in summaries),
+        'image_bytes': sum(
+            size or 0 for summary in summaries for size in summary['image_bytes']
+        ),
+    }
+
+
+def get_fields(record):
+    """Дополнительные поля записи, переданные через extra"""
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in RECORD_ATTRIBUTES and not key.startswith('_')
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись журнала одной строкой JSON с полями из extra"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **get_fields(record),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Текстовая запись журнала с полями из extra в виде key=value"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = get_fields(record)
+        if fields:
+            line += ' ' + ' '.join(
+                f'{key}={json.dumps(value, ensure_ascii=False, default=str)}'
+                for key, value in fields.items()
+            )
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей частых событий.
+
+    Событие задается через extra={'event': ...}; доля для события - в
+    rates (например, {'submit_data.received': 0.1}). Предупреждения и
+    ошибки, а также события без заданной доли проходят всегда.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, 'event', None))
+        return rate is None or random.random() < rate
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    Обработчик, передающий записи фоновому потоку через очередь.
+
+    Поток запроса только кладет запись в ограниченную очередь; при
+    переполнении запись отбрасывается, а не ждет. Форматирование и запись
+    в поток или файл выполняет QueueListener. Форматтер, заданный этому
+    обработчику в LOGGING, передается целевому обработчику.
+
+    Args:
+        filename (str|None): Файл журнала; по умолчанию stderr
+        max_queue (int): Размер очереди
+    """
+
+    def __init__(self, filename=None, max_queue=10000):
+        super().__init__(queue.Queue(maxsize=max_queue))
+        self.max_queue = max_queue
+        if filename:
+            # Переоткрывает файл после ротации внешними средствами (logrotate)
+            self.target = logging.handlers.WatchedFileHandler(filename, encoding='utf-8')
+        else:
+            self.target = logging.StreamHandler(sys.stderr)
+        self.dropped = 0
+        self._start_listener()
+        atexit.register(self._stop_listener)
+        # В дочернем процессе (воркер gunicorn с --preload) потока слушателя нет
+        os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _start_listener(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop_listener(self):
+        if self.listener._thread is not None:
+            try:
+                self.listener.stop()
+            except queue.Full:
+                # Очередь переполнена при завершении процесса: поток-демон
+                # завершится вместе с ним
+                pass
+
+    def _restart_after_fork(self):
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self._start_listener()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # В отличие от QueueHandler.prepare, не форматируем запись в потоке
+        # запроса: это сделает целевой обработчик в фоновом потоке
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._stop_listener()
+        self.target.close()
+        super().close()
@@ -0,0 +1,64 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from passes.models import LEVEL_SEASONS, Difficulty, Level, Pass
+from passes.stats import rebuild
+
+logger = logging.getLogger(__name__)
+
+
+def parse_legacy(text, pass_id):
+    """Код категории из прежней таблицы; нераспознанный текст пропускается"""
+    try:
+        return Difficulty.parse(text)
+    except ValueError:
+        logger.warning("Перевал ID %s: категория %r не распознана", pass_id, text)
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит категории трудности из прежней таблицы pereval_level '
+        'в поля level_* перевалов и очищает ее'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пакета обновления'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = list(LEVEL_SEASONS.values())
+        copied = 0
+        while True:
+            with transaction.atomic():
+                passes = list(
+                    Pass.objects
+                    .filter(level__isnull=False)
+                    .select_related('level')
+                    .only('id', 'level', *fields)[:batch_size]
+                )
+                if not passes:
+                    break
+                level_ids = []
+                for item in passes:
+                    level_ids.append(item.level_id)
+                    for season, field in LEVEL_SEASONS.items():
+                        text = getattr(item.level, season)
+                        setattr(item, field, parse_legacy(text, item.id))
+                    item.level = None
+                Pass.objects.bulk_update(passes, [*fields, 'level'])
+                Level.objects.filter(id__in=level_ids).delete()
+                Pass.objects.filter(id__in=[item.id for item in passes]).mark_changed()
+            copied += len(passes)
+
+        # Строки, оставшиеся без перевала (перевал удален до переноса)
+        Level.objects.filter(pass__isnull=True).delete()
+        if copied:
+            # Счетчики статистики по сезонам учитывают перенесенные категории
+            rebuild()
+        self.stdout.write(f"Перенесено категорий трудности: {copied}")
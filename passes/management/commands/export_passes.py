@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from passes import export
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковая выгрузка перевалов в CSV, GeoJSON или JSONL '
+        '(по умолчанию принятые модератором)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', default='jsonl', choices=list(export.RENDERERS),
+            help='Формат выгрузки'
+        )
+        parser.add_argument(
+            '--status', default='accepted',
+            help='Статус модерации; all - все статусы'
+        )
+        parser.add_argument('--since', help='Добавленные не раньше (ISO 8601)')
+        parser.add_argument('--until', help='Добавленные раньше (ISO 8601)')
+        parser.add_argument(
+            '--output', help='Файл выгрузки; по умолчанию стандартный вывод'
+        )
+        parser.add_argument(
+            '--base-url', default='',
+            help='Схема и хост для ссылок на изображения, например https://fstr.example'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            queryset = export.get_queryset(
+                status=export.parse_status(options['status']),
+                since=export.parse_moment(options['since'], 'since') if options['since'] else None,
+                until=export.parse_moment(options['until'], 'until') if options['until'] else None
+            )
+            lines = export.render(
+                options['format'], queryset, base_url=options['base_url'].rstrip('/')
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
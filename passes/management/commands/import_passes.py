@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from passes.importer import import_passes
+
+
+class Command(BaseCommand):
+    help = (
+        'Импорт перевалов из JSONL файла в формате submitData: изображения '
+        'декодируются в пуле процессов, записи сохраняются пакетами; '
+        'после сбоя импорт продолжается с сохраненной позиции'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL файл, по записи submitData в строке')
+        parser.add_argument(
+            '--source',
+            help='Имя источника для сохраненной позиции; по умолчанию путь к файлу'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Число строк в пакете записи'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.FSTR_IMAGE_WORKERS,
+            help='Число процессов декодирования изображений'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала файла, а не с сохраненной позиции'
+        )
+
+    def report(self, checkpoint, rate):
+        self.stdout.write(
+            f"Строк: {checkpoint.lines}, импортировано: {checkpoint.imported}, "
+            f"с ошибками: {checkpoint.failed}, {rate:.1f} строк/с"
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = import_passes(
+            options['path'],
+            source=options['source'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            restart=options['restart'],
+            progress=self.report
+        )
+        self.stdout.write(
+            f"Импорт завершен: импортировано {checkpoint.imported}, "
+            f"с ошибками {checkpoint.failed}"
+        )
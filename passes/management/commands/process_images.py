@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from passes.processing import WorkerPool, process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Фоновая обработка изображений: миниатюры и средние варианты в WebP, '
+        'удаление EXIF, определение размеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.FSTR_IMAGE_WORKERS,
+            help='Число процессов Pillow'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Число заданий, забираемых за один проход'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='Пауза в секундах, если очередь пуста'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать текущую очередь и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        with WorkerPool(options['workers']) as pool:
+            while True:
+                processed = process_pending_jobs(pool, options['batch_size'])
+                if processed:
+                    self.stdout.write(f"Обработано изображений: {processed}")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
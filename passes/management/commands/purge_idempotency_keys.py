@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from passes.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные ключи идемпотентности submitData'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f"Удалено ключей: {deleted}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from passes.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные загрузки изображений и их файлы'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f"Удалено загрузок: {deleted}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from passes.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики статистики перевалов (GET /stats/) по всей таблице'
+
+    def handle(self, *args, **options):
+        total = rebuild()
+        self.stdout.write(f"Пересчитана статистика перевалов: {total}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from passes.models import Coords
+
+
+class Command(BaseCommand):
+    help = 'Заполняет geohash у координат, сохраненных до появления поля'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать geohash у всех координат'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пакета обновления'
+        )
+
+    def handle(self, *args, **options):
+        queryset = Coords.objects.only('id', 'latitude', 'longitude')
+        if not options['all']:
+            queryset = queryset.filter(geohash='')
+
+        batch = []
+        updated = 0
+        for coords in queryset.iterator(chunk_size=options['batch_size']):
+            coords.update_geohash()
+            batch.append(coords)
+            if len(batch) >= options['batch_size']:
+                Coords.objects.bulk_update(batch, ['geohash'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            Coords.objects.bulk_update(batch, ['geohash'])
+            updated += len(batch)
+
+        self.stdout.write(f"Обновлено координат: {updated}")
@@ -0,0 +1,207 @@
+"""
+Отдача медиафайлов (изображений перевалов) из MEDIA_ROOT.
+
+Имена файлов уникальны и не перезаписываются, поэтому ответы кешируются
+надолго (Cache-Control: immutable), а ETag строится по времени изменения
+и размеру файла без чтения содержимого. Если перед приложением стоит
+nginx или Apache, передача файла отдается им заголовком X-Accel-Redirect
+или X-Sendfile (FSTR_MEDIA_ACCEL, без DEBUG по умолчанию X-Accel-Redirect),
+и они же обрабатывают Range. При FSTR_MEDIA_ACCEL='off' файл отдается
+через wsgi.file_wrapper (sendfile у gunicorn).
+
+Тип содержимого выбирается только из растровых форматов изображений;
+остальные файлы отдаются как application/octet-stream для скачивания,
+браузеру запрещено угадывать тип (X-Content-Type-Options: nosniff).
+"""
+
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import quote_etag
+
+from .uploads import get_upload_dir
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+# Типы содержимого по расширению; HTML, SVG и т.п. браузер не должен исполнять
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+
+class RangeNotSatisfiable(ValueError):
+    """Запрошенный диапазон за пределами файла"""
+
+
+def get_path(name):
+    """
+    Путь к файлу в MEDIA_ROOT по имени из URL.
+
+    Raises:
+        Http404: Файл не найден, вне MEDIA_ROOT или среди незавершенных загрузок
+    """
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name.lstrip('/'))
+    except SuspiciousFileOperation:
+        raise Http404("Файл не найден")
+    upload_dir = os.path.abspath(get_upload_dir())
+    if os.path.commonpath([path, upload_dir]) == upload_dir or not os.path.isfile(path):
+        raise Http404("Файл не найден")
+    return path
+
+
+def get_etag(stat):
+    """ETag по времени изменения и размеру файла, как у nginx"""
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def etag_matches(header, etag):
+    """Совпадает ли ETag с одним из значений If-None-Match (слабое сравнение)"""
+    if header.strip() == '*':
+        return True
+    return etag in [value.strip().removeprefix('W/') for value in header.split(',')]
+
+
+def parse_range(header, size):
+    """
+    Диапазон из заголовка Range.
+
+    Поддерживается один диапазон bytes=начало-конец, bytes=начало- и
+    bytes=-длина; несколько диапазонов и другие единицы игнорируются
+    (отдается весь файл, как разрешает RFC 9110).
+
+    Returns:
+        tuple|None: (start, end) включительно или None - весь файл
+
+    Raises:
+        RangeNotSatisfiable: Диапазон за пределами файла
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        length = int(end)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+class FileRange:
+    """
+    Файл, читаемый от текущей позиции не больше length байт.
+
+    fileno() позволяет gunicorn отправить диапазон через sendfile:
+    он берет текущую позицию файла и длину из Content-Length.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def set_cache_headers(response, etag):
+    response['ETag'] = etag
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Cache-Control'] = f'public, max-age={settings.FSTR_MEDIA_MAX_AGE}, immutable'
+    return response
+
+
+def serve(request, name):
+    """
+    Ответ с файлом name из MEDIA_ROOT.
+
+    Args:
+        request (HttpRequest): GET или HEAD запрос
+        name (str): Путь к файлу относительно MEDIA_ROOT
+
+    Returns:
+        HttpResponse: 200, 206, 304, 416 или ответ с заголовком передачи
+            файла прокси-серверу
+
+    Raises:
+        Http404: Файл не найден
+    """
+    path = get_path(name)
+    stat = os.stat(path)
+    etag = get_etag(stat)
+
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return set_cache_headers(HttpResponseNotModified(), etag)
+
+    content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+    disposition = None
+    if content_type is None:
+        content_type = 'application/octet-stream'
+        disposition = 'attachment'
+
+    accel = settings.FSTR_MEDIA_ACCEL
+    if accel != 'off':
+        # Файл отдает прокси-сервер; Range и условные запросы обрабатывает он
+        response = HttpResponse(content_type=content_type)
+        if accel == 'x-accel-redirect':
+            # Имена старых файлов содержат названия изображений (кириллицу)
+            response['X-Accel-Redirect'] = settings.FSTR_MEDIA_ACCEL_PREFIX + quote(name.lstrip('/'))
+        else:
+            response['X-Sendfile'] = path
+        if disposition:
+            response['Content-Disposition'] = disposition
+        return set_cache_headers(response, etag)
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    # If-Range требует строгого совпадения ETag; иначе файл изменился
+    if 'Range' in request.headers and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(request.headers['Range'], stat.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return set_cache_headers(response, etag)
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            FileRange(file, end - start + 1), content_type=content_type, status=206
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if disposition:
+        response['Content-Disposition'] = disposition
+    response.block_size = BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    return set_cache_headers(response, etag)
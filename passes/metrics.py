@@ -0,0 +1,279 @@
+import contextlib
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Границы корзин гистограмм
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (
+    1024, 10 * 1024, 100 * 1024, 1024 ** 2, 5 * 1024 ** 2,
+    10 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2
+)
+
+# Имя -> (описание, границы корзин)
+HISTOGRAMS = {
+    'fstr_request_duration_seconds': ('Время обработки HTTP-запроса', DURATION_BUCKETS),
+    'fstr_request_queries': ('Число SQL-запросов на HTTP-запрос', QUERY_BUCKETS),
+    'fstr_request_payload_bytes': ('Размер тела HTTP-запроса', SIZE_BUCKETS),
+    'fstr_stage_duration_seconds': (
+        'Время этапов приема перевала: validation, transaction, image_decode, file_write',
+        DURATION_BUCKETS
+    ),
+}
+COUNTERS = {
+    'fstr_requests_total': 'Число HTTP-запросов',
+}
+
+# Счетчик SQL-запросов текущего HTTP-запроса (список из одного числа)
+_query_counter = contextvars.ContextVar('fstr_query_counter', default=None)
+
+
+class _Shard:
+    """
+    Значения метрик одного потока.
+
+    Каждый поток пишет только в свой набор, поэтому обновление не требует
+    блокировок; при выдаче метрик наборы всех потоков суммируются.
+    """
+
+    def __init__(self):
+        # (имя, метки) -> [счетчики корзин..., +Inf, сумма]
+        self.histograms = {}
+        # (имя, метки) -> значение
+        self.counters = {}
+
+
+_local = threading.local()
+_shards = []
+# Имя файла снимка процесса: pid может повториться после перезапуска
+_process_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+_last_flush = 0.0
+
+
+def _reset_after_fork():
+    # Дочерний процесс (например, воркер gunicorn с --preload) не должен
+    # повторно отдавать значения родителя
+    global _local, _shards, _process_id, _last_flush
+    _local = threading.local()
+    _shards = []
+    _process_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    _last_flush = 0.0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        _shards.append(shard)
+    return shard
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def observe(name, value, **labels):
+    """Добавляет значение в гистограмму name"""
+    buckets = HISTOGRAMS[name][1]
+    histograms = _get_shard().histograms
+    key = _key(name, labels)
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    values[bisect_left(buckets, value)] += 1
+    values[-1] += value
+
+
+def increment(name, amount=1, **labels):
+    """Увеличивает счетчик name"""
+    counters = _get_shard().counters
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+@contextlib.contextmanager
+def timer(stage):
+    """Замеряет время этапа приема перевала"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('fstr_stage_duration_seconds', time.perf_counter() - start, stage=stage)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Считает SQL-запросы внутри блока, в том числе выполненные в потоках,
+    получивших копию контекста (sync_to_async, run_blocking).
+
+    Yields:
+        list: Список из одного элемента - числа запросов
+    """
+    counter = [0]
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+
+def query_counter_wrapper(execute, sql, params, many, context):
+    """Обертка выполнения SQL для connection.execute_wrappers"""
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def collect():
+    """
+    Значения метрик текущего процесса.
+
+    Returns:
+        dict: {'histograms': {key: values}, 'counters': {key: value}}
+    """
+    histograms = {}
+    counters = {}
+    for shard in list(_shards):
+        # Копирование словаря атомарно, значения копируем отдельно,
+        # чтобы не зависеть от параллельных обновлений
+        for key, values in dict(shard.histograms).items():
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(list(values)):
+                total[index] += value
+        for key, value in dict(shard.counters).items():
+            counters[key] = counters.get(key, 0) + value
+    return {'histograms': histograms, 'counters': counters}
+
+
+def _snapshot_path(process_id):
+    return os.path.join(settings.FSTR_METRICS_DIR, f'{process_id}.json')
+
+
+def flush_due():
+    """Пора ли записать снимок метрик процесса"""
+    return bool(settings.FSTR_METRICS_DIR) and (
+        time.monotonic() - _last_flush >= settings.FSTR_METRICS_FLUSH_INTERVAL
+    )
+
+
+def flush(force=False):
+    """
+    Записывает снимок метрик процесса в FSTR_METRICS_DIR.
+
+    Каждый процесс пишет только свой файл (через временный файл и rename),
+    /metrics суммирует файлы всех процессов. Без FSTR_METRICS_DIR
+    ничего не делает.
+    """
+    global _last_flush
+    if not settings.FSTR_METRICS_DIR or not (force or flush_due()):
+        return
+    _last_flush = time.monotonic()
+
+    data = collect()
+    snapshot = {
+        'histograms': [[name, labels, values] for (name, labels), values in data['histograms'].items()],
+        'counters': [[name, labels, value] for (name, labels), value in data['counters'].items()],
+    }
+    os.makedirs(settings.FSTR_METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(_process_id)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(tmp_path, path)
+
+
+def _load_snapshots():
+    """Снимки остальных процессов из FSTR_METRICS_DIR"""
+    if not settings.FSTR_METRICS_DIR:
+        return []
+    own_path = _snapshot_path(_process_id)
+    snapshots = []
+    for path in glob.glob(os.path.join(settings.FSTR_METRICS_DIR, '*.json')):
+        if path == own_path:
+            continue
+        try:
+            with open(path) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            # Файл удален или поврежден - пропускаем
+            continue
+    return snapshots
+
+
+def aggregate():
+    """Сумма метрик текущего процесса и снимков остальных процессов"""
+    data = collect()
+    histograms = data['histograms']
+    counters = data['counters']
+    for snapshot in _load_snapshots():
+        for name, labels, values in snapshot.get('histograms', []):
+            key = (name, tuple(tuple(label) for label in labels))
+            if name not in HISTOGRAMS or len(values) != len(HISTOGRAMS[name][1]) + 2:
+                continue
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render():
+    """Метрики всех процессов в текстовом формате Prometheus"""
+    histograms, counters = aggregate()
+    lines = []
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for (key_name, labels), values in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{_format_labels(labels, [("le", str(bound))])} {cumulative}'
+                )
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(values[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    for name, description in COUNTERS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics, routers
+
+# Cookie, закрепляющая клиента за основной БД после записи
+PRIMARY_PIN_COOKIE = 'fstr_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _observe_request(request, response, duration, queries):
+    match = getattr(request, 'resolver_match', None)
+    # Имя маршрута вместо пути, чтобы число меток не зависело от id в URL
+    view = match.view_name if match else 'unmatched'
+    labels = {'view': view, 'method': request.method}
+
+    metrics.observe('fstr_request_duration_seconds', duration, **labels)
+    metrics.observe('fstr_request_queries', queries, **labels)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length:
+        metrics.observe('fstr_request_payload_bytes', content_length, **labels)
+    status = response.status_code if response is not None else 500
+    metrics.increment('fstr_requests_total', status=status, **labels)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Собирает время обработки, число SQL-запросов и размер тела
+    для каждого HTTP-запроса. Работает и под WSGI, и под ASGI.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            response = None
+            with metrics.count_queries() as queries:
+                try:
+                    response = await get_response(request)
+                finally:
+                    _observe_request(
+                        request, response, time.perf_counter() - start, queries[0]
+                    )
+            if metrics.flush_due():
+                await sync_to_async(metrics.flush)()
+            return response
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            response = None
+            with metrics.count_queries() as queries:
+                try:
+                    response = get_response(request)
+                finally:
+                    _observe_request(
+                        request, response, time.perf_counter() - start, queries[0]
+                    )
+            metrics.flush()
+            return response
+    return middleware
+
+
+def _get_read_alias(request):
+    """БД для чтения: реплика для GET-запросов клиентов, которые недавно не писали"""
+    replica = routers.get_replica_alias()
+    if (
+        replica
+        and request.method in SAFE_METHODS
+        and PRIMARY_PIN_COOKIE not in request.COOKIES
+    ):
+        return replica
+    return None
+
+
+def _pin_to_primary(request, response):
+    # После записи клиент FSTR_DB_PIN_SECONDS читает с основной БД и видит
+    # свои данные, пока реплика догоняет основную
+    if (
+        response is not None
+        and request.method not in SAFE_METHODS
+        and routers.get_replica_alias()
+    ):
+        response.set_cookie(
+            PRIMARY_PIN_COOKIE, '1', max_age=settings.FSTR_DB_PIN_SECONDS,
+            httponly=True, samesite='Lax'
+        )
+
+
+@sync_and_async_middleware
+def database_routing_middleware(get_response):
+    """
+    Направляет чтение в GET-запросах в реплику FSTR_DB_REPLICA_ALIAS,
+    запись - в основную БД. Без настроенной реплики ничего не меняет.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with routers.read_from(_get_read_alias(request)):
+                response = await get_response(request)
+            _pin_to_primary(request, response)
+            return response
+    else:
+        def middleware(request):
+            with routers.read_from(_get_read_alias(request)):
+                response = get_response(request)
+            _pin_to_primary(request, response)
+            return response
+    return middleware
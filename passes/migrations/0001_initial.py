@@ -0,0 +1,291 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import passes.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'pereval_change_counter',
+            },
+        ),
+        migrations.CreateModel(
+            name='Coords',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.DecimalField(decimal_places=7, max_digits=10, verbose_name='Широта')),
+                ('longitude', models.DecimalField(decimal_places=7, max_digits=10, verbose_name='Долгота')),
+                ('height', models.IntegerField(verbose_name='Высота')),
+                ('geohash', models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='Geohash')),
+            ],
+            options={
+                'verbose_name': 'Координаты',
+                'verbose_name_plural': 'Координаты',
+                'db_table': 'pereval_coords',
+            },
+        ),
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Ключ')),
+                ('body_hash', models.CharField(blank=True, max_length=64, verbose_name='Хеш тела запроса')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+                'db_table': 'pereval_idempotency_keys',
+            },
+        ),
+        migrations.CreateModel(
+            name='Image',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('data', models.ImageField(upload_to=passes.models.image_upload_to, verbose_name='Изображение')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')),
+                ('thumbnail', models.ImageField(blank=True, upload_to=passes.models.variant_upload_to, verbose_name='Миниатюра')),
+                ('medium', models.ImageField(blank=True, upload_to=passes.models.variant_upload_to, verbose_name='Среднее изображение')),
+            ],
+            options={
+                'verbose_name': 'Изображение',
+                'verbose_name_plural': 'Изображения',
+                'db_table': 'pereval_images',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.ImageField(upload_to=passes.models.blob_upload_to, verbose_name='Файл')),
+                ('size', models.BigIntegerField(verbose_name='Размер')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+                'db_table': 'pereval_image_blobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('new', 'Ожидает обработки'), ('processing', 'Обрабатывается'), ('done', 'Обработано'), ('failed', 'Ошибка обработки')], default='new', max_length=10, verbose_name='Статус обработки')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Задание обработки изображения',
+                'verbose_name_plural': 'Задания обработки изображений',
+                'db_table': 'pereval_image_jobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Источник')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Позиция в файле, байт')),
+                ('lines', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('imported', models.PositiveIntegerField(default=0, verbose_name='Импортировано')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='С ошибками')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлен')),
+            ],
+            options={
+                'verbose_name': 'Позиция импорта',
+                'verbose_name_plural': 'Позиции импорта',
+                'db_table': 'pereval_import_checkpoints',
+            },
+        ),
+        migrations.CreateModel(
+            name='Level',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('winter', models.CharField(blank=True, max_length=10, verbose_name='Зима')),
+                ('summer', models.CharField(blank=True, max_length=10, verbose_name='Лето')),
+                ('autumn', models.CharField(blank=True, max_length=10, verbose_name='Осень')),
+                ('spring', models.CharField(blank=True, max_length=10, verbose_name='Весна')),
+            ],
+            options={
+                'verbose_name': 'Уровень сложности',
+                'verbose_name_plural': 'Уровни сложности',
+                'db_table': 'pereval_level',
+            },
+        ),
+        migrations.CreateModel(
+            name='Pass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('beauty_title', models.CharField(blank=True, max_length=255, verbose_name='Красивое название')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('other_titles', models.CharField(blank=True, max_length=255, verbose_name='Альтернативные названия')),
+                ('connect', models.TextField(blank=True, verbose_name='Что соединяет')),
+                ('add_time', models.DateTimeField(auto_now_add=True, verbose_name='Время добавления')),
+                ('level_winter', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'н/к'), (2, '1А'), (3, '1Б'), (4, '2А'), (5, '2Б'), (6, '3А'), (7, '3Б')], null=True, verbose_name='Зима')),
+                ('level_summer', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'н/к'), (2, '1А'), (3, '1Б'), (4, '2А'), (5, '2Б'), (6, '3А'), (7, '3Б')], null=True, verbose_name='Лето')),
+                ('level_autumn', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'н/к'), (2, '1А'), (3, '1Б'), (4, '2А'), (5, '2Б'), (6, '3А'), (7, '3Б')], null=True, verbose_name='Осень')),
+                ('level_spring', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'н/к'), (2, '1А'), (3, '1Б'), (4, '2А'), (5, '2Б'), (6, '3А'), (7, '3Б')], null=True, verbose_name='Весна')),
+                ('status', models.CharField(choices=[('new', 'Новая запись'), ('pending', 'Взято в работу модератором'), ('accepted', 'Модерация прошла успешно'), ('rejected', 'Модерация не прошла')], default='new', max_length=10, verbose_name='Статус модерации')),
+                ('duplicate_score', models.FloatField(blank=True, null=True, verbose_name='Сходство названий')),
+                ('claimed_by', models.CharField(blank=True, max_length=150, verbose_name='Модератор')),
+                ('claim_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Аренда до')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Время изменения')),
+                ('change_seq', models.BigIntegerField(default=0, verbose_name='Номер изменения')),
+            ],
+            options={
+                'verbose_name': 'Перевал',
+                'verbose_name_plural': 'Перевалы',
+                'db_table': 'pereval_added',
+                'ordering': ['-add_time', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PassStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=32, verbose_name='Измерение')),
+                ('key', models.CharField(max_length=32, verbose_name='Значение')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Число перевалов')),
+            ],
+            options={
+                'verbose_name': 'Статистика перевалов',
+                'verbose_name_plural': 'Статистика перевалов',
+                'db_table': 'pereval_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True, verbose_name='Токен')),
+                ('filename', models.CharField(blank=True, max_length=255, verbose_name='Имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Загрузка',
+                'verbose_name_plural': 'Загрузки',
+                'db_table': 'pereval_uploads',
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=255, unique=True)),
+                ('fam', models.CharField(max_length=100, verbose_name='Фамилия')),
+                ('name', models.CharField(max_length=100, verbose_name='Имя')),
+                ('otc', models.CharField(blank=True, max_length=100, verbose_name='Отчество')),
+                ('phone', models.CharField(max_length=20, verbose_name='Телефон')),
+            ],
+            options={
+                'verbose_name': 'Пользователь',
+                'verbose_name_plural': 'Пользователи',
+                'db_table': 'pereval_users',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='passstats',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='pass_stats_key_uniq'),
+        ),
+        migrations.AddField(
+            model_name='pass',
+            name='coords',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='passes.coords', verbose_name='Координаты'),
+        ),
+        migrations.AddField(
+            model_name='pass',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suspected_duplicates', to='passes.pass', verbose_name='Возможный дубликат перевала'),
+        ),
+        migrations.AddField(
+            model_name='pass',
+            name='level',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='passes.level', verbose_name='Уровень сложности (прежний)'),
+        ),
+        migrations.AddField(
+            model_name='pass',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='passes.user', verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='image',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='passes.image', verbose_name='Изображение'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='images', to='passes.imageblob', verbose_name='Файл изображения'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='pass_instance',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='passes.pass', verbose_name='Перевал'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='pass_instance',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to='passes.pass', verbose_name='Перевал'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['add_time', 'id'], name='pass_add_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['user', 'add_time', 'id'], name='pass_user_add_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['status', 'add_time', 'id'], name='pass_status_add_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['user', 'change_seq', 'id'], name='pass_user_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['level_winter', 'add_time', 'id'], name='pass_level_winter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['level_summer', 'add_time', 'id'], name='pass_level_summer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['level_autumn', 'add_time', 'id'], name='pass_level_autumn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['level_spring', 'add_time', 'id'], name='pass_level_spring_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(fields=['status', 'created_at'], name='image_job_status_idx'),
+        ),
+    ]
@@ -1,4 +1,14 @@
-from django.db import models
+import hashlib
+import math
+import uuid
+from collections import Counter
+
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import geo
+from .search import search_passes
 
 
 class User(models.Model):
@@ -29,6 +39,15 @@ class Coords(models.Model):
         verbose_name='Долгота'
     )
     height = models.IntegerField(verbose_name='Высота')
+    # Geohash точки: B-tree индекс по нему служит пространственным индексом
+    # для поиска в прямоугольнике и ближайших перевалов без PostGIS
+    geohash = models.CharField(
+        max_length=geo.GEOHASH_PRECISION,
+        db_index=True,
+        blank=True,
+        editable=False,
+        verbose_name='Geohash'
+    )
 
     class Meta:
         db_table = 'pereval_coords'
@@ -38,9 +57,25 @@ class Coords(models.Model):
     def __str__(self):
         return f"lat: {self.latitude}, lon: {self.longitude}, h: {self.height}"
 
+    def update_geohash(self):
+        """Пересчитывает geohash; bulk_create не вызывает save(), поэтому вызывать явно"""
+        self.geohash = geo.encode(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
 
 class Level(models.Model):
-    """Модель уровня сложности перевала"""
+    """
+    Прежняя модель уровня сложности перевала (текст категорий по сезонам).
+
+    Новые записи хранят категории кодами в полях level_* перевала. Таблица
+    оставлена до переноса данных командой copy_levels, которая очищает ее.
+    """
     winter = models.CharField(max_length=10, blank=True, verbose_name='Зима')
     summer = models.CharField(max_length=10, blank=True, verbose_name='Лето')
     autumn = models.CharField(max_length=10, blank=True, verbose_name='Осень')
@@ -64,6 +99,269 @@ class Level(models.Model):
         return ", ".join(levels) if levels else "Не указано"
 
 
+class Difficulty(models.IntegerChoices):
+    """
+    Категории трудности перевалов ФСТР.
+
+    Коды упорядочены по трудности, поэтому диапазон категорий - это
+    диапазон кодов.
+    """
+    NK = 1, 'н/к'
+    A1 = 2, '1А'
+    B1 = 3, '1Б'
+    A2 = 4, '2А'
+    B2 = 5, '2Б'
+    A3 = 6, '3А'
+    B3 = 7, '3Б'
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Код категории по тексту из запроса.
+
+        Допускаются латинские A и B, любой регистр, пробелы и полукатегория
+        со звездочкой (1А* относится к 1А); н/к - также нк и n/k.
+
+        Returns:
+            int|None: Код категории; None для пустой строки
+
+        Raises:
+            ValueError: Неизвестная категория
+        """
+        normalized = (
+            str(text).strip().upper().replace(' ', '').rstrip('*')
+            .translate(LATIN_TO_CYRILLIC)
+        )
+        if not normalized:
+            return None
+        if normalized in ('Н/К', 'НК', 'N/K', 'NK'):
+            return cls.NK
+        for code, label in cls.choices:
+            if label.upper() == normalized:
+                return code
+        raise ValueError(f"Некорректная категория трудности: {text}")
+
+
+# Латинские буквы, которые пишут вместо кириллических в категориях
+LATIN_TO_CYRILLIC = str.maketrans({'A': 'А', 'B': 'Б'})
+
+# Сезоны категорий трудности -> поля Pass
+LEVEL_SEASONS = {
+    'winter': 'level_winter',
+    'summer': 'level_summer',
+    'autumn': 'level_autumn',
+    'spring': 'level_spring',
+}
+
+
+class ChangeCounter(models.Model):
+    """
+    Счетчик изменений перевалов (одна строка).
+
+    Номер изменения выдается UPDATE строки счетчика, строка остается
+    заблокированной до фиксации транзакции. Поэтому транзакции фиксируются
+    в порядке номеров, и клиент синхронизации, запомнивший номер, не
+    пропустит изменение, зафиксированное позже с меньшим номером.
+    """
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'pereval_change_counter'
+
+    @classmethod
+    def next_value(cls, using=None):
+        """Следующий номер изменения; вызывать внутри транзакции"""
+        connection = connections[using or router.db_for_write(cls)]
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (id, value) VALUES (1, 1) '
+                f'ON CONFLICT (id) DO UPDATE SET value = {table}.value + 1 '
+                f'RETURNING value'
+            )
+            return cursor.fetchone()[0]
+
+
+class PassStats(models.Model):
+    """
+    Счетчик перевалов в разрезе статистики (GET /stats).
+
+    Измерения: status, level_<сезон> (код Difficulty), height (нижняя
+    граница диапазона высот) и month (ГГГГ-ММ добавления). Счетчики
+    меняются при создании перевала и смене статуса, полностью
+    пересчитываются командой rebuild_stats.
+    """
+    dimension = models.CharField(max_length=32, verbose_name='Измерение')
+    key = models.CharField(max_length=32, verbose_name='Значение')
+    count = models.BigIntegerField(default=0, verbose_name='Число перевалов')
+
+    class Meta:
+        db_table = 'pereval_stats'
+        verbose_name = 'Статистика перевалов'
+        verbose_name_plural = 'Статистика перевалов'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='pass_stats_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.key}: {self.count}"
+
+    @classmethod
+    def add(cls, deltas, using=None):
+        """
+        Прибавляет изменения к счетчикам одним запросом; вызывать внутри
+        транзакции.
+
+        Строки счетчиков блокируются до конца транзакции, поэтому, как и
+        ChangeCounter.next_value, вызывать как можно ближе к ее концу.
+
+        Args:
+            deltas (dict): (измерение, значение) -> изменение счетчика
+        """
+        # Строки обновляются в одном порядке: параллельные транзакции
+        # не взаимоблокируются
+        rows = sorted((key, delta) for key, delta in deltas.items() if delta)
+        if not rows:
+            return
+        connection = connections[using or router.db_for_write(cls)]
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        dimension, key, count = (quote(column) for column in ('dimension', 'key', 'count'))
+        sql = (
+            f'INSERT INTO {table} ({dimension}, {key}, {count}) VALUES '
+            + ', '.join(['(%s, %s, %s)'] * len(rows))
+            + f' ON CONFLICT ({dimension}, {key}) DO UPDATE SET '
+            f'{count} = {table}.{count} + EXCLUDED.{count}'
+        )
+        params = [value for row_key, delta in rows for value in (*row_key, delta)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class PassQuerySet(models.QuerySet):
+    """Выборки перевалов"""
+
+    def mark_changed(self, **fields):
+        """
+        Обновляет записи одним UPDATE и присваивает им следующий номер
+        изменения (change_seq) для синхронизации мобильного приложения.
+
+        Строка счетчика заблокирована до конца транзакции, поэтому внутри
+        transaction.atomic() вызывать как можно ближе к ее концу.
+
+        Returns:
+            int: Число обновленных записей
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using, savepoint=False):
+            change_seq = ChangeCounter.next_value(using)
+            return self.using(using).update(
+                change_seq=change_seq, updated_at=timezone.now(), **fields
+            )
+
+    def set_status(self, new_status, **fields):
+        """
+        Меняет статус модерации записей с учетом для синхронизации
+        и в счетчиках статистики (PassStats).
+
+        Returns:
+            int: Число обновленных записей
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using, savepoint=False):
+            # Записи блокируются, чтобы прежние статусы, вычитаемые из
+            # счетчиков, не изменились до UPDATE
+            rows = list(self.using(using).select_for_update().values_list('id', 'status'))
+            if not rows:
+                return 0
+            updated = self.model.objects.filter(
+                id__in=[pk for pk, _ in rows]
+            ).mark_changed(status=new_status, **fields)
+            deltas = Counter()
+            for _, old_status in rows:
+                deltas['status', old_status] -= 1
+                deltas['status', new_status] += 1
+            PassStats.add(deltas, using)
+        return updated
+
+    def with_level(self, season, level_min=None, level_max=None):
+        """
+        Перевалы с категорией трудности сезона в диапазоне кодов
+        [level_min, level_max] (индекс по полю сезона).
+
+        Args:
+            season (str): winter, summer, autumn или spring
+            level_min (int|None): Наименьший код Difficulty
+            level_max (int|None): Наибольший код Difficulty
+        """
+        field = LEVEL_SEASONS[season]
+        condition = {f'{field}__isnull': False}
+        if level_min is not None:
+            condition[f'{field}__gte'] = level_min
+        if level_max is not None:
+            condition[f'{field}__lte'] = level_max
+        return self.filter(**condition)
+
+    def search(self, query):
+        """
+        Полнотекстовый поиск по названиям и описанию маршрута, от наиболее
+        релевантных (аннотация search_rank); см. passes.search
+        """
+        return search_passes(self, query)
+
+    def within_boxes(self, boxes):
+        """
+        Перевалы, координаты которых попадают в один из прямоугольников.
+
+        Отбор идет по диапазонам geohash (индекс pereval_coords.geohash),
+        затем уточняется по широте и долготе.
+
+        Args:
+            boxes (list): Прямоугольники (min_lat, min_lon, max_lat, max_lon),
+                не пересекающие антимеридиан
+        """
+        condition = models.Q()
+        for min_lat, min_lon, max_lat, max_lon in boxes:
+            ranges = models.Q()
+            for lower, upper in geo.covering_ranges(min_lat, min_lon, max_lat, max_lon):
+                cell = models.Q(coords__geohash__gte=lower)
+                if upper is not None:
+                    cell &= models.Q(coords__geohash__lt=upper)
+                ranges |= cell
+            condition |= ranges & models.Q(
+                coords__latitude__gte=min_lat,
+                coords__latitude__lte=max_lat,
+                coords__longitude__gte=min_lon,
+                coords__longitude__lte=max_lon,
+            )
+        return self.filter(condition)
+
+    def order_by_distance(self, latitude, longitude):
+        """
+        Перевалы от ближних к дальним по приближенному расстоянию до точки
+        (аннотация approx_distance).
+
+        Расстояние считается в БД по равнопромежуточной проекции: квадрат
+        разности широт плюс квадрат разности долгот, умноженной на косинус
+        широты точки. Разность долгот приводится к [-180, 180], чтобы точки
+        за антимеридианом не оказались дальними.
+        """
+        latitude = float(latitude)
+        longitude = float(longitude)
+        float_field = models.FloatField()
+        delta_lat = Cast('coords__latitude', float_field) - latitude
+        delta_lon = Cast('coords__longitude', float_field) - longitude
+        delta_lon = models.Case(
+            models.When(coords__longitude__gt=longitude + 180, then=delta_lon - 360),
+            models.When(coords__longitude__lt=longitude - 180, then=delta_lon + 360),
+            default=delta_lon,
+            output_field=float_field,
+        ) * math.cos(math.radians(latitude))
+        return self.annotate(
+            approx_distance=delta_lat * delta_lat + delta_lon * delta_lon
+        ).order_by('approx_distance')
+
+
 class Pass(models.Model):
     """Модель горного перевала"""
     
@@ -106,10 +404,30 @@ class Pass(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Координаты'
     )
+    
+    # Прежняя ссылка на Level: заполнена только у записей, категории которых
+    # еще не перенесены командой copy_levels
     level = models.OneToOneField(
         Level,
-        on_delete=models.CASCADE,
-        verbose_name='Уровень сложности'
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Уровень сложности (прежний)'
+    )
+    
+    # Категории трудности по сезонам - коды из справочника Difficulty
+    level_winter = models.PositiveSmallIntegerField(
+        choices=Difficulty.choices, null=True, blank=True, verbose_name='Зима'
+    )
+    level_summer = models.PositiveSmallIntegerField(
+        choices=Difficulty.choices, null=True, blank=True, verbose_name='Лето'
+    )
+    level_autumn = models.PositiveSmallIntegerField(
+        choices=Difficulty.choices, null=True, blank=True, verbose_name='Осень'
+    )
+    level_spring = models.PositiveSmallIntegerField(
+        choices=Difficulty.choices, null=True, blank=True, verbose_name='Весна'
     )
     
     # Статус модерации (обязательное поле по ТЗ)
@@ -119,22 +437,122 @@ class Pass(models.Model):
         default='new',
         verbose_name='Статус модерации'
     )
+    
+    # Предполагаемый оригинал, если запись похожа на уже добавленный перевал
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='suspected_duplicates',
+        verbose_name='Возможный дубликат перевала'
+    )
+    duplicate_score = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Сходство названий'
+    )
+    
+    # Аренда записи модератором (очередь модерации)
+    claimed_by = models.CharField(
+        max_length=150,
+        blank=True,
+        verbose_name='Модератор'
+    )
+    claim_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Аренда до'
+    )
+    
+    # Синхронизация с мобильным приложением: номер последнего изменения
+    # из ChangeCounter, меняется вместе со статусом (PassQuerySet.set_status)
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Время изменения'
+    )
+    change_seq = models.BigIntegerField(
+        default=0,
+        verbose_name='Номер изменения'
+    )
+
+    objects = PassQuerySet.as_manager()
 
     class Meta:
         db_table = 'pereval_added'
         verbose_name = 'Перевал'
         verbose_name_plural = 'Перевалы'
-        ordering = ['-add_time']
+        ordering = ['-add_time', '-id']
+        # Индексы под выборки с сортировкой по времени добавления
+        # и постраничную навигацию по курсору (add_time, id)
+        indexes = [
+            models.Index(fields=['add_time', 'id'], name='pass_add_time_idx'),
+            models.Index(fields=['user', 'add_time', 'id'], name='pass_user_add_time_idx'),
+            models.Index(fields=['status', 'add_time', 'id'], name='pass_status_add_time_idx'),
+            # Синхронизация изменений пользователя по курсору (change_seq, id)
+            models.Index(fields=['user', 'change_seq', 'id'], name='pass_user_change_seq_idx'),
+            # Отбор по сезону и диапазону категорий трудности
+            models.Index(fields=['level_winter', 'add_time', 'id'], name='pass_level_winter_idx'),
+            models.Index(fields=['level_summer', 'add_time', 'id'], name='pass_level_summer_idx'),
+            models.Index(fields=['level_autumn', 'add_time', 'id'], name='pass_level_autumn_idx'),
+            models.Index(fields=['level_spring', 'add_time', 'id'], name='pass_level_spring_idx'),
+        ]
 
     def __str__(self):
         return f"{self.beauty_title} {self.title}"
 
 
+def shard_path(prefix, filename):
+    """
+    Путь prefix/ab/cd/filename, где ab/cd - начало md5 имени файла.
+
+    65536 каталогов по две цифры шестнадцатеричного хеша: каталоги
+    остаются небольшими, и их просмотр не замедляется с ростом числа файлов.
+    """
+    digest = hashlib.md5(filename.encode()).hexdigest()
+    return f'{prefix}/{digest[:2]}/{digest[2:4]}/{filename}'
+
+
+def image_upload_to(instance, filename):
+    """Путь оригинала: passes/ab/cd/<uuid>.ext; имя файла не зависит от названия"""
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'jpg'
+    return shard_path('passes', f'{uuid.uuid4().hex}.{ext}')
+
+
+def variant_upload_to(instance, filename):
+    """Путь варианта изображения: passes/variants/ab/cd/<имя оригинала>_<вариант>.webp"""
+    return shard_path('passes/variants', filename)
+
+
+def blob_upload_to(instance, filename):
+    """Путь файла по хешу содержимого: blobs/ab/cd/abcd....ext"""
+    ext = filename.rsplit('.', 1)[-1] if '.' in filename else 'jpg'
+    sha256 = instance.sha256
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}'
+
+
+class ImageBlob(models.Model):
+    """Файл изображения, общий для всех Image с одинаковым содержимым"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    file = models.ImageField(upload_to=blob_upload_to, verbose_name='Файл')
+    size = models.BigIntegerField(verbose_name='Размер')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Число ссылок')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+
+    class Meta:
+        db_table = 'pereval_image_blobs'
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+
+    def __str__(self):
+        return self.sha256
+
+
 class Image(models.Model):
     """Модель изображения перевала"""
     title = models.CharField(max_length=255, verbose_name='Название')
     data = models.ImageField(
-        upload_to='passes/',
+        upload_to=image_upload_to,
         verbose_name='Изображение'
     )
     pass_instance = models.ForeignKey(
@@ -143,6 +561,29 @@ class Image(models.Model):
         related_name='images',
         verbose_name='Перевал'
     )
+    # Общий файл в режиме контентной адресации (FSTR_IMAGE_STORAGE_MODE = 'cas')
+    blob = models.ForeignKey(
+        ImageBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='images',
+        verbose_name='Файл изображения'
+    )
+    
+    # Результаты фоновой обработки (см. ImageJob)
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name='Ширина')
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name='Высота')
+    thumbnail = models.ImageField(
+        upload_to=variant_upload_to,
+        blank=True,
+        verbose_name='Миниатюра'
+    )
+    medium = models.ImageField(
+        upload_to=variant_upload_to,
+        blank=True,
+        verbose_name='Среднее изображение'
+    )
 
     class Meta:
         db_table = 'pereval_images'
@@ -151,3 +592,105 @@ class Image(models.Model):
 
     def __str__(self):
         return f"{self.title} для {self.pass_instance}"
+
+
+class ImageJob(models.Model):
+    """Задание на фоновую обработку изображения"""
+    
+    STATUS_CHOICES = [
+        ('new', 'Ожидает обработки'),
+        ('processing', 'Обрабатывается'),
+        ('done', 'Обработано'),
+        ('failed', 'Ошибка обработки'),
+    ]
+    
+    image = models.OneToOneField(
+        Image,
+        on_delete=models.CASCADE,
+        related_name='job',
+        verbose_name='Изображение'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='new',
+        verbose_name='Статус обработки'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        db_table = 'pereval_image_jobs'
+        verbose_name = 'Задание обработки изображения'
+        verbose_name_plural = 'Задания обработки изображений'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='image_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.image_id}: {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """Ключ идемпотентности запроса submitData и созданный по нему перевал"""
+    key = models.CharField(max_length=64, unique=True, verbose_name='Ключ')
+    pass_instance = models.ForeignKey(
+        Pass,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        verbose_name='Перевал'
+    )
+    # SHA-256 тела запроса: повтор с тем же ключом, но другими данными отклоняется
+    body_hash = models.CharField(max_length=64, blank=True, verbose_name='Хеш тела запроса')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Действует до')
+
+    class Meta:
+        db_table = 'pereval_idempotency_keys'
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return f"{self.key} -> {self.pass_instance_id}"
+
+
+class Upload(models.Model):
+    """Изображение, загружаемое по частям до отправки submitData"""
+    token = models.CharField(max_length=64, unique=True, verbose_name='Токен')
+    filename = models.CharField(max_length=255, blank=True, verbose_name='Имя файла')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    offset = models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Действует до')
+
+    class Meta:
+        db_table = 'pereval_uploads'
+        verbose_name = 'Загрузка'
+        verbose_name_plural = 'Загрузки'
+
+    def __str__(self):
+        return f"{self.token}: {self.offset}/{self.size}"
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция импорта каталога перевалов (manage.py import_passes)"""
+    source = models.CharField(max_length=255, unique=True, verbose_name='Источник')
+    offset = models.PositiveBigIntegerField(default=0, verbose_name='Позиция в файле, байт')
+    lines = models.PositiveIntegerField(default=0, verbose_name='Обработано строк')
+    imported = models.PositiveIntegerField(default=0, verbose_name='Импортировано')
+    failed = models.PositiveIntegerField(default=0, verbose_name='С ошибками')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлен')
+
+    class Meta:
+        db_table = 'pereval_import_checkpoints'
+        verbose_name = 'Позиция импорта'
+        verbose_name_plural = 'Позиции импорта'
+
+    def __str__(self):
+        return f"{self.source}: {self.lines} строк"
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Pass
+
+# Итоговые статусы, которые ставит модератор
+RESOLUTION_STATUSES = ('accepted', 'rejected')
+
+
+def claim_passes(moderator, limit):
+    """
+    Забирает модератору до limit новых записей.
+
+    Записи блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    параллельные модераторы получают разные записи и не ждут друг друга.
+    Записи переводятся в статус pending с арендой на
+    FSTR_MODERATION_LEASE секунд; записи с истекшей арендой снова
+    попадают в очередь.
+
+    Args:
+        moderator (str): Идентификатор модератора
+        limit (int): Максимальное число записей
+
+    Returns:
+        tuple: (ids: list, lease_expires_at: datetime)
+    """
+    now = timezone.now()
+    lease_expires_at = now + timedelta(seconds=settings.FSTR_MODERATION_LEASE)
+    with transaction.atomic():
+        ids = list(
+            Pass.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status='new') | Q(status='pending', claim_expires_at__lt=now))
+            .order_by('add_time', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            Pass.objects.filter(id__in=ids).set_status(
+                'pending',
+                claimed_by=moderator,
+                claim_expires_at=lease_expires_at
+            )
+    return ids, lease_expires_at
+
+
+def resolve_passes(moderator, ids, new_status):
+    """
+    Принимает или отклоняет записи одним UPDATE с новым номером изменения.
+
+    Обновляются только записи, арендованные этим модератором,
+    аренда которых еще не истекла.
+
+    Args:
+        moderator (str): Идентификатор модератора
+        ids (list): id записей
+        new_status (str): accepted или rejected
+
+    Returns:
+        int: Число обновленных записей
+    """
+    if new_status not in RESOLUTION_STATUSES:
+        raise ValueError(f"Некорректный статус: {new_status}")
+    return Pass.objects.filter(
+        id__in=ids,
+        status='pending',
+        claimed_by=moderator,
+        claim_expires_at__gt=timezone.now()
+    ).set_status(new_status, claim_expires_at=None)
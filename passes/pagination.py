@@ -0,0 +1,122 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def _encode(values):
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
+def encode_cursor(add_time, pk):
+    """Непрозрачный курсор на позицию после записи (add_time, id)"""
+    return _encode([add_time.isoformat(), pk])
+
+
+def decode_cursor(cursor):
+    """
+    Разбирает курсор, созданный encode_cursor.
+
+    Returns:
+        tuple: (add_time: datetime, id: int)
+
+    Raises:
+        ValueError: Некорректный курсор
+    """
+    try:
+        add_time, pk = _decode(cursor)
+        add_time = parse_datetime(add_time)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+    if add_time is None or not isinstance(pk, int):
+        raise ValueError(f"Некорректный курсор: {cursor}")
+    return add_time, pk
+
+
+def keyset_page(queryset, cursor, limit):
+    """
+    Страница записей при сортировке (-add_time, -id) без OFFSET.
+
+    Args:
+        queryset (QuerySet): Выборка перевалов
+        cursor (str|None): Курсор предыдущей страницы
+        limit (int): Размер страницы
+
+    Returns:
+        tuple: (items: list, next_cursor: str|None)
+    """
+    queryset = queryset.order_by('-add_time', '-id')
+    if cursor:
+        add_time, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(add_time__lt=add_time) | Q(add_time=add_time, id__lt=pk)
+        )
+    # Одна лишняя запись показывает, есть ли следующая страница
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.add_time, last.id)
+    return items, next_cursor
+
+
+def encode_change_cursor(change_seq, pk):
+    """Непрозрачный курсор синхронизации на позицию после изменения (change_seq, id)"""
+    return _encode(['changes', change_seq, pk])
+
+
+def decode_change_cursor(cursor):
+    """
+    Разбирает курсор, созданный encode_change_cursor.
+
+    Returns:
+        tuple: (change_seq: int, id: int)
+
+    Raises:
+        ValueError: Некорректный курсор
+    """
+    try:
+        kind, change_seq, pk = _decode(cursor)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+    if kind != 'changes' or not isinstance(change_seq, int) or not isinstance(pk, int):
+        raise ValueError(f"Некорректный курсор: {cursor}")
+    return change_seq, pk
+
+
+def changes_page(queryset, cursor, limit):
+    """
+    Записи, измененные после курсора, в порядке (change_seq, id).
+
+    Курсор следующего запроса возвращается всегда: если изменений нет,
+    это тот же курсор, и повторный запрос вернет только новые изменения.
+
+    Args:
+        queryset (QuerySet): Выборка перевалов
+        cursor (str|None): Курсор предыдущей синхронизации; None - с начала
+        limit (int): Размер страницы
+
+    Returns:
+        tuple: (items: list, next_cursor: str, has_more: bool)
+    """
+    change_seq, pk = decode_change_cursor(cursor) if cursor else (-1, 0)
+    queryset = queryset.filter(
+        Q(change_seq__gt=change_seq) | Q(change_seq=change_seq, id__gt=pk)
+    ).order_by('change_seq', 'id')
+    items = list(queryset[:limit + 1])
+    has_more = len(items) > limit
+    items = items[:limit]
+    if items:
+        return items, encode_change_cursor(items[-1].change_seq, items[-1].id), has_more
+    return items, encode_change_cursor(change_seq, pk), has_more
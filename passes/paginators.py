@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, использующий оценку числа строк из статистики PostgreSQL.
+
+    Для выборок без условий (полный список в админке) точный COUNT(*)
+    на больших таблицах требует полного прохода по таблице. Если по
+    статистике (pg_class.reltuples) строк больше
+    FSTR_ADMIN_ESTIMATED_COUNT_THRESHOLD, используется оценка; в остальных
+    случаях и на других БД - обычный COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate()
+        if estimate is not None and estimate > settings.FSTR_ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+    def _estimate(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct or query.is_sliced:
+            return None
+
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # -1 означает, что статистика еще не собиралась
+        if not row or row[0] < 0:
+            return None
+        return row[0]
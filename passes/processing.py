@@ -0,0 +1,317 @@
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import blobs
+from .models import Image, ImageJob
+
+logger = logging.getLogger(__name__)
+
+# Качество, с которым пересохраняется оригинал JPEG и WebP без EXIF
+ORIGINAL_QUALITY = 95
+
+
+def render_variants(source, sizes, quality):
+    """
+    Строит WebP варианты изображения. Выполняется в дочернем процессе.
+
+    EXIF в варианты не переносится, ориентация применяется к пикселям.
+    Если в оригинале есть EXIF (координаты съемки, модель камеры),
+    оригинал пересохраняется в том же формате без него.
+
+    Args:
+        source (str|bytes): Путь к файлу или содержимое изображения
+        sizes (dict): Имя варианта -> максимальная сторона в пикселях
+        quality (int): Качество WebP
+
+    Returns:
+        dict: width, height исходного изображения, variants
+            (имя варианта -> содержимое WebP) и original (содержимое
+            оригинала без EXIF или None, если EXIF не было)
+    """
+    from PIL import Image as PILImage, ImageOps
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    with PILImage.open(source) as img:
+        source_format = img.format
+        icc_profile = img.info.get('icc_profile')
+        has_exif = bool(img.getexif())
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        width, height = img.size
+
+        variants = {}
+        for name, max_side in sizes.items():
+            variant = img.copy()
+            variant.thumbnail((max_side, max_side))
+            output = io.BytesIO()
+            variant.save(output, format='WEBP', quality=quality)
+            variants[name] = output.getvalue()
+
+        original = None
+        if has_exif:
+            # Метаданные берутся из параметров сохранения, а не из img.info,
+            # поэтому EXIF и XMP в файл не попадают
+            params = {'icc_profile': icc_profile}
+            if source_format in ('JPEG', 'WEBP'):
+                params['quality'] = ORIGINAL_QUALITY
+            if source_format == 'JPEG' and img.mode == 'RGBA':
+                img = img.convert('RGB')
+            output = io.BytesIO()
+            img.save(output, format=source_format, **params)
+            original = output.getvalue()
+
+    return {'width': width, 'height': height, 'variants': variants, 'original': original}
+
+
+def get_variant_sizes():
+    """Размеры вариантов изображений из настроек"""
+    return {
+        'thumbnail': settings.FSTR_IMAGE_THUMBNAIL_SIZE,
+        'medium': settings.FSTR_IMAGE_MEDIUM_SIZE,
+    }
+
+
+def get_source(image):
+    """Путь к файлу изображения или его содержимое для нелокальных хранилищ"""
+    try:
+        return image.data.path
+    except NotImplementedError:
+        with image.data.open('rb') as f:
+            return f.read()
+
+
+def claim_jobs(limit):
+    """
+    Забирает в работу до limit заданий.
+
+    Задания, зависшие в статусе processing дольше FSTR_IMAGE_JOB_TIMEOUT
+    секунд (например, после падения обработчика), забираются повторно.
+    Повторный захват считается попыткой: изображение, на котором падает
+    обработчик, после FSTR_IMAGE_JOB_MAX_ATTEMPTS попыток не повторяется.
+
+    Returns:
+        list: Объекты ImageJob со связанными изображениями
+    """
+    stale = timezone.now() - timedelta(seconds=settings.FSTR_IMAGE_JOB_TIMEOUT)
+    with transaction.atomic():
+        rows = list(
+            ImageJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status='new') | Q(status='processing', updated_at__lt=stale))
+            .order_by('created_at')
+            .values_list('id', 'status')[:limit]
+        )
+        ids = [job_id for job_id, _ in rows]
+        stale_ids = [job_id for job_id, job_status in rows if job_status == 'processing']
+        if stale_ids:
+            ImageJob.objects.filter(id__in=stale_ids).update(
+                attempts=F('attempts') + 1, error='Превышено время обработки'
+            )
+            failed = ImageJob.objects.filter(
+                id__in=stale_ids, attempts__gte=settings.FSTR_IMAGE_JOB_MAX_ATTEMPTS
+            ).update(status='failed', updated_at=timezone.now())
+            if failed:
+                logger.error("Зависшие задания обработки изображений отклонены: %s", failed)
+        ImageJob.objects.filter(id__in=ids).exclude(status='failed').update(
+            status='processing', updated_at=timezone.now()
+        )
+    return list(
+        ImageJob.objects.filter(id__in=ids, status='processing').select_related('image')
+    )
+
+
+def replace_original(image, content):
+    """
+    Заменяет файл оригинала изображения.
+
+    Файл без блоба перезаписывается под тем же именем. Общий файл блоба
+    (FSTR_IMAGE_STORAGE_MODE = 'cas') не перезаписывается: все его
+    изображения переходят на блоб нового содержимого.
+    """
+    if image.blob_id:
+        blobs.replace_content(image.blob_id, content)
+        image.refresh_from_db(fields=['blob', 'data'])
+        return
+    storage = image.data.storage
+    name = image.data.name
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        storage.delete(name)
+        storage.save(name, ContentFile(content))
+        return
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, path)
+
+
+def save_result(job, result):
+    """Сохраняет варианты изображения и отмечает задание выполненным"""
+    image = job.image
+    if result.get('original') is not None:
+        replace_original(image, result['original'])
+    base_name = os.path.splitext(os.path.basename(image.data.name))[0]
+    for name, content in result['variants'].items():
+        getattr(image, name).save(
+            f'{base_name}_{name}.webp', ContentFile(content), save=False
+        )
+    image.width = result['width']
+    image.height = result['height']
+    image.save(update_fields=['width', 'height', *result['variants']])
+
+    job.status = 'done'
+    job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def save_failure(job, error):
+    """Отмечает неудачную попытку; после FSTR_IMAGE_JOB_MAX_ATTEMPTS задание не повторяется"""
+    job.attempts += 1
+    job.error = str(error)
+    job.status = (
+        'failed' if job.attempts >= settings.FSTR_IMAGE_JOB_MAX_ATTEMPTS else 'new'
+    )
+    job.save(update_fields=['attempts', 'error', 'status', 'updated_at'])
+    logger.error("Ошибка обработки изображения ID %s: %s", job.image_id, error)
+
+
+class WorkerPool:
+    """
+    Пул процессов Pillow, который пересоздается после падения процесса.
+
+    Если дочерний процесс убит (нехватка памяти, decompression bomb),
+    ProcessPoolExecutor отклоняет все следующие задания с BrokenProcessPool.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.executor = create_executor(workers)
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def restart(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = create_executor(self.workers)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+def process_pending_jobs(pool, limit):
+    """
+    Обрабатывает очередную порцию заданий в пуле процессов.
+
+    Падение процесса прерывает все задания пула. Такие задания
+    повторяются по одному в новом пуле, и попытка засчитывается
+    только заданию, на котором процесс падает снова.
+
+    Args:
+        pool (WorkerPool): Пул процессов для Pillow
+        limit (int): Максимальное число заданий за проход
+
+    Returns:
+        int: Число обработанных заданий
+    """
+    jobs = claim_jobs(limit)
+    sizes = get_variant_sizes()
+    quality = settings.FSTR_IMAGE_WEBP_QUALITY
+
+    def submit(job):
+        return pool.submit(render_variants, get_source(job.image), sizes, quality)
+
+    futures = []
+    interrupted = []
+    for job in jobs:
+        try:
+            futures.append((job, submit(job)))
+        except BrokenProcessPool:
+            interrupted.append(job)
+        except Exception as e:
+            save_failure(job, e)
+
+    for job, future in futures:
+        try:
+            save_result(job, future.result())
+        except BrokenProcessPool:
+            interrupted.append(job)
+        except Exception as e:
+            save_failure(job, e)
+
+    broken = bool(interrupted)
+    for job in interrupted:
+        if broken:
+            pool.restart()
+        broken = False
+        try:
+            save_result(job, submit(job).result())
+        except BrokenProcessPool as e:
+            broken = True
+            save_failure(job, e)
+        except Exception as e:
+            save_failure(job, e)
+    if broken:
+        pool.restart()
+
+    return len(jobs)
+
+
+def create_executor(workers=None):
+    """Пул процессов для обработки изображений"""
+    return ProcessPoolExecutor(max_workers=workers or settings.FSTR_IMAGE_WORKERS)
+
+
+def enqueue_images(images):
+    """
+    Ставит изображения в очередь фоновой обработки.
+
+    Изображения, общий файл которых (ImageBlob) уже обработан для другой
+    записи, получают готовые варианты без постановки в очередь.
+    """
+    blob_ids = {image.blob_id for image in images if image.blob_id}
+    processed = {}
+    if blob_ids:
+        for source in (
+            Image.objects
+            .filter(blob_id__in=blob_ids, width__isnull=False)
+            .exclude(thumbnail='')
+            .only('blob_id', 'width', 'height', 'thumbnail', 'medium')
+        ):
+            processed.setdefault(source.blob_id, source)
+
+    reused = []
+    pending = []
+    for image in images:
+        source = processed.get(image.blob_id)
+        if source is None:
+            pending.append(ImageJob(image=image))
+            continue
+        image.width = source.width
+        image.height = source.height
+        image.thumbnail = source.thumbnail.name
+        image.medium = source.medium.name
+        reused.append(image)
+
+    if reused:
+        Image.objects.bulk_update(reused, ['width', 'height', 'thumbnail', 'medium'])
+    ImageJob.objects.bulk_create(pending)
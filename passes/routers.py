@@ -0,0 +1,54 @@
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Псевдоним БД для чтения в текущем запросе; None - читать с основной
+_read_alias = contextvars.ContextVar('fstr_read_alias', default=None)
+
+
+def get_replica_alias():
+    """Псевдоним реплики из FSTR_DB_REPLICA_ALIAS, если она настроена"""
+    alias = settings.FSTR_DB_REPLICA_ALIAS
+    if alias and alias != DEFAULT_DB_ALIAS and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+@contextlib.contextmanager
+def read_from(alias):
+    """Направляет чтение внутри блока в БД alias (запись остается на основной)"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Маршрутизатор запросов к основной БД и реплике.
+
+    Запись всегда идет в основную БД. Чтение идет в реплику только внутри
+    read_from() (его включает database_routing_middleware для GET-запросов)
+    и только вне транзакции: внутри transaction.atomic() читаем с основной,
+    чтобы видеть собственные изменения. Фоновые обработчики и команды
+    управления работают только с основной БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,153 @@
+"""
+Полнотекстовый поиск перевалов по названиям и описанию маршрута.
+
+PostgreSQL: генерируемый столбец search_vector (tsvector, конфигурация
+russian, поэтому находятся формы слов) с индексом GIN и индекс pg_trgm
+по названию для поиска с опечатками. SQLite: таблица FTS5 pereval_search,
+которую поддерживают триггеры; формы слов приближаются поиском по
+префиксу, опечатки не учитываются.
+
+Столбец, индексы и таблица создаются после migrate (install_search).
+Выборки: Pass.objects.search(query).
+"""
+
+import re
+
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+# Конфигурация текстового поиска PostgreSQL
+SEARCH_CONFIG = 'russian'
+WORD_RE = re.compile(r'\w+')
+
+# Индексируемые столбцы и их веса в PostgreSQL
+SEARCH_FIELDS = [('title', 'A'), ('other_titles', 'A'), ('beauty_title', 'B'), ('connect', 'C')]
+COLUMNS = ', '.join(field for field, _ in SEARCH_FIELDS)
+
+
+def fold_yo(sql):
+    """Выражение SQL с заменой ё на е: ни russian, ни unicode61 их не отождествляют"""
+    return f"replace(replace({sql}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def fts_values(row):
+    """Значения столбцов строки new/old для вставки в pereval_search"""
+    return ', '.join(fold_yo(f'{row}.{field}') for field, _ in SEARCH_FIELDS)
+
+
+SEARCH_VECTOR_SQL = ' || '.join(
+    "setweight(to_tsvector('%s', %s), '%s')"
+    % (SEARCH_CONFIG, fold_yo(f"coalesce({field}, '')"), weight)
+    for field, weight in SEARCH_FIELDS
+)
+
+POSTGRESQL_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Столбец вычисляется самой БД при INSERT и UPDATE, в том числе
+    # при bulk_create и update() в обход моделей
+    f'ALTER TABLE pereval_added ADD COLUMN IF NOT EXISTS search_vector tsvector '
+    f'GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED',
+    'CREATE INDEX IF NOT EXISTS pass_search_vector_idx ON pereval_added USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS pass_title_trgm_idx ON pereval_added USING gin (title gin_trgm_ops)',
+]
+
+# Таблица без содержимого (content=''): в индекс попадает текст с заменой ё,
+# поэтому и удаление из индекса триггеры выполняют с теми же значениями
+SQLITE_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS pereval_search USING fts5(
+        {COLUMNS}, content='', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS pereval_search_insert AFTER INSERT ON pereval_added BEGIN
+        INSERT INTO pereval_search (rowid, {COLUMNS}) VALUES (new.id, {fts_values('new')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS pereval_search_delete AFTER DELETE ON pereval_added BEGIN
+        INSERT INTO pereval_search (pereval_search, rowid, {COLUMNS})
+        VALUES ('delete', old.id, {fts_values('old')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS pereval_search_update
+    AFTER UPDATE OF {COLUMNS} ON pereval_added BEGIN
+        INSERT INTO pereval_search (pereval_search, rowid, {COLUMNS})
+        VALUES ('delete', old.id, {fts_values('old')});
+        INSERT INTO pereval_search (rowid, {COLUMNS}) VALUES (new.id, {fts_values('new')});
+    END
+    """,
+    # Переиндексирует записи, в том числе добавленные до создания таблицы
+    "INSERT INTO pereval_search (pereval_search) VALUES ('delete-all')",
+    f"INSERT INTO pereval_search (rowid, {COLUMNS}) "
+    f"SELECT id, {fts_values('pereval_added')} FROM pereval_added",
+]
+
+DDL = {'postgresql': POSTGRESQL_DDL, 'sqlite': SQLITE_DDL}
+
+
+def install_search(using='default', **kwargs):
+    """
+    Создает столбец, индексы и таблицу поиска (обработчик post_migrate).
+
+    Команды идемпотентны. Для pg_trgm пользователю БД нужно право
+    CREATE в базе или заранее установленное расширение.
+    """
+    from .models import Pass
+
+    connection = connections[using]
+    if connection.vendor not in DDL or not router.allow_migrate_model(using, Pass):
+        return
+    with connection.cursor() as cursor:
+        for sql in DDL[connection.vendor]:
+            cursor.execute(sql)
+
+
+def match_phrase(query):
+    """Запрос FTS5: все слова запроса как префиксы, без операторов FTS5"""
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query.lower()))
+
+
+def search_passes(queryset, query):
+    """
+    Перевалы, подходящие под поисковый запрос, от наиболее релевантных.
+
+    Args:
+        queryset (QuerySet): Выборка перевалов
+        query (str): Поисковый запрос пользователя
+
+    Returns:
+        QuerySet: Выборка с аннотацией search_rank
+    """
+    if not WORD_RE.search(query):
+        return queryset.none()
+    query = query.replace('ё', 'е').replace('Ё', 'Е')
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        # Совпадение по словам (GIN по search_vector) или похожее название
+        # (GIN pg_trgm по title): оба условия используют индексы
+        queryset = queryset.filter(RawSQL(
+            f'{table}.search_vector @@ {tsquery} OR {table}.title %% %s',
+            [query, query], output_field=BooleanField()
+        ))
+        rank = RawSQL(
+            f'ts_rank({table}.search_vector, {tsquery}) + similarity({table}.title, %s)',
+            [query, query], output_field=FloatField()
+        )
+    else:
+        phrase = match_phrase(query)
+        queryset = queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM pereval_search WHERE pereval_search MATCH %s', [phrase]
+        ))
+        # rank в FTS5 - bm25, меньше значит релевантнее
+        rank = RawSQL(
+            'SELECT -rank FROM pereval_search '
+            f'WHERE pereval_search MATCH %s AND rowid = {table}.id',
+            [phrase], output_field=FloatField()
+        )
+    return queryset.annotate(search_rank=rank).order_by('-search_rank', '-id')
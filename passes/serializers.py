@@ -1,7 +1,10 @@
 from rest_framework import serializers
-from .models import User, Coords, Level, Pass, Image
-import base64
-from django.core.files.base import ContentFile
+from .models import User, Coords, Pass, Image, Difficulty
+from .uploads import consume_uploads, load_images
+from .users import resolve_users
+from .processing import enqueue_images
+from .blobs import attach_blobs
+from . import metrics
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,6 +13,9 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['email', 'fam', 'name', 'otc', 'phone']
+        # Уникальность email не проверяем: существующий пользователь
+        # может присылать новые перевалы, он находится по email при создании
+        extra_kwargs = {'email': {'validators': []}}
 
 
 class CoordsSerializer(serializers.ModelSerializer):
@@ -20,41 +26,100 @@ class CoordsSerializer(serializers.ModelSerializer):
         fields = ['latitude', 'longitude', 'height']
 
 
-class LevelSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели уровня сложности"""
+class DifficultyField(serializers.Field):
+    """Категория трудности: текст ФСТР (1А, 2Б, н/к) в запросе и ответе, код Difficulty в БД"""
     
-    class Meta:
-        model = Level
-        fields = ['winter', 'summer', 'autumn', 'spring']
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_null', True)
+        super().__init__(**kwargs)
+    
+    def to_internal_value(self, data):
+        try:
+            return Difficulty.parse(data)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+    
+    def to_representation(self, value):
+        return Difficulty(value).label if value else ''
+    
+    def get_attribute(self, instance):
+        # Пустая категория выводится, как и раньше, пустой строкой
+        value = super().get_attribute(instance)
+        return '' if value is None else value
+
+
+class LevelSerializer(serializers.Serializer):
+    """Категории трудности по сезонам; хранятся в полях Pass"""
+    winter = DifficultyField(source='level_winter')
+    summer = DifficultyField(source='level_summer')
+    autumn = DifficultyField(source='level_autumn')
+    spring = DifficultyField(source='level_spring')
 
 
 class ImageSerializer(serializers.ModelSerializer):
     """Сериализатор для модели изображения"""
-    data = serializers.CharField()  # Принимаем base64 строку
+    data = serializers.CharField(required=False)  # Принимаем base64 строку
+    # Или токен завершенной загрузки из POST /uploads/
+    upload = serializers.CharField(required=False, write_only=True, max_length=64)
+    # Ссылки на оригинал и варианты, подготовленные фоновой обработкой
+    url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    medium_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Image
-        fields = ['data', 'title']
+        fields = [
+            'data', 'upload', 'title', 'url', 'thumbnail_url', 'medium_url',
+            'width', 'height'
+        ]
+        read_only_fields = ['width', 'height']
+    
+    def validate(self, attrs):
+        if bool(attrs.get('data')) == bool(attrs.get('upload')):
+            raise serializers.ValidationError(
+                "Нужно передать либо data (base64), либо upload (токен загрузки)"
+            )
+        return attrs
+    
+    def _build_url(self, file):
+        if not file:
+            return None
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(file.url)
+        return file.url
+    
+    def get_url(self, obj):
+        return self._build_url(obj.data)
+    
+    def get_thumbnail_url(self, obj):
+        return self._build_url(obj.thumbnail)
+    
+    def get_medium_url(self, obj):
+        return self._build_url(obj.medium)
     
     def create(self, validated_data):
-        # Обработка base64 данных изображения
-        data = validated_data.pop('data')
-        title = validated_data.get('title', '')
+        # Файл может быть уже подготовлен PassSerializer
+        image_file = validated_data.pop('file', None)
+        source = {
+            'data': validated_data.pop('data', None),
+            'upload': validated_data.pop('upload', None),
+            'title': validated_data.pop('title', ''),
+        }
         
-        # Декодируем base64, если это необходимо
-        if data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'{title}.{ext}')
-        else:
-            # Если это уже файл или простая строка
-            data = ContentFile(base64.b64decode(data), name=f'{title}.jpg')
+        # Обработка base64 данных или загрузки по токену
+        if image_file is None:
+            with metrics.timer('image_decode'):
+                [image_file] = load_images(
+                    [source], budget=self.context.get('image_budget')
+                )
         
-        image = Image.objects.create(
-            data=data,
-            title=title,
-            **validated_data
-        )
+        image = Image(data=image_file, title=source['title'], **validated_data)
+        attach_blobs([image])
+        image.save()
+        enqueue_images([image])
+        consume_uploads([image_file])
         return image
 
 
@@ -62,54 +127,75 @@ class PassSerializer(serializers.ModelSerializer):
     """Сериализатор для модели перевала"""
     user = UserSerializer()
     coords = CoordsSerializer()
-    level = LevelSerializer() 
+    level = LevelSerializer(source='*')
     images = ImageSerializer(many=True)
     
     class Meta:
         model = Pass
         fields = [
-            'beauty_title', 'title', 'other_titles', 'connect',
-            'add_time', 'user', 'coords', 'level', 'images', 'status'
+            'id', 'beauty_title', 'title', 'other_titles', 'connect',
+            'add_time', 'updated_at', 'user', 'coords', 'level', 'images',
+            'status', 'duplicate_of'
         ]
-        read_only_fields = ['add_time', 'status']
+        read_only_fields = ['id', 'add_time', 'updated_at', 'status', 'duplicate_of']
     
     def create(self, validated_data):
         # Извлекаем данные для связанных моделей
         user_data = validated_data.pop('user')
         coords_data = validated_data.pop('coords')
-        level_data = validated_data.pop('level')
         images_data = validated_data.pop('images')
         
-        # Создаем или получаем пользователя
-        user, created = User.objects.get_or_create(
-            email=user_data['email'],
-            defaults=user_data
-        )
+        # Находим, создаем или обновляем пользователя (кеш по email)
+        user_id = resolve_users([user_data])[user_data['email']]
         
         # Создаем координаты
         coords = Coords.objects.create(**coords_data)
         
-        # Создаем уровень сложности
-        level = Level.objects.create(**level_data)
-        
         # Создаем перевал
         pass_instance = Pass.objects.create(
-            user=user,
+            user_id=user_id,
             coords=coords,
-            level=level,
             status='new',  # Согласно ТЗ, по умолчанию статус "new"
             **validated_data
         )
         
-        # Создаем изображения
-        for image_data in images_data:
-            image_serializer = ImageSerializer(data=image_data)
+        # Создаем изображения; загрузки по токенам читаются одним запросом
+        with metrics.timer('image_decode'):
+            image_files = load_images(images_data, budget=self.context.get('image_budget'))
+        for image_data, image_file in zip(images_data, image_files):
+            image_serializer = ImageSerializer(data=image_data, context=self.context)
             if image_serializer.is_valid():
-                image_serializer.save(pass_instance=pass_instance)
+                image_serializer.save(pass_instance=pass_instance, file=image_file)
         
         return pass_instance
 
 
+class PassLocationSerializer(serializers.ModelSerializer):
+    """Краткие данные перевала для карты и поиска по координатам"""
+    latitude = serializers.DecimalField(
+        source='coords.latitude', max_digits=10, decimal_places=7, read_only=True
+    )
+    longitude = serializers.DecimalField(
+        source='coords.longitude', max_digits=10, decimal_places=7, read_only=True
+    )
+    height = serializers.IntegerField(source='coords.height', read_only=True)
+    distance_km = serializers.FloatField(read_only=True, required=False)
+    
+    class Meta:
+        model = Pass
+        fields = [
+            'id', 'beauty_title', 'title', 'status',
+            'latitude', 'longitude', 'height', 'distance_km'
+        ]
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Расстояние есть только в результатах поиска ближайших
+        if not hasattr(instance, 'distance_km'):
+            data.pop('distance_km', None)
+        return data
+
+
 class SubmitDataResponseSerializer(serializers.Serializer):
     """Сериализатор для ответа метода submitData"""
     status = serializers.IntegerField()
@@ -0,0 +1,49 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import idempotency, metrics, stats, users
+from .blobs import release_blobs
+from .models import IdempotencyKey, Image, Pass, User
+
+
+@receiver(post_delete, sender=Image)
+def release_image_blob(sender, instance, **kwargs):
+    """Освобождает ссылку удаленного изображения на общий файл"""
+    if instance.blob_id:
+        release_blobs([instance.blob_id])
+
+
+@receiver(post_delete, sender=Pass)
+def forget_pass_stats(sender, instance, **kwargs):
+    """Вычитает удаленный перевал из счетчиков статистики"""
+    stats.record_change(stats.pass_keys(instance), [])
+
+
+@receiver(post_delete, sender=IdempotencyKey)
+def forget_idempotency_key(sender, instance, **kwargs):
+    """Удаляет ключ из локального кеша, чтобы повтор не получил id удаленного перевала"""
+    idempotency.forget(instance.key)
+
+
+@receiver(pre_save, sender=User)
+def forget_renamed_user(sender, instance, **kwargs):
+    """При смене email (в админке) прежний email больше не указывает на пользователя"""
+    if instance.pk:
+        old_email = User.objects.filter(pk=instance.pk).values_list('email', flat=True).first()
+        if old_email and old_email != instance.email:
+            users.forget(old_email)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    """Удаляет пользователя из кеша после изменения или удаления через ORM"""
+    users.forget(instance.email)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """Подключает подсчет SQL-запросов для метрик к новому соединению"""
+    if metrics.query_counter_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.query_counter_wrapper)
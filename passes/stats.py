@@ -0,0 +1,147 @@
+"""
+Статистика перевалов для GET /stats/ и manage.py rebuild_stats.
+
+Счетчики хранятся в PassStats и меняются в тех же транзакциях, что и
+перевалы: при создании (record_created), смене статуса
+(PassQuerySet.set_status), правке и удалении. Ответ /stats/ - чтение
+небольшой таблицы счетчиков, без GROUP BY по перевалам.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Difficulty, LEVEL_SEASONS, Pass, PassStats
+
+
+def height_band(height):
+    """Нижняя граница диапазона высот шириной FSTR_STATS_HEIGHT_BAND метров"""
+    size = settings.FSTR_STATS_HEIGHT_BAND
+    return height // size * size
+
+
+def get_keys(status, levels, height, add_time):
+    """
+    Счетчики, в которые входит перевал.
+
+    Args:
+        status (str): Статус модерации
+        levels (list): Коды Difficulty по сезонам в порядке LEVEL_SEASONS
+        height (int): Высота, м
+        add_time (datetime): Время добавления
+
+    Returns:
+        list: Пары (измерение, значение)
+    """
+    keys = [('status', status)]
+    keys.extend(
+        (field, str(level))
+        for field, level in zip(LEVEL_SEASONS.values(), levels)
+        if level
+    )
+    keys.append(('height', str(height_band(height))))
+    keys.append(('month', timezone.localtime(add_time).strftime('%Y-%m')))
+    return keys
+
+
+def pass_keys(pass_instance):
+    """Счетчики, в которые входит сохраненный перевал"""
+    return get_keys(
+        pass_instance.status,
+        [getattr(pass_instance, field) for field in LEVEL_SEASONS.values()],
+        pass_instance.coords.height,
+        pass_instance.add_time
+    )
+
+
+def record_created(passes, using=None):
+    """Учитывает созданные перевалы; вызывать в транзакции создания"""
+    PassStats.add(Counter(key for pass_instance in passes for key in pass_keys(pass_instance)), using)
+
+
+def record_change(old_keys, new_keys, using=None):
+    """Переносит перевал из счетчиков old_keys в new_keys"""
+    deltas = Counter(new_keys)
+    deltas.subtract(Counter(old_keys))
+    PassStats.add(deltas, using)
+
+
+def rebuild(using=None):
+    """
+    Пересчитывает счетчики по всем перевалам.
+
+    Перевалы читаются курсором, счетчики считаются той же функцией
+    get_keys, что и при изменениях. В PostgreSQL таблица счетчиков
+    блокируется до конца пересчета: транзакции, меняющие перевалы,
+    ждут его и затем применяют свои изменения к новым значениям.
+
+    Returns:
+        int: Число учтенных перевалов
+    """
+    using = using or router.db_for_write(PassStats)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {connection.ops.quote_name(PassStats._meta.db_table)} '
+                    f'IN EXCLUSIVE MODE'
+                )
+        counts = Counter()
+        total = 0
+        for status, *levels, height, add_time in (
+            Pass.objects.using(using)
+            .order_by()
+            .values_list('status', *LEVEL_SEASONS.values(), 'coords__height', 'add_time')
+            .iterator(chunk_size=settings.FSTR_EXPORT_CHUNK_SIZE)
+        ):
+            counts.update(get_keys(status, levels, height, add_time))
+            total += 1
+        PassStats.objects.using(using).all().delete()
+        PassStats.objects.using(using).bulk_create([
+            PassStats(dimension=dimension, key=key, count=count)
+            for (dimension, key), count in sorted(counts.items())
+        ])
+    return total
+
+
+def get_stats():
+    """
+    Число перевалов по статусам, категориям трудности по сезонам,
+    диапазонам высот и месяцам добавления.
+
+    Returns:
+        dict: status, level (сезон -> категория -> число), height
+            (диапазон "от-до" -> число) и month (ГГГГ-ММ -> число)
+    """
+    counts = {}
+    for dimension, key, count in PassStats.objects.filter(count__gt=0).values_list(
+        'dimension', 'key', 'count'
+    ):
+        counts.setdefault(dimension, {})[key] = count
+
+    size = settings.FSTR_STATS_HEIGHT_BAND
+    heights = counts.get('height', {})
+    return {
+        'status': {
+            status: counts['status'][status]
+            for status, _ in Pass.STATUS_CHOICES
+            if status in counts.get('status', {})
+        },
+        'level': {
+            season: {
+                Difficulty(int(code)).label: count
+                for code, count in sorted(
+                    counts.get(field, {}).items(), key=lambda item: int(item[0])
+                )
+            }
+            for season, field in LEVEL_SEASONS.items()
+        },
+        'height': {
+            f'{band}-{int(band) + size}': heights[band]
+            for band in sorted(heights, key=int)
+        },
+        'month': dict(sorted(counts.get('month', {}).items())),
+    }
@@ -0,0 +1,11 @@
+from django.core.files.storage import FileSystemStorage
+
+from . import metrics
+
+
+class InstrumentedFileSystemStorage(FileSystemStorage):
+    """Файловое хранилище, замеряющее время записи файлов"""
+
+    def _save(self, name, content):
+        with metrics.timer('file_write'):
+            return super()._save(name, content)
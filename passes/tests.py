@@ -1,3 +1,1641 @@
-from django.test import TestCase
+"""
+Бюджеты SQL-запросов и памяти для методов API и маршрутизация запросов
+между основной БД и репликой.
 
-# Create your tests here.
+Для каждого метода и формы данных (0, 1 и 10 изображений, новый или
+существующий пользователь) в BUDGETS заданы допустимое число SQL-запросов
+и пик выделенной памяти (tracemalloc) на один запрос. Если изменение
+добавляет запросы (например, запрос к БД на каждое изображение), тест
+падает и показывает разницу между SQL эталонной формы данных и
+фактическим SQL.
+
+Асинхронный submitData проверяется сравнением его ответов с ответами
+синхронного представления на одни и те же запросы (AsyncSubmitTests).
+"""
+
+import base64
+import csv
+import difflib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import tracemalloc
+from collections import Counter, namedtuple
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from .async_views import submit_data_async
+from .logs import JsonFormatter, QueueLogHandler, SamplingFilter, summarize_submission
+from .middleware import PRIMARY_PIN_COOKIE
+from .models import (
+    Coords, Difficulty, Image, ImageBlob, ImageJob, ImportCheckpoint, Level, Pass, PassStats,
+    Upload, User
+)
+from .processing import claim_jobs, process_pending_jobs
+from .routers import PrimaryReplicaRouter, get_replica_alias, read_from
+from .uploads import load_images
+
+Budget = namedtuple('Budget', ['queries', 'memory_kb'])
+
+IMAGE_COUNTS = [0, 1, 10]
+USER_KINDS = ['new', 'existing']
+# Сколько перевалов создается для методов чтения и пакетной записи
+RECORDS = 5
+
+# (метод, число изображений, пользователь) -> бюджет
+BUDGETS = {
+    # Без заголовка Idempotency-Key ключ не вычисляется (FSTR_IDEMPOTENCY_DERIVE_KEY
+    # выключен по умолчанию), повтор с ключом - см. IdempotencyTests
+    ('submit_data', 0, 'new'): Budget(queries=9, memory_kb=400),
+    ('submit_data', 0, 'existing'): Budget(queries=9, memory_kb=200),
+    # Пользователь с тем же профилем берется из кеша без запроса к БД
+    ('submit_data', 0, 'cached'): Budget(queries=8, memory_kb=200),
+    ('submit_data', 1, 'new'): Budget(queries=11, memory_kb=250),
+    ('submit_data', 1, 'existing'): Budget(queries=11, memory_kb=250),
+    # Синхронный submitData сохраняет изображения по одному:
+    # INSERT изображения и задания обработки на каждое. Номер изменения
+    # (счетчик и UPDATE перевала) берется в конце транзакции
+    ('submit_data', 10, 'new'): Budget(queries=29, memory_kb=550),
+    ('submit_data', 10, 'existing'): Budget(queries=29, memory_kb=550),
+
+    # Номер изменения пакета присваивается одним UPDATE в конце транзакции.
+    # Кандидаты в дубликаты выбираются подзапросом на каждую запись
+    ('submit_data_batch', 0, 'new'): Budget(queries=9, memory_kb=600),
+    ('submit_data_batch', 0, 'existing'): Budget(queries=9, memory_kb=600),
+    ('submit_data_batch', 1, 'new'): Budget(queries=11, memory_kb=650),
+    ('submit_data_batch', 1, 'existing'): Budget(queries=11, memory_kb=650),
+    ('submit_data_batch', 10, 'new'): Budget(queries=11, memory_kb=1400),
+    ('submit_data_batch', 10, 'existing'): Budget(queries=11, memory_kb=1400),
+
+    ('get_pass', 0, 'existing'): Budget(queries=2, memory_kb=200),
+    ('get_pass', 1, 'existing'): Budget(queries=2, memory_kb=200),
+    ('get_pass', 10, 'existing'): Budget(queries=2, memory_kb=250),
+
+    ('list_passes', 0, 'existing'): Budget(queries=2, memory_kb=350),
+    ('list_passes', 1, 'existing'): Budget(queries=2, memory_kb=350),
+    ('list_passes', 10, 'existing'): Budget(queries=2, memory_kb=600),
+
+    ('passes_in_bbox', 0, 'existing'): Budget(queries=1, memory_kb=200),
+    ('passes_in_bbox', 1, 'existing'): Budget(queries=1, memory_kb=200),
+    ('passes_in_bbox', 10, 'existing'): Budget(queries=1, memory_kb=200),
+
+    # Полнотекстовый поиск: один запрос по индексу вместе с координатами
+    ('search_passes', 0, 'existing'): Budget(queries=1, memory_kb=200),
+    ('search_passes', 1, 'existing'): Budget(queries=1, memory_kb=200),
+    ('search_passes', 10, 'existing'): Budget(queries=1, memory_kb=200),
+
+    # Поиск ближайших расширяет радиус, пока не наберет k перевалов
+    ('nearest_passes', 0, 'existing'): Budget(queries=2, memory_kb=150),
+    ('nearest_passes', 1, 'existing'): Budget(queries=2, memory_kb=150),
+    ('nearest_passes', 10, 'existing'): Budget(queries=2, memory_kb=150),
+
+    # Смена статуса блокирует записи и переносит их между счетчиками статистики;
+    # еще два запроса - сессия и пользователь модератора
+    ('moderation_claim', 0, 'existing'): Budget(queries=11, memory_kb=700),
+    ('moderation_resolve', 0, 'existing'): Budget(queries=6, memory_kb=100),
+    # Статистика читается из счетчиков одним запросом
+    ('stats', 0, 'existing'): Budget(queries=1, memory_kb=100),
+    # Выгрузка: курсор по перевалам и запрос изображений на каждую порцию
+    # (FSTR_EXPORT_CHUNK_SIZE=2 в тесте), независимо от числа изображений
+    ('export', 1, 'existing'): Budget(queries=4, memory_kb=150),
+    ('export', 10, 'existing'): Budget(queries=4, memory_kb=150),
+    # Синхронизация: перевалы и изображения, без запросов на каждую запись
+    ('sync_passes', 1, 'existing'): Budget(queries=2, memory_kb=350),
+
+    # Размер ответа растет с числом серий (маршрут, метод, статус),
+    # накопленных предыдущими тестами, включая отдачу медиафайлов
+    ('metrics', 0, 'existing'): Budget(queries=0, memory_kb=250),
+
+    # Загрузка по частям: часть пишется на диск, не накапливаясь в памяти
+    ('upload_create', 0, 'new'): Budget(queries=1, memory_kb=100),
+    ('upload_chunk', 0, 'new'): Budget(queries=3, memory_kb=150),
+    # Загрузки изображений записи читаются одним запросом
+    ('submit_data_upload', 10, 'new'): Budget(queries=30, memory_kb=600),
+}
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+VALUES_LIST_RE = re.compile(r'(?:\(\?(?:, \?)*\)(?:, )?){2,}')
+SAVEPOINT_RE = re.compile(r'"s\d+_x\d+"')
+
+
+def jpeg_base64(side=64):
+    """Небольшое корректное JPEG-изображение в base64"""
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (side, side), (120, 80, 40)).save(buffer, 'JPEG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def make_payload(number, images, image_data, email=None):
+    """Данные submitData; number делает название, email и координаты уникальными"""
+    return {
+        'beauty_title': 'пер. ',
+        'title': f'Перевал {number}',
+        'other_titles': '',
+        'connect': '',
+        'user': {
+            'email': email or f'user{number}@example.com',
+            'fam': 'Пупкин',
+            'name': 'Василий',
+            'otc': '',
+            'phone': '+7 555 55 55',
+        },
+        'coords': {
+            'latitude': f'{45 + number / 1000:.4f}',
+            'longitude': f'{7 + number / 1000:.4f}',
+            'height': 1200,
+        },
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [
+            {'data': image_data, 'title': f'Фото {index}'}
+            for index in range(images)
+        ],
+    }
+
+
+def normalize_sql(sql):
+    """SQL без значений параметров, чтобы запросы сравнивались по форме"""
+    sql = SAVEPOINT_RE.sub('"s?"', sql)
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('(...)', sql)
+    return VALUES_LIST_RE.sub('(...), ...', sql)
+
+
+def format_queries(queries):
+    """Повторяющиеся запросы группируются: повтор на каждую запись сразу заметен"""
+    counts = Counter(queries)
+    lines = []
+    for sql in dict.fromkeys(queries):
+        prefix = f'{counts[sql]} x ' if counts[sql] > 1 else ''
+        lines.append(f'{prefix}{sql}')
+    return lines
+
+
+class BudgetTestCase(TestCase):
+    """Базовый класс тестов с бюджетами запросов и памяти"""
+    maxDiff = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(prefix='fstr-tests-')
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            FSTR_IMAGE_STORAGE_MODE='files',
+            FSTR_METRICS_DIR='',
+        )
+        cls.settings_override.enable()
+        cls.image_data = jpeg_base64()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # Кеш идемпотентности не откатывается вместе с транзакцией теста
+        cache.clear()
+        self.sequence = 0
+
+    def next_number(self):
+        self.sequence += 1
+        return self.sequence
+
+    def make_payload(self, images, email=None):
+        return make_payload(self.next_number(), images, self.image_data, email)
+
+    def make_user(self):
+        number = self.next_number()
+        return User.objects.create(
+            email=f'existing{number}@example.com', fam='Иванов', name='Иван',
+            phone='+7 000 000 00 00'
+        )
+
+    def moderator_client(self, username='ivanov'):
+        """Клиент, вошедший сотрудником: очередь модерации доступна только им"""
+        client = self.client_class()
+        client.force_login(get_user_model().objects.create_user(username, is_staff=True))
+        return client
+
+    def make_pass(self, user, images):
+        """Перевал с изображениями, созданный напрямую через ORM"""
+        number = self.next_number()
+        coords = Coords(latitude=45 + number / 1000, longitude=7 + number / 1000, height=1000)
+        coords.save()
+        pass_instance = Pass.objects.create(
+            title=f'Перевал {number}', user=user, coords=coords,
+            level_summer=Difficulty.A1, status='new'
+        )
+        Image.objects.bulk_create([
+            Image(pass_instance=pass_instance, title=f'Фото {index}', data=f'passes/{number}_{index}.jpg')
+            for index in range(images)
+        ])
+        return pass_instance
+
+    def measure(self, func):
+        """
+        Выполняет запрос, считая SQL и пик выделенной памяти.
+
+        Returns:
+            tuple: (ответ, список нормализованных SQL, пик памяти в КБ)
+        """
+        with CaptureQueriesContext(connection) as context:
+            tracemalloc.start()
+            try:
+                response = func()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        queries = [normalize_sql(query['sql']) for query in context.captured_queries]
+        return response, queries, peak // 1024
+
+    def assertWithinBudget(self, key, func, reference=None):
+        """
+        Проверяет, что запрос укладывается в бюджет BUDGETS[key].
+
+        Args:
+            key (tuple): (метод, число изображений, пользователь)
+            func (callable): Выполняет запрос и возвращает ответ
+            reference (callable|None): Тот же запрос для эталонной формы
+                данных; при превышении бюджета его SQL сравнивается с фактическим
+
+        Returns:
+            Response: Ответ на запрос
+        """
+        budget = BUDGETS[key]
+        response, queries, memory_kb = self.measure(func)
+        self.assertLess(response.status_code, 400, response.content)
+
+        if len(queries) > budget.queries:
+            message = [
+                f"{key}: {len(queries)} SQL-запросов, бюджет {budget.queries}"
+            ]
+            if reference is not None:
+                _, reference_queries, _ = self.measure(reference)
+                message.append("Разница с эталонной формой данных:")
+                message.extend(difflib.unified_diff(
+                    format_queries(reference_queries), format_queries(queries),
+                    'эталон', 'факт', lineterm=''
+                ))
+            else:
+                message.extend(format_queries(queries))
+            self.fail('\n'.join(message))
+
+        self.assertLessEqual(
+            memory_kb, budget.memory_kb,
+            f"{key}: пик памяти {memory_kb} КБ, бюджет {budget.memory_kb} КБ"
+        )
+        return response
+
+
+class SubmitDataBudgetTests(BudgetTestCase):
+    """POST /submitData/ и POST /submitData/batch/"""
+
+    def post(self, path, data):
+        return lambda: self.client.post(path, data, content_type='application/json')
+
+    def submit_payloads(self, images, user_kind):
+        email = self.make_user().email if user_kind == 'existing' else None
+        return self.make_payload(images, email)
+
+    def test_submit_data(self):
+        for images in IMAGE_COUNTS:
+            for user_kind in USER_KINDS:
+                with self.subTest(images=images, user=user_kind):
+                    self.assertWithinBudget(
+                        ('submit_data', images, user_kind),
+                        self.post('/submitData/', self.submit_payloads(images, user_kind)),
+                        reference=self.post('/submitData/', self.submit_payloads(0, 'existing'))
+                    )
+
+    @override_settings(FSTR_USER_CACHE_TTL=60)
+    def test_user_cache(self):
+        email = self.make_user().email
+        # Пользователь попадает в кеш после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('/submitData/', self.make_payload(0, email))()
+        self.assertWithinBudget(
+            ('submit_data', 0, 'cached'),
+            self.post('/submitData/', self.make_payload(0, email)),
+            reference=self.post('/submitData/', self.make_payload(0, email))
+        )
+
+        # Измененный профиль обновляется, а не остается прежним
+        payload = self.make_payload(0, email)
+        payload['user']['phone'] = '+7 999 999 99 99'
+        self.post('/submitData/', payload)()
+        self.assertEqual(User.objects.get(email=email).phone, '+7 999 999 99 99')
+
+        # Сохранение через ORM (админку) сбрасывает кеш: тот же профиль
+        # из запроса снова записывается в БД
+        user = User.objects.get(email=email)
+        user.fam = 'Сидоров'
+        user.save()
+        self.post('/submitData/', payload)()
+        self.assertEqual(User.objects.get(email=email).fam, 'Пупкин')
+
+        User.objects.filter(email=email).delete()
+        response = self.post('/submitData/', self.make_payload(0, email))()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(User.objects.filter(email=email).exists())
+
+    def test_user_profile_kept(self):
+        payload = self.make_payload(0)
+        payload['user']['otc'] = 'Петрович'
+        self.post('/submitData/', payload)()
+        email = payload['user']['email']
+
+        # Поля, которых нет в запросе или которые пусты, не затираются
+        payload = self.make_payload(0, email)
+        del payload['user']['otc']
+        payload['user']['phone'] = '+7 111 111 11 11'
+        response = self.post('/submitData/', payload)()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            User.objects.filter(email=email).values_list('otc', 'phone').get(),
+            ('Петрович', '+7 111 111 11 11')
+        )
+        response = self.post('/submitData/batch/', [self.make_payload(0, email)])()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(User.objects.get(email=email).otc, 'Петрович')
+
+    def test_submit_data_batch(self):
+        for images in IMAGE_COUNTS:
+            for user_kind in USER_KINDS:
+                with self.subTest(images=images, user=user_kind):
+                    records = [self.submit_payloads(images, user_kind) for _ in range(RECORDS)]
+                    reference = [self.submit_payloads(0, 'existing') for _ in range(RECORDS)]
+                    response = self.assertWithinBudget(
+                        ('submit_data_batch', images, user_kind),
+                        self.post('/submitData/batch/', records),
+                        reference=self.post('/submitData/batch/', reference)
+                    )
+                    self.assertEqual(
+                        [result['status'] for result in response.json()['results']],
+                        [200] * RECORDS
+                    )
+
+
+class DuplicateTests(BudgetTestCase):
+    """Отметка возможных дубликатов при приеме перевалов"""
+
+    def submit(self, title, latitude, other_titles=''):
+        payload = self.make_payload(0)
+        payload.update(title=title, other_titles=other_titles)
+        payload['coords'].update(latitude=f'{latitude:.4f}', longitude='7.0000')
+        response = self.client.post('/submitData/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_thresholds(self):
+        original = self.submit('Каратюбе', 45.0)['id']
+
+        # Служебные слова, регистр и ё не влияют на сходство
+        result = self.submit('пер. КАРАТЮБЕ', 45.0045)
+        self.assertEqual(result['duplicate_of'], original)
+        self.assertEqual(Pass.objects.get(id=result['id']).duplicate_score, 1.0)
+
+        # Совпадение с альтернативным названием
+        result = self.submit('Ледовый', 45.0045, other_titles='Каратюбе')
+        self.assertEqual(result['duplicate_of'], original)
+
+        # Дальше FSTR_DUPLICATE_RADIUS_KM (1 км) - не дубликат
+        self.assertNotIn('duplicate_of', self.submit('Каратюбе', 45.02))
+
+        # Другое название рядом - не дубликат
+        self.assertNotIn('duplicate_of', self.submit('Солнечный', 44.9955))
+
+        # Сходство 0.6: ниже порога 0.7, но выше порога по умолчанию (0.4)
+        with override_settings(FSTR_DUPLICATE_MIN_SIMILARITY=0.7):
+            result = self.submit('Каратюбе Южный', 44.9955)
+        self.assertNotIn('duplicate_of', result)
+        Pass.objects.filter(id=result['id']).delete()
+        result = self.submit('Каратюбе Южный', 44.9955)
+        self.assertEqual(result['duplicate_of'], original)
+        self.assertEqual(Pass.objects.get(id=result['id']).duplicate_score, 0.6)
+        with override_settings(FSTR_DUPLICATE_RADIUS_KM=3):
+            self.assertIn('duplicate_of', self.submit('Каратюбе', 45.02))
+
+    def submit_batch(self, *records):
+        payloads = []
+        for title, latitude in records:
+            payload = self.make_payload(0)
+            payload['title'] = title
+            payload['coords'].update(latitude=f'{latitude:.4f}', longitude='7.0000')
+            payloads.append(payload)
+        response = self.client.post('/submitData/batch/', payloads, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_batch(self):
+        # Записи одного пакета сравниваются друг с другом
+        first, second, other = self.submit_batch(
+            ('Каратюбе', 45.0), ('пер. Каратюбе', 45.0045), ('Солнечный', 45.009)
+        )
+        self.assertNotIn('duplicate_of', first)
+        self.assertEqual(second['duplicate_of'], first['id'])
+        self.assertNotIn('duplicate_of', other)
+        self.assertEqual(Pass.objects.get(id=second['id']).duplicate_score, 1.0)
+
+    @override_settings(FSTR_DUPLICATE_MAX_CANDIDATES=1)
+    def test_candidates_per_record(self):
+        north = self.submit('Каратюбе', 45.0)['id']
+        self.submit('Солнечный', 45.006)
+        south = self.submit('Ледовый', 44.0)['id']
+        # Ограничение действует на каждую запись и берет ближайший перевал
+        results = self.submit_batch(('Каратюбе', 45.0005), ('Ледовый', 44.0005))
+        self.assertEqual(
+            [result.get('duplicate_of') for result in results], [north, south]
+        )
+
+
+class IdempotencyTests(BudgetTestCase):
+    """Повторы POST /submitData/ с ключом идемпотентности"""
+
+    def submit(self, payload, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            '/submitData/', payload, content_type='application/json', **headers
+        )
+
+    def test_header_key(self):
+        payload = self.make_payload(1)
+        first = self.submit(payload, 'retry-1')
+        self.assertEqual(first.status_code, 200, first.content)
+
+        # Повтор получает тот же id без записи и декодирования изображений
+        with self.assertNumQueries(1):
+            replay = self.submit(payload, 'retry-1')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.json()['id'], first.json()['id'])
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+
+        # Другие данные с тем же ключом отклоняются
+        changed = dict(payload, title='Другой перевал')
+        response = self.submit(changed, 'retry-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertIsNone(response.json()['id'])
+
+        # Тот же ключ другого пользователя - отдельная запись
+        other = self.submit(self.make_payload(0), 'retry-1')
+        self.assertEqual(other.status_code, 200, other.content)
+        self.assertNotEqual(other.json()['id'], first.json()['id'])
+        self.assertEqual(Pass.objects.count(), 2)
+
+    def test_derived_key(self):
+        payload = self.make_payload(0)
+        # По умолчанию без заголовка одинаковые данные сохраняются дважды
+        ids = {self.submit(payload).json()['id'] for _ in range(2)}
+        self.assertEqual(len(ids), 2)
+
+        payload = self.make_payload(0)
+        with override_settings(FSTR_IDEMPOTENCY_DERIVE_KEY=True):
+            first = self.submit(payload)
+            replay = self.submit(payload)
+            self.assertEqual(replay.json()['id'], first.json()['id'])
+            self.assertEqual(replay['Idempotent-Replayed'], 'true')
+            # Ключ из хеша тела: другие данные - другой ключ, а не 422
+            changed = self.submit(dict(payload, title='Другой перевал'))
+            self.assertEqual(changed.status_code, 200, changed.content)
+            self.assertNotEqual(changed.json()['id'], first.json()['id'])
+
+    def test_cached_key(self):
+        payload = self.make_payload(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.submit(payload, 'retry-2')
+        # После фиксации ключ и хеш тела берутся из кеша
+        with self.assertNumQueries(0):
+            replay = self.submit(payload, 'retry-2')
+        self.assertEqual(replay.json()['id'], first.json()['id'])
+        response = self.submit(dict(payload, connect='Другой маршрут'), 'retry-2')
+        self.assertEqual(response.status_code, 422)
+
+
+class AdminTests(BudgetTestCase):
+    """Админка перевалов: список без N+1 и массовая смена статуса"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(
+            get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        )
+
+    def submit(self, count):
+        ids = []
+        for _ in range(count):
+            response = self.client.post(
+                '/submitData/', self.make_payload(1), content_type='application/json'
+            )
+            ids.append(response.json()['id'])
+        return ids
+
+    def test_changelist(self):
+        self.submit(2)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/admin/passes/pass/').status_code, 200)
+        queries = len(context.captured_queries)
+        self.submit(3)
+        # Пользователи и дубликаты читаются тем же запросом, что и перевалы
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.client.get('/admin/passes/pass/').status_code, 200)
+
+    def test_status_actions(self):
+        ids = self.submit(3)
+        change_seq = dict(Pass.objects.values_list('id', 'change_seq'))
+        response = self.client.post('/admin/passes/pass/', {
+            'action': 'mark_accepted', '_selected_action': ids[:2],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(Pass.objects.values_list('id', 'status')),
+            {ids[0]: 'accepted', ids[1]: 'accepted', ids[2]: 'new'}
+        )
+        # Номер изменения для синхронизации меняется только у выбранных
+        for pass_id, seq in Pass.objects.values_list('id', 'change_seq'):
+            if pass_id in ids[:2]:
+                self.assertGreater(seq, change_seq[pass_id])
+            else:
+                self.assertEqual(seq, change_seq[pass_id])
+
+        self.client.post('/admin/passes/pass/', {
+            'action': 'mark_rejected', '_selected_action': [ids[0]],
+        })
+        results = self.client.get('/stats/').json()['results']
+        self.assertEqual(results['status'], {'new': 1, 'accepted': 1, 'rejected': 1})
+
+
+class BlobTests(BudgetTestCase):
+    """Контентная адресация изображений: общий файл и счетчик ссылок"""
+
+    @override_settings(FSTR_IMAGE_STORAGE_MODE='cas')
+    def test_ref_count(self):
+        first = self.client.post(
+            '/submitData/', self.make_payload(2), content_type='application/json'
+        ).json()['id']
+        response = self.client.post(
+            '/submitData/batch/', [self.make_payload(1), self.make_payload(2)],
+            content_type='application/json'
+        )
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']], [200, 200]
+        )
+
+        # Одинаковое содержимое хранится одним файлом на все пять изображений
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 5)
+        self.assertEqual(
+            set(Image.objects.values_list('data', flat=True)), {blob.file.name}
+        )
+        self.assertTrue(blob.file.storage.exists(blob.file.name))
+
+        Pass.objects.get(id=first).delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 3)
+
+        # Файл удаляется после фиксации удаления последней ссылки
+        with self.captureOnCommitCallbacks(execute=True):
+            Pass.objects.all().delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(blob.file.storage.exists(blob.file.name))
+
+
+class ReadBudgetTests(BudgetTestCase):
+    """Методы чтения: число запросов не должно зависеть от числа изображений"""
+
+    def get(self, path, params=None):
+        return lambda: self.client.get(path, params or {})
+
+    def test_get_pass(self):
+        user = self.make_user()
+        reference = self.make_pass(user, 0)
+        for images in IMAGE_COUNTS:
+            with self.subTest(images=images):
+                pass_instance = self.make_pass(user, images)
+                self.assertWithinBudget(
+                    ('get_pass', images, 'existing'),
+                    self.get(f'/submitData/{pass_instance.id}/'),
+                    reference=self.get(f'/submitData/{reference.id}/')
+                )
+
+    def test_list_passes(self):
+        reference_user = self.make_user()
+        for _ in range(RECORDS):
+            self.make_pass(reference_user, 0)
+        for images in IMAGE_COUNTS:
+            with self.subTest(images=images):
+                user = self.make_user()
+                for _ in range(RECORDS):
+                    self.make_pass(user, images)
+                response = self.assertWithinBudget(
+                    ('list_passes', images, 'existing'),
+                    self.get('/submitData/', {'user__email': user.email}),
+                    reference=self.get('/submitData/', {'user__email': reference_user.email})
+                )
+                self.assertEqual(len(response.json()['results']), RECORDS)
+
+    def test_level_filter(self):
+        user = self.make_user()
+        for category in ['н/к', '1А', '1b', '2А*', '3Б']:
+            payload = self.make_payload(0, user.email)
+            payload['level']['summer'] = category
+            response = self.client.post('/submitData/', payload, content_type='application/json')
+            self.assertEqual(response.status_code, 200, response.content)
+
+        response = self.assertWithinBudget(
+            ('list_passes', 0, 'existing'),
+            self.get('/submitData/', {'season': 'summer', 'level_min': '1Б', 'level_max': '2A'})
+        )
+        self.assertEqual(
+            sorted(result['level']['summer'] for result in response.json()['results']),
+            ['1Б', '2А']
+        )
+
+        payload = self.make_payload(0, user.email)
+        payload['level']['summer'] = '4Б'
+        response = self.client.post('/submitData/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/submitData/', {'level_min': '1А'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_geo_search(self):
+        user = self.make_user()
+        for images in IMAGE_COUNTS:
+            for _ in range(RECORDS):
+                self.make_pass(user, images)
+            with self.subTest(images=images):
+                self.assertWithinBudget(
+                    ('passes_in_bbox', images, 'existing'),
+                    self.get('/submitData/bbox/', {
+                        'min_lat': 44, 'min_lon': 6, 'max_lat': 46, 'max_lon': 8
+                    })
+                )
+                self.assertWithinBudget(
+                    ('nearest_passes', images, 'existing'),
+                    self.get('/submitData/nearest/', {'lat': 45, 'lon': 7, 'k': RECORDS})
+                )
+                self.assertWithinBudget(
+                    ('search_passes', images, 'existing'),
+                    self.get('/submitData/search/', {'q': 'перевал', 'limit': RECORDS})
+                )
+
+    def test_nearest(self):
+        user = self.make_user()
+
+        def place(latitude, longitude):
+            pass_instance = self.make_pass(user, 0)
+            coords = pass_instance.coords
+            coords.latitude, coords.longitude = latitude, longitude
+            coords.save()
+            return pass_instance.id
+
+        far = place(43.0, 7.0)
+        near = place(45.01, 7.0)
+        nearest = place(45.0, 7.001)
+        across = place(45.0, -179.999)
+
+        def found(**params):
+            response = self.get('/submitData/nearest/', params)()
+            self.assertEqual(response.status_code, 200)
+            return [item['id'] for item in response.json()['results']]
+
+        self.assertEqual(found(lat=45, lon=7, k=2), [nearest, near])
+        self.assertEqual(found(lat=45, lon=179.999, k=1), [across])
+        # Радиус растет не дальше FSTR_NEAREST_MAX_STEPS шагов
+        self.assertEqual(found(lat=45, lon=7, k=3)[2], far)
+        with override_settings(FSTR_NEAREST_MAX_STEPS=2):
+            self.assertEqual(found(lat=45, lon=7, k=3), [nearest, near])
+
+    def test_search(self):
+        user = self.make_user()
+        by_title = self.make_pass(user, 0)
+        Pass.objects.filter(id=by_title.id).update(title='Гега')
+        by_route = self.make_pass(user, 0)
+        Pass.objects.filter(id=by_route.id).update(connect='Из долины Гега в долину Бзыби')
+        other = self.make_pass(user, 0)
+
+        def found(query):
+            response = self.get('/submitData/search/', {'q': query})()
+            self.assertEqual(response.status_code, 200)
+            return {item['id'] for item in response.json()['results']}
+
+        self.assertEqual(found('гега'), {by_title.id, by_route.id})
+        self.assertEqual(found('Бзыби'), {by_route.id})
+        # Индекс обновляется вместе с записью
+        Pass.objects.filter(id=other.id).update(other_titles='Гега Южный')
+        self.assertEqual(found('Гега'), {by_title.id, by_route.id, other.id})
+        self.assertEqual(found('гёга'), {by_title.id, by_route.id, other.id})
+        self.assertEqual(found('Маруха'), set())
+        self.assertEqual(self.get('/submitData/search/', {'q': ' '})().status_code, 400)
+
+
+class ModerationBudgetTests(BudgetTestCase):
+    """Очередь модерации и метрики: фиксированное число запросов"""
+
+    def test_claim_and_resolve(self):
+        moderator = self.moderator_client()
+        user = self.make_user()
+        for _ in range(RECORDS):
+            self.make_pass(user, 1)
+        response = self.assertWithinBudget(
+            ('moderation_claim', 0, 'existing'),
+            lambda: moderator.post(
+                '/moderation/claim/', {'limit': RECORDS},
+                content_type='application/json'
+            )
+        )
+        ids = [result['id'] for result in response.json()['results']]
+        self.assertEqual(len(ids), RECORDS)
+        self.assertEqual(set(Pass.objects.values_list('claimed_by', flat=True)), {'ivanov'})
+        self.assertWithinBudget(
+            ('moderation_resolve', 0, 'existing'),
+            lambda: moderator.post(
+                '/moderation/resolve/',
+                {'ids': ids, 'status': 'accepted'},
+                content_type='application/json'
+            )
+        )
+
+    def test_staff_only(self):
+        pass_instance = self.make_pass(self.make_user(), 0)
+        requests = [
+            ('/moderation/claim/', {'limit': 1}),
+            ('/moderation/resolve/', {'ids': [pass_instance.id], 'status': 'accepted'}),
+        ]
+        for path, data in requests:
+            response = self.client.post(path, data, content_type='application/json')
+            self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user('tourist'))
+        for path, data in requests:
+            response = self.client.post(path, data, content_type='application/json')
+            self.assertEqual(response.status_code, 403)
+        pass_instance.refresh_from_db()
+        self.assertEqual((pass_instance.status, pass_instance.claimed_by), ('new', ''))
+
+    def test_metrics(self):
+        self.assertWithinBudget(('metrics', 0, 'existing'), lambda: self.client.get('/metrics'))
+
+
+@override_settings(FSTR_EXPORT_CHUNK_SIZE=2)
+class ExportTests(BudgetTestCase):
+    """Потоковая выгрузка перевалов"""
+
+    def export(self, **params):
+        def request():
+            response = self.client.get('/export/', params)
+            if response.streaming:
+                # Выгрузка читается целиком внутри измерения бюджета
+                return HttpResponse(
+                    b''.join(response.streaming_content),
+                    content_type=response['Content-Type'],
+                    status=response.status_code
+                )
+            return response
+        return request
+
+    def test_formats(self):
+        # Прогрев вне измерения: первый запрос процесса загружает модули
+        # и компилирует шаблоны URL
+        self.export()()
+        user = self.make_user()
+        for images in (1, 10):
+            with self.subTest(images=images):
+                Pass.objects.all().delete()
+                for _ in range(RECORDS):
+                    self.make_pass(user, images)
+                rejected = self.make_pass(user, images)
+                Pass.objects.exclude(id=rejected.id).update(status='accepted')
+
+                body = self.assertWithinBudget(
+                    ('export', images, 'existing'), self.export(format='jsonl')
+                ).content.decode()
+                records = [json.loads(line) for line in body.splitlines()]
+                self.assertEqual(len(records), RECORDS)
+                self.assertEqual(len(records[0]['images']), images)
+                self.assertTrue(records[0]['images'][0].startswith('http://testserver/media/'))
+                self.assertEqual(records[0]['summer'], '1А')
+
+        collection = json.loads(self.export(format='geojson', status='all')().content.decode())
+        self.assertEqual(len(collection['features']), RECORDS + 1)
+        self.assertEqual(len(collection['features'][0]['geometry']['coordinates']), 3)
+
+        body = self.export(format='csv', since='2000-01-01')().content.decode()
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), RECORDS)
+        self.assertEqual(self.export(format='csv', until='2000-01-01')().content.decode().count('\n'), 1)
+
+        self.assertEqual(self.export(format='xml')().status_code, 400)
+        self.assertEqual(self.export(since='вчера')().status_code, 400)
+
+    def test_command(self):
+        user = self.make_user()
+        self.make_pass(user, 1)
+        Pass.objects.update(status='accepted')
+        output = io.StringIO()
+        call_command('export_passes', '--format', 'jsonl', '--base-url', 'https://fstr.example/', stdout=output)
+        record = json.loads(output.getvalue())
+        self.assertTrue(record['images'][0].startswith('https://fstr.example/media/'))
+
+
+class ImportTests(BudgetTestCase):
+    """Импорт каталога перевалов из JSONL"""
+
+    def write_lines(self, path, lines, mode='w'):
+        with open(path, mode, encoding='utf-8') as file:
+            file.writelines(line + '\n' for line in lines)
+
+    def import_file(self, path):
+        output = io.StringIO()
+        call_command(
+            'import_passes', path, '--batch-size', '2', '--workers', '1', stdout=output
+        )
+        return output.getvalue()
+
+    def test_import_and_resume(self):
+        path = f'{self.media_root}/catalogue.jsonl'
+        broken_image = self.make_payload(1)
+        broken_image['images'][0]['data'] = base64.b64encode(b'not an image').decode()
+        wrong_images = self.make_payload(0)
+        wrong_images['images'] = 5
+        wrong_coords = self.make_payload(0)
+        wrong_coords['coords'] = None
+        self.write_lines(path, [
+            json.dumps(self.make_payload(2)),
+            '{"title": ',
+            json.dumps(broken_image),
+            '',
+            json.dumps(wrong_images),
+            json.dumps(wrong_coords),
+            json.dumps(self.make_payload(1)),
+        ])
+
+        output = self.import_file(path)
+        self.assertIn('импортировано 2, с ошибками 4', output)
+        self.assertEqual(Pass.objects.count(), 2)
+        self.assertEqual(Image.objects.count(), 3)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.lines, 7)
+
+        # Повторный запуск продолжает с сохраненной позиции; пакеты
+        # ограничены и объемом строк
+        self.write_lines(path, [json.dumps(self.make_payload(1)) for _ in range(3)], mode='a')
+        with override_settings(FSTR_IMPORT_PREFETCH_BYTES=1):
+            self.import_file(path)
+        self.assertEqual(Pass.objects.count(), 5)
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.lines, checkpoint.imported, checkpoint.failed), (10, 5, 4))
+
+
+class StatsTests(BudgetTestCase):
+    """Счетчики статистики перевалов"""
+
+    def get_stats(self):
+        return self.client.get('/stats/')
+
+    def test_incremental_matches_rebuild(self):
+        moderator = self.moderator_client()
+        for _ in range(RECORDS):
+            response = self.client.post(
+                '/submitData/', self.make_payload(0), content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+        batch = [self.make_payload(0) for _ in range(2)]
+        batch[0]['coords']['height'] = 3100
+        self.client.post('/submitData/batch/', batch, content_type='application/json')
+
+        claimed = [
+            result['id'] for result in moderator.post(
+                '/moderation/claim/', {'limit': 3},
+                content_type='application/json'
+            ).json()['results']
+        ]
+        moderator.post(
+            '/moderation/resolve/',
+            {'ids': claimed[:2], 'status': 'accepted'},
+            content_type='application/json'
+        )
+        Pass.objects.get(id=claimed[2]).delete()
+
+        results = self.assertWithinBudget(('stats', 0, 'existing'), self.get_stats).json()['results']
+        total = RECORDS + 1
+        self.assertEqual(results['status'], {'new': total - 2, 'accepted': 2})
+        self.assertEqual(results['level']['summer'], {'1А': total})
+        self.assertEqual(results['height'], {'1000-1500': total - 1, '3000-3500': 1})
+        self.assertEqual(sum(results['month'].values()), total)
+
+        # Полный пересчет дает те же значения
+        incremental = set(PassStats.objects.filter(count__gt=0).values_list('dimension', 'key', 'count'))
+        output = io.StringIO()
+        call_command('rebuild_stats', stdout=output)
+        self.assertIn(str(total), output.getvalue())
+        self.assertEqual(set(PassStats.objects.values_list('dimension', 'key', 'count')), incremental)
+
+
+class CopyLevelsTests(BudgetTestCase):
+    """Перенос категорий трудности из прежней таблицы pereval_level"""
+
+    def test_copy_levels(self):
+        user = self.make_user()
+        legacy = self.make_pass(user, 0)
+        legacy.level = Level.objects.create(winter='2a*', summer='1Б', autumn='', spring='??')
+        legacy.level_summer = None
+        legacy.save()
+        orphan = Level.objects.create(summer='1А')
+        current = self.make_pass(user, 0)
+        change_seq = Pass.objects.get(id=legacy.id).change_seq
+
+        output = io.StringIO()
+        call_command('copy_levels', stdout=output)
+        self.assertIn('1', output.getvalue())
+
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.level_id)
+        self.assertEqual(legacy.level_winter, Difficulty.A2)
+        self.assertEqual(legacy.level_summer, Difficulty.B1)
+        self.assertIsNone(legacy.level_autumn)
+        self.assertIsNone(legacy.level_spring)
+        self.assertGreater(legacy.change_seq, change_seq)
+        self.assertEqual(Pass.objects.get(id=current.id).level_summer, Difficulty.A1)
+        self.assertFalse(Level.objects.filter(id=orphan.id).exists())
+        self.assertEqual(Level.objects.count(), 0)
+
+        results = self.client.get('/stats/').json()['results']
+        self.assertEqual(results['level']['summer'], {'1А': 1, '1Б': 1})
+
+        # Повторный запуск ничего не меняет
+        output = io.StringIO()
+        call_command('copy_levels', stdout=output)
+        self.assertIn(': 0', output.getvalue())
+
+
+class SyncTests(BudgetTestCase):
+    """Синхронизация изменений перевалов пользователя по курсору"""
+
+    def sync(self, email, cursor=None):
+        params = {'user__email': email}
+        if cursor:
+            params['cursor'] = cursor
+        return lambda: self.client.get('/submitData/sync/', params)
+
+    def post(self, path, data):
+        return self.client.post(path, data, content_type='application/json')
+
+    def test_status_changes(self):
+        moderator = self.moderator_client()
+        user = self.make_user()
+        for _ in range(RECORDS):
+            self.make_pass(user, 1)
+        response = self.assertWithinBudget(
+            ('sync_passes', 1, 'existing'), self.sync(user.email)
+        ).json()
+        self.assertEqual(len(response['results']), RECORDS)
+        cursor = response['next_cursor']
+
+        # Без изменений - пустой ответ и тот же курсор
+        response = self.sync(user.email, cursor)().json()
+        self.assertEqual((response['results'], response['next_cursor']), ([], cursor))
+
+        ids = moderator.post(
+            '/moderation/claim/', {'limit': RECORDS}, content_type='application/json'
+        ).json()['results']
+        ids = [result['id'] for result in ids]
+        response = self.sync(user.email, cursor)().json()
+        self.assertEqual({result['status'] for result in response['results']}, {'pending'})
+        cursor = response['next_cursor']
+
+        moderator.post('/moderation/resolve/', {
+            'ids': ids[:2], 'status': 'accepted'
+        }, content_type='application/json')
+        response = self.sync(user.email, cursor)().json()
+        self.assertEqual(
+            [(result['id'], result['status']) for result in response['results']],
+            [(pass_id, 'accepted') for pass_id in sorted(ids[:2])]
+        )
+        cursor = response['next_cursor']
+
+        # Новые записи submitData и пакетной загрузки тоже попадают в синхронизацию
+        pass_id = self.post('/submitData/', self.make_payload(0, user.email)).json()['id']
+        batch = self.post(
+            '/submitData/batch/', [self.make_payload(0, user.email)]
+        ).json()['results']
+        response = self.sync(user.email, cursor)().json()
+        self.assertEqual(
+            [result['id'] for result in response['results']], [pass_id, batch[0]['id']]
+        )
+
+    def test_pages(self):
+        user = self.make_user()
+        for _ in range(RECORDS):
+            self.make_pass(user, 0)
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            response = self.client.get('/submitData/sync/', {
+                'user__email': user.email, 'limit': 2, **({'cursor': cursor} if cursor else {})
+            }).json()
+            seen += [result['id'] for result in response['results']]
+            cursor, has_more = response['next_cursor'], response['has_more']
+        self.assertEqual(len(set(seen)), RECORDS)
+        self.assertEqual(
+            self.client.get('/submitData/sync/', {'user__email': user.email, 'cursor': 'x'}).status_code,
+            400
+        )
+
+
+class UploadTests(BudgetTestCase):
+    """Загрузка изображений по частям и ссылка на загрузку из submitData"""
+
+    def setUp(self):
+        super().setUp()
+        self.content = base64.b64decode(self.image_data)
+
+    def start_upload(self):
+        response = self.client.post(
+            '/uploads/', {'size': len(self.content), 'filename': 'photo.jpg'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['token']
+
+    def send_chunk(self, token, offset, chunk):
+        return self.client.patch(
+            f'/uploads/{token}/', chunk, content_type='application/offset+octet-stream',
+            headers={'Upload-Offset': str(offset)}
+        )
+
+    def test_resumable_upload(self):
+        self.assertWithinBudget(
+            ('upload_create', 0, 'new'),
+            lambda: self.client.post(
+                '/uploads/', {'size': len(self.content)}, content_type='application/json'
+            )
+        )
+        token = self.start_upload()
+        half = len(self.content) // 2
+
+        response = self.assertWithinBudget(
+            ('upload_chunk', 0, 'new'),
+            lambda: self.send_chunk(token, 0, self.content[:half])
+        )
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        # Повтор уже принятой части после обрыва: сервер сообщает смещение
+        response = self.send_chunk(token, 0, self.content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+        self.assertEqual(self.client.get(f'/uploads/{token}/').json()['offset'], half)
+
+        response = self.send_chunk(token, half, self.content[half:] + b'extra')
+        self.assertEqual(response.status_code, 400)
+        response = self.send_chunk(token, half, self.content[half:])
+        self.assertEqual(response.json()['offset'], len(self.content))
+
+    def test_content_length_required(self):
+        token = self.start_upload()
+        for content_length, expected in [('', 411), ('abc', 400), ('-1', 400)]:
+            with self.subTest(content_length=content_length):
+                response = self.client.patch(
+                    f'/uploads/{token}/', self.content[:10],
+                    content_type='application/offset+octet-stream',
+                    headers={'Upload-Offset': '0'}, CONTENT_LENGTH=content_length
+                )
+                self.assertEqual(response.status_code, expected, response.content)
+        self.assertEqual(self.client.get(f'/uploads/{token}/').json()['offset'], 0)
+
+    def test_multipart_upload(self):
+        response = self.client.post('/uploads/', {'file': io.BytesIO(self.content)})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['offset'], len(self.content))
+
+    def test_submit_data_with_upload_tokens(self):
+        payload = self.make_payload(0)
+        for index in range(10):
+            token = self.start_upload()
+            self.send_chunk(token, 0, self.content)
+            payload['images'].append({'title': f'Фото {index}', 'upload': token})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.assertWithinBudget(
+                ('submit_data_upload', 10, 'new'),
+                lambda: self.client.post('/submitData/', payload, content_type='application/json'),
+                reference=lambda: self.client.post(
+                    '/submitData/', self.make_payload(10), content_type='application/json'
+                )
+            )
+        pass_id = response.json()['id']
+        self.assertEqual(Image.objects.filter(pass_instance_id=pass_id).count(), 10)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_upload_file_not_held_open(self):
+        token = self.start_upload()
+        self.send_chunk(token, 0, self.content)
+        [image_file] = load_images([{'title': 'Фото', 'upload': token}])
+        self.assertTrue(image_file.closed)
+        self.assertEqual(b''.join(image_file.chunks()), self.content)
+        self.assertTrue(image_file.closed)
+
+    def test_incomplete_upload_rejected(self):
+        token = self.start_upload()
+        payload = self.make_payload(0)
+        payload['images'].append({'title': 'Фото', 'upload': token})
+        response = self.client.post('/submitData/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Upload.objects.filter(token=token).exists())
+
+
+class FakeFuture:
+    """Результат задания; после падения процесса пула - BrokenProcessPool"""
+
+    def __init__(self, pool, call):
+        self.pool = pool
+        self.call = call
+
+    def result(self):
+        if self.pool.broken:
+            raise BrokenProcessPool()
+        return self.call()
+
+
+class FakePool:
+    """Пул в текущем процессе; изображение crash_on "убивает" процесс"""
+
+    def __init__(self, crash_on):
+        self.crash_on = crash_on
+        self.broken = False
+        self.restarts = 0
+
+    def submit(self, fn, source, *args):
+        if self.broken:
+            raise BrokenProcessPool()
+        if source == self.crash_on:
+            self.broken = True
+        return FakeFuture(self, lambda: fn(source, *args))
+
+    def restart(self):
+        self.broken = False
+        self.restarts += 1
+
+
+class ProcessingTests(BudgetTestCase):
+    """Фоновая обработка изображений"""
+
+    def submit(self, image_data):
+        payload = self.make_payload(0)
+        payload['images'].append({'title': 'Фото', 'data': image_data})
+        response = self.client.post('/submitData/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return Image.objects.get(pass_instance_id=response.json()['id'])
+
+    def exif_jpeg_base64(self):
+        exif = PILImage.Exif()
+        exif[0x0110] = 'Camera'
+        exif[0x0112] = 6  # Повернуто на 90 градусов
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (80, 40), (120, 80, 40)).save(buffer, 'JPEG', exif=exif)
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    def test_original_without_exif(self):
+        image = self.submit(self.exif_jpeg_base64())
+        name = image.data.name
+
+        call_command('process_images', '--once', '--workers', '1', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual(image.data.name, name)
+        self.assertEqual((image.width, image.height), (40, 80))
+        with PILImage.open(image.data.path) as img:
+            self.assertEqual(dict(img.getexif()), {})
+            self.assertEqual(img.size, (40, 80))
+        self.assertTrue(image.thumbnail)
+
+    @override_settings(FSTR_IMAGE_STORAGE_MODE='cas')
+    def test_blob_original_without_exif(self):
+        image_data = self.exif_jpeg_base64()
+        images = [self.submit(image_data) for _ in range(2)]
+        old_blob = ImageBlob.objects.get()
+        self.assertEqual(old_blob.ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_images', '--once', '--workers', '1', stdout=io.StringIO())
+
+        # Общий файл не перезаписан на месте: оба изображения ссылаются
+        # на блоб содержимого без EXIF, прежний блоб и его файл удалены
+        blob = ImageBlob.objects.get()
+        self.assertNotEqual(blob.sha256, old_blob.sha256)
+        self.assertEqual(blob.ref_count, 2)
+        for image in images:
+            image.refresh_from_db()
+            self.assertEqual((image.blob_id, image.data.name), (blob.id, blob.file.name))
+            self.assertEqual((image.width, image.height), (40, 80))
+        self.assertFalse(old_blob.file.storage.exists(old_blob.file.name))
+        with PILImage.open(blob.file.path) as img:
+            self.assertEqual(dict(img.getexif()), {})
+
+    def test_crashed_worker(self):
+        images = [self.submit(self.image_data) for _ in range(3)]
+        pool = FakePool(crash_on=images[1].data.path)
+        self.assertEqual(process_pending_jobs(pool, 10), 3)
+
+        jobs = {job.image_id: job for job in ImageJob.objects.all()}
+        # Попытка засчитана только изображению, на котором падает процесс
+        self.assertEqual(
+            [(jobs[image.id].status, jobs[image.id].attempts) for image in images],
+            [('done', 0), ('new', 1), ('done', 0)]
+        )
+        self.assertFalse(pool.broken)
+
+    def test_stale_job_counts_attempt(self):
+        image = self.submit(self.image_data)
+        stale = timezone.now() - timedelta(days=1)
+        ImageJob.objects.update(status='processing', updated_at=stale)
+        self.assertEqual(len(claim_jobs(10)), 1)
+        self.assertEqual(ImageJob.objects.get(image=image).attempts, 1)
+
+        ImageJob.objects.update(status='processing', updated_at=stale, attempts=2)
+        with override_settings(FSTR_IMAGE_JOB_MAX_ATTEMPTS=3):
+            self.assertEqual(claim_jobs(10), [])
+        self.assertEqual(ImageJob.objects.get(image=image).status, 'failed')
+
+
+@override_settings(FSTR_MEDIA_ACCEL='off')
+class MediaTests(BudgetTestCase):
+    """Отдача изображений из MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        pass_id = self.client.post(
+            '/submitData/', self.make_payload(1), content_type='application/json'
+        ).json()['id']
+        self.name = Image.objects.get(pass_instance_id=pass_id).data.name
+        self.url = f'/media/{self.name}'
+        self.content = base64.b64decode(self.image_data)
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, headers=headers)
+
+    def test_sharded_name(self):
+        self.assertRegex(self.name, r'^passes/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.jpg$')
+
+    def test_cached_file(self):
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.get(**{'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.head(self.url).status_code, 200)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_range(self):
+        size = len(self.content)
+        response = self.get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.get(Range='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.get(Range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # Файл изменился с момента получения ETag - отдается целиком
+        response = self.get(Range='bytes=10-19', **{'If-Range': '"old"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_found(self):
+        self.assertEqual(self.get('/media/passes/missing.jpg').status_code, 404)
+        self.assertEqual(self.get('/media/../manage.py').status_code, 404)
+        token = self.client.post(
+            '/uploads/', {'size': len(self.content)}, content_type='application/json'
+        ).json()['token']
+        # Незавершенные загрузки не отдаются
+        self.assertEqual(self.get(f'/media/uploads/{token}.part').status_code, 404)
+
+    def test_active_content_rejected(self):
+        for media_type in ('x/html', 'svg+xml', 'x/svg'):
+            payload = self.make_payload(0)
+            payload['images'].append({
+                'title': 'Фото', 'data': f'data:image/{media_type};base64,{self.image_data}'
+            })
+            response = self.client.post('/submitData/', payload, content_type='application/json')
+            self.assertEqual(response.status_code, 400, media_type)
+        response = self.client.post(
+            '/uploads/', {'size': len(self.content), 'filename': 'photo.html'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        # Файл не-изображения, попавший в MEDIA_ROOT, скачивается, а не открывается
+        with open(f'{self.media_root}/passes/page.html', 'wb') as file:
+            file.write(b'<script>alert(1)</script>')
+        response = self.get('/media/passes/page.html')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Content-Disposition'], 'attachment')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(self.get()['Content-Type'], 'image/jpeg')
+
+    def test_proxy_handoff(self):
+        with override_settings(FSTR_MEDIA_ACCEL='x-accel-redirect'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+        with override_settings(FSTR_MEDIA_ACCEL='x-sendfile'):
+            response = self.get()
+        self.assertTrue(response['X-Sendfile'].endswith(self.name))
+
+
+class LogTests(SimpleTestCase):
+    """Сводки submitData, выборка частых событий и запись журнала через очередь"""
+
+    def make_record(self, level=logging.INFO, event=None, message='Запись'):
+        record = logging.LogRecord('passes.views', level, __file__, 0, message, (), None)
+        if event:
+            record.event = event
+        return record
+
+    def test_sampling(self):
+        sampling = SamplingFilter({'submit_data.received': 0.5, 'submit_data.replayed': 0})
+        with mock.patch('passes.logs.random.random', return_value=0.3):
+            self.assertTrue(sampling.filter(self.make_record(event='submit_data.received')))
+        with mock.patch('passes.logs.random.random', return_value=0.7):
+            self.assertFalse(sampling.filter(self.make_record(event='submit_data.received')))
+            # События без доли, предупреждения и ошибки проходят всегда
+            self.assertTrue(sampling.filter(self.make_record(event='submit_data.created')))
+            self.assertTrue(sampling.filter(self.make_record()))
+            self.assertTrue(sampling.filter(
+                self.make_record(logging.WARNING, event='submit_data.received')
+            ))
+        self.assertFalse(sampling.filter(self.make_record(event='submit_data.replayed')))
+
+    def test_queue_flush(self):
+        directory = tempfile.mkdtemp(prefix='fstr-logs-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        filename = os.path.join(directory, 'fstr.log')
+        handler = QueueLogHandler(filename=filename)
+        handler.setFormatter(JsonFormatter())
+        payload = make_payload(1, 2, jpeg_base64())
+        for index in range(100):
+            record = self.make_record(event='submit_data.received', message=f'Запись {index}')
+            vars(record).update(summarize_submission(payload))
+            handler.handle(record)
+        # Закрытие обработчика дожидается записи всей очереди
+        handler.close()
+
+        with open(filename, encoding='utf-8') as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual(
+            [entry['message'] for entry in entries],
+            [f'Запись {index}' for index in range(100)]
+        )
+        self.assertEqual(entries[0]['images'], 2)
+        self.assertEqual(len(entries[0]['user_email_hash']), 16)
+        # В журнал не попадают изображения и email
+        with open(filename, encoding='utf-8') as file:
+            content = file.read()
+        self.assertNotIn(payload['images'][0]['data'][:40], content)
+        self.assertNotIn(payload['user']['email'], content)
+
+    def test_queue_full(self):
+        handler = QueueLogHandler(max_queue=2)
+        # Без слушателя очередь не разбирается: лишние записи отбрасываются
+        handler.listener.stop()
+        for _ in range(5):
+            handler.handle(self.make_record())
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+        handler.close()
+
+
+class AsyncSubmitTests(TransactionTestCase):
+    """
+    Асинхронный submitData отвечает так же, как синхронный.
+
+    TransactionTestCase: блокирующие шаги асинхронного представления
+    выполняются в потоках пула со своими соединениями с БД.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(prefix='fstr-tests-')
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            FSTR_IMAGE_STORAGE_MODE='files',
+            FSTR_METRICS_DIR='',
+        )
+        cls.settings_override.enable()
+        cls.image_data = jpeg_base64()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.sequence = 0
+
+    def make_payload(self, images=0):
+        self.sequence += 1
+        return make_payload(self.sequence, images, self.image_data)
+
+    def post_sync(self, body, key=None):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post(
+            '/submitData/', body, content_type='application/json', headers=headers
+        )
+
+    def post_async(self, body, key=None):
+        headers = {'Idempotency-Key': key} if key else {}
+        request = AsyncRequestFactory().post(
+            '/submitData/', body, content_type='application/json', headers=headers
+        )
+        return async_to_sync(submit_data_async)(request)
+
+    def summarize(self, response):
+        """Ответ без значений id: у записей разные id"""
+        data = json.loads(response.content)
+        for field in ('id', 'duplicate_of'):
+            if data.get(field) is not None:
+                data[field] = True
+        return response.status_code, data, response.get('Idempotent-Replayed')
+
+    def assertSameResponse(self, make_body):
+        """Отправляет тело из make_body() в оба представления и сравнивает ответы"""
+        sync_response = self.post_sync(make_body())
+        async_response = self.post_async(make_body())
+        self.assertEqual(self.summarize(async_response), self.summarize(sync_response))
+        return sync_response, async_response
+
+    def test_created(self):
+        sync_response, async_response = self.assertSameResponse(
+            lambda: json.dumps(self.make_payload(2))
+        )
+        self.assertEqual(sync_response.status_code, 200, sync_response.content)
+        sync_pass, async_pass = (
+            Pass.objects.filter(id=json.loads(response.content)['id']).values(
+                'status', 'beauty_title', 'level_summer', 'level_autumn',
+                'user__fam', 'coords__height'
+            ).get()
+            for response in (sync_response, async_response)
+        )
+        self.assertEqual(async_pass, sync_pass)
+        for response in (sync_response, async_response):
+            pass_id = json.loads(response.content)['id']
+            self.assertEqual(Image.objects.filter(pass_instance_id=pass_id).count(), 2)
+            self.assertEqual(ImageJob.objects.filter(image__pass_instance_id=pass_id).count(), 2)
+            self.assertGreater(Pass.objects.get(id=pass_id).change_seq, 0)
+        self.assertEqual(PassStats.objects.get(dimension='status', key='new').count, 2)
+
+        # Похожее название рядом - возможный дубликат в обоих ответах
+        original = self.make_payload()
+
+        def duplicate():
+            payload = self.make_payload()
+            payload.update(title=original['title'], coords=original['coords'])
+            return json.dumps(payload)
+
+        self.post_sync(json.dumps(original))
+        _, async_response = self.assertSameResponse(duplicate)
+        self.assertIn('duplicate_of', json.loads(async_response.content))
+
+    def test_rejected(self):
+        def without_coords():
+            payload = self.make_payload()
+            del payload['coords']
+            return json.dumps(payload)
+
+        def invalid_height():
+            payload = self.make_payload()
+            payload['coords']['height'] = 'высоко'
+            return json.dumps(payload)
+
+        def unknown_level():
+            payload = self.make_payload()
+            payload['level']['summer'] = '9Я'
+            return json.dumps(payload)
+
+        def bad_image():
+            payload = self.make_payload()
+            payload['images'] = [{'data': 'data:image/svg+xml;base64,PHN2Zy8+', 'title': 'svg'}]
+            return json.dumps(payload)
+
+        def broken_image(data):
+            def make_body():
+                payload = self.make_payload()
+                payload['images'] = [{'data': data, 'title': 'Фото'}]
+                return json.dumps(payload)
+            return make_body
+
+        cases = {
+            'missing': without_coords,
+            'invalid': invalid_height,
+            'level': unknown_level,
+            'image': bad_image,
+            'base64': broken_image('AAAAA'),
+            'data_uri': broken_image('data:image/jpeg,AAAA'),
+            'json': lambda: '{"title": ',
+            'list': lambda: '[]',
+        }
+        for name, make_body in cases.items():
+            with self.subTest(name):
+                sync_response, _ = self.assertSameResponse(make_body)
+                self.assertEqual(sync_response.status_code, 400, sync_response.content)
+        self.assertFalse(Pass.objects.exists())
+
+    def test_idempotency(self):
+        for post in (self.post_sync, self.post_async):
+            with self.subTest(post.__name__):
+                payload = self.make_payload()
+                key = f'retry-{post.__name__}'
+                first = post(json.dumps(payload), key)
+                replay = post(json.dumps(payload), key)
+                self.assertEqual(replay.status_code, 200, replay.content)
+                self.assertEqual(json.loads(replay.content)['id'], json.loads(first.content)['id'])
+                self.assertEqual(replay['Idempotent-Replayed'], 'true')
+
+                payload['title'] = 'Другой перевал'
+                reused = post(json.dumps(payload), key)
+                self.assertEqual(reused.status_code, 422, reused.content)
+        self.assertEqual(Pass.objects.count(), 2)
+
+
+@skipUnless(get_replica_alias(), "Реплика не настроена (FSTR_DB_REPLICA_NAME или FSTR_DB_REPLICA_HOST)")
+class DatabaseRoutingTests(TransactionTestCase):
+    """
+    Чтение с реплики и закрепление клиента за основной БД после записи.
+
+    TransactionTestCase: внутри транзакции TestCase маршрутизатор всегда
+    читает с основной БД.
+    """
+    # Без реплики класс пропускается, но атрибут вычисляется при импорте
+    databases = {DEFAULT_DB_ALIAS, get_replica_alias() or DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        cache.clear()
+        self.replica = get_replica_alias()
+
+    def capture(self):
+        return (
+            CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]),
+            CaptureQueriesContext(connections[self.replica]),
+        )
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Pass), DEFAULT_DB_ALIAS)
+        with read_from(self.replica):
+            self.assertEqual(router.db_for_read(Pass), self.replica)
+            self.assertEqual(router.db_for_write(Pass), DEFAULT_DB_ALIAS)
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Pass), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(self.replica, 'passes'))
+
+    def test_reads_use_replica_until_client_writes(self):
+        primary, replica = self.capture()
+        with primary, replica:
+            response = self.client.get('/submitData/', {'user__email': 'pin@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica.captured_queries)
+        self.assertFalse(primary.captured_queries)
+
+        payload = make_payload(1, 0, jpeg_base64(), 'pin@example.com')
+        primary, replica = self.capture()
+        with primary, replica:
+            response = self.client.post('/submitData/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(replica.captured_queries)
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+        # Клиент с cookie читает с основной БД и видит свою запись
+        primary, replica = self.capture()
+        with primary, replica:
+            response = self.client.get(f"/submitData/{response.json()['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(primary.captured_queries)
+        self.assertFalse(replica.captured_queries)
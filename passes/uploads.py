@@ -0,0 +1,255 @@
+import fcntl
+import hashlib
+import os
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .images import ImageTooLarge, decode_base64_image, image_extension
+from .models import Upload
+
+# Размер блока при чтении тела запроса и файлов загрузок
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    """Загрузка не найдена, просрочена, не завершена или часть некорректна"""
+
+
+class UploadConflict(UploadError):
+    """Смещение части не совпадает с полученным сервером"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+def get_upload_dir():
+    """Каталог незавершенных загрузок; по умолчанию MEDIA_ROOT/uploads"""
+    return settings.FSTR_UPLOAD_DIR or os.path.join(settings.MEDIA_ROOT, 'uploads')
+
+
+def get_path(token):
+    return os.path.join(get_upload_dir(), f'{token}.part')
+
+
+def create_upload(size, filename=''):
+    """
+    Начинает загрузку по частям.
+
+    Args:
+        size (int): Полный размер файла в байтах
+        filename (str): Исходное имя файла, из него берется расширение
+
+    Returns:
+        Upload: Новая загрузка с пустым файлом
+
+    Raises:
+        UnsupportedImageType: Расширение файла не входит в IMAGE_EXTENSIONS
+    """
+    image_extension(os.path.splitext(filename)[1].lstrip('.'))
+    if size <= 0:
+        raise UploadError("Некорректный размер загрузки")
+    if size > settings.FSTR_IMAGE_MAX_BYTES:
+        raise ImageTooLarge(
+            f"Превышен размер изображения: {settings.FSTR_IMAGE_MAX_BYTES} байт"
+        )
+    token = secrets.token_urlsafe(32)
+    os.makedirs(get_upload_dir(), exist_ok=True)
+    open(get_path(token), 'wb').close()
+    return Upload.objects.create(
+        token=token,
+        filename=filename[:255],
+        size=size,
+        expires_at=timezone.now() + timedelta(seconds=settings.FSTR_UPLOAD_TTL)
+    )
+
+
+def create_upload_from_file(uploaded_file):
+    """Загрузка целиком из файла multipart/form-data; сразу завершена"""
+    upload = create_upload(uploaded_file.size, uploaded_file.name or '')
+    with open(get_path(upload.token), 'wb') as file:
+        for chunk in uploaded_file.chunks(CHUNK_SIZE):
+            file.write(chunk)
+    Upload.objects.filter(id=upload.id).update(offset=upload.size)
+    upload.offset = upload.size
+    return upload
+
+
+def get_upload(token):
+    """Действующая загрузка по токену"""
+    # Смещение читаем с основной БД: реплика может отставать от последней части
+    upload = Upload.objects.db_manager(DEFAULT_DB_ALIAS).filter(
+        token=token, expires_at__gt=timezone.now()
+    ).first()
+    if upload is None:
+        raise UploadError("Загрузка не найдена или просрочена")
+    return upload
+
+
+def write_chunk(upload, offset, stream, content_length=None):
+    """
+    Дописывает часть файла из потока тела запроса.
+
+    Часть читается блоками и сразу пишется на диск. Полученное сохраняется
+    и при обрыве соединения: клиент продолжает с нового смещения. Запись
+    в одну загрузку из параллельных запросов исключена блокировкой файла.
+
+    Args:
+        upload (Upload): Загрузка
+        offset (int): Смещение части, заявленное клиентом
+        stream: Поток тела запроса
+        content_length (int|None): Размер части, если известен
+
+    Returns:
+        int: Новое смещение
+
+    Raises:
+        UploadConflict: Смещение не совпадает с полученным сервером
+        UploadError: Часть больше оставшегося размера
+    """
+    remaining = upload.size - offset
+    if content_length is not None and content_length > remaining:
+        raise UploadError("Часть больше оставшегося размера загрузки")
+
+    with open(get_path(upload.token), 'r+b') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Часть этой загрузки уже принимается", upload.offset)
+
+        # Смещение перечитываем под блокировкой: параллельный запрос мог
+        # успеть дописать часть
+        upload.refresh_from_db(fields=['offset'])
+        if offset != upload.offset:
+            raise UploadConflict(
+                f"Ожидается смещение {upload.offset}", upload.offset
+            )
+
+        # Байты после сохраненного смещения остались от прерванной записи
+        file.seek(offset)
+        file.truncate()
+        written = 0
+        try:
+            while written < remaining:
+                chunk = stream.read(min(CHUNK_SIZE, remaining - written))
+                if not chunk:
+                    break
+                file.write(chunk)
+                written += len(chunk)
+            if written == remaining and stream.read(1):
+                raise UploadError("Часть больше оставшегося размера загрузки")
+        finally:
+            file.flush()
+            Upload.objects.filter(id=upload.id, offset=offset).update(offset=offset + written)
+            upload.offset = offset + written
+    return upload.offset
+
+
+class UploadFile(File):
+    """
+    Файл завершенной загрузки. Открывается только на время чтения
+    содержимого, поэтому до сохранения изображения не держит дескриптор.
+    """
+
+    def __init__(self, path, name, size):
+        super().__init__(None, name=name)
+        self.path = path
+        self.size = size
+
+    def chunks(self, chunk_size=None):
+        with open(self.path, 'rb') as file:
+            yield from File(file).chunks(chunk_size)
+
+
+def _open_upload(upload, title):
+    """Файл завершенной загрузки с хешем содержимого, как у decode_base64_image"""
+    if not upload.is_complete:
+        raise UploadError(
+            f"Загрузка не завершена: получено {upload.offset} из {upload.size} байт"
+        )
+    path = get_path(upload.token)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    ext = image_extension(os.path.splitext(upload.filename)[1].lstrip('.'))
+    image_file = UploadFile(path, f'{title}.{ext}', upload.size)
+    image_file.sha256 = digest.hexdigest()
+    image_file.upload_token = upload.token
+    return image_file
+
+
+def load_images(images, budget=None):
+    """
+    Файлы изображений записи: из base64 в поле data или из загрузок
+    по токену в поле upload. Загрузки читаются одним запросом.
+
+    Args:
+        images (list): dict с полями title и data или upload
+        budget (ImageBudget|None): Учет объема изображений запроса
+
+    Returns:
+        list: Файлы в порядке images
+    """
+    tokens = [image['upload'] for image in images if image.get('upload')]
+    uploads = {}
+    if tokens:
+        uploads = {
+            upload.token: upload
+            for upload in Upload.objects.filter(
+                token__in=tokens, expires_at__gt=timezone.now()
+            )
+        }
+
+    files = []
+    for image in images:
+        title = image.get('title', '')
+        if image.get('upload'):
+            upload = uploads.get(image['upload'])
+            if upload is None:
+                raise UploadError("Загрузка не найдена или просрочена")
+            if budget is not None:
+                budget.consume(upload.size)
+            files.append(_open_upload(upload, title))
+        else:
+            files.append(decode_base64_image(image['data'], title, budget=budget))
+    return files
+
+
+def consume_uploads(files):
+    """
+    Удаляет использованные загрузки после фиксации транзакции.
+
+    До фиксации загрузка остается: если сохранение не удалось, клиент
+    может повторить submitData с тем же токеном.
+    """
+    tokens = [
+        file.upload_token for file in files
+        if getattr(file, 'upload_token', None)
+    ]
+    if tokens:
+        transaction.on_commit(lambda: delete_uploads(tokens))
+
+
+def delete_uploads(tokens):
+    """Удаляет загрузки и их файлы"""
+    Upload.objects.filter(token__in=tokens).delete()
+    for token in tokens:
+        try:
+            os.remove(get_path(token))
+        except FileNotFoundError:
+            pass
+
+
+def purge_expired():
+    """Удаляет просроченные загрузки; возвращает число удаленных"""
+    tokens = list(
+        Upload.objects.filter(expires_at__lte=timezone.now()).values_list('token', flat=True)
+    )
+    delete_uploads(tokens)
+    return len(tokens)
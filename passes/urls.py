@@ -1,6 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from .views import submit_data
+from .views import (
+    submit_data, submit_data_batch, sync_passes, get_pass, passes_in_bbox,
+    nearest_passes, moderation_claim, moderation_resolve, metrics_endpoint,
+    upload_create, upload_detail, export_passes, search_passes, stats_endpoint
+)
+from .async_views import submit_data_async
+
+# Под ASGI прием перевалов обрабатывает асинхронное представление
+submit_data_view = submit_data_async if settings.FSTR_ASYNC_SUBMIT else submit_data
 
 urlpatterns = [
-    path('submitData/', submit_data, name='submit_data'),
+    path('submitData/', submit_data_view, name='submit_data'),
+    path('submitData/batch/', submit_data_batch, name='submit_data_batch'),
+    path('submitData/sync/', sync_passes, name='sync_passes'),
+    path('submitData/<int:pass_id>/', get_pass, name='get_pass'),
+    path('submitData/bbox/', passes_in_bbox, name='passes_in_bbox'),
+    path('submitData/nearest/', nearest_passes, name='nearest_passes'),
+    path('submitData/search/', search_passes, name='search_passes'),
+    path('uploads/', upload_create, name='upload_create'),
+    path('uploads/<str:token>/', upload_detail, name='upload_detail'),
+    path('moderation/claim/', moderation_claim, name='moderation_claim'),
+    path('moderation/resolve/', moderation_resolve, name='moderation_resolve'),
+    path('metrics', metrics_endpoint, name='metrics'),
+    path('export/', export_passes, name='export_passes'),
+    path('stats/', stats_endpoint, name='stats'),
 ] 
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Определение пользователя по email при приеме перевалов.
+
+Соответствие email -> (id, данные профиля) хранится в кеше Django
+FSTR_USER_CACHE_TTL секунд. Кеш сбрасывается сигналами при изменении
+пользователя, поэтому включается только с общим для воркеров кешем
+(FSTR_REDIS_URL). Если профиль в запросе совпадает с кешем, запросов
+к БД нет. Иначе пользователь создается или обновляется одним
+INSERT ... ON CONFLICT (email) DO UPDATE ... RETURNING.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+
+from .models import User
+
+CACHE_PREFIX = 'fstr:user:'
+# Поля профиля, которые обновляются по данным из запроса
+PROFILE_FIELDS = ['fam', 'name', 'otc', 'phone']
+
+
+def _profile(user_data):
+    return tuple(user_data.get(field, '') for field in PROFILE_FIELDS)
+
+
+def upsert_users(users_data):
+    """
+    Создает пользователей или обновляет их профиль одним запросом.
+
+    Пустые и отсутствующие в запросе поля профиля (например, otc) не
+    затирают сохраненные значения.
+
+    Args:
+        users_data (list): Данные пользователей с уникальными email
+
+    Returns:
+        dict: Соответствие email -> id пользователя
+    """
+    connection = connections[router.db_for_write(User)]
+    quote = connection.ops.quote_name
+    table = quote(User._meta.db_table)
+    fields = ['email'] + PROFILE_FIELDS
+    columns = [quote(User._meta.get_field(field).column) for field in fields]
+    # Строки вставляются в порядке email: параллельные пакеты блокируют
+    # строки пользователей в одном порядке и не взаимоблокируются
+    rows = sorted(users_data, key=lambda user_data: user_data['email'])
+    row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) '
+        f'VALUES {", ".join([row_sql] * len(rows))} '
+        f'ON CONFLICT ({columns[0]}) DO UPDATE SET '
+        + ', '.join(
+            f"{column} = COALESCE(NULLIF(EXCLUDED.{column}, ''), {table}.{column})"
+            for column in columns[1:]
+        )
+        + f' RETURNING {quote(User._meta.pk.column)}, {columns[0]}'
+    )
+    params = [
+        user_data['email'] if field == 'email' else user_data.get(field, '')
+        for user_data in rows
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {email: user_id for user_id, email in cursor.fetchall()}
+
+
+def resolve_users(users_data):
+    """
+    Находит, создает или обновляет пользователей по email.
+
+    Args:
+        users_data (list): Данные пользователей (dict с ключом email),
+            email могут повторяться
+
+    Returns:
+        dict: Соответствие email -> id пользователя
+    """
+    by_email = {}
+    for user_data in users_data:
+        # Для повторяющихся email берем данные последней записи:
+        # записи пакета накапливаются приложением по порядку
+        by_email[user_data['email']] = user_data
+
+    use_cache = settings.FSTR_USER_CACHE_TTL > 0
+    cached = {}
+    if use_cache:
+        cached = cache.get_many([CACHE_PREFIX + email for email in by_email])
+    user_ids = {}
+    changed = []
+    for email, user_data in by_email.items():
+        entry = cached.get(CACHE_PREFIX + email)
+        if entry is not None and entry[1] == _profile(user_data):
+            user_ids[email] = entry[0]
+        else:
+            changed.append(user_data)
+
+    if changed:
+        upserted = upsert_users(changed)
+        user_ids.update(upserted)
+        if not use_cache:
+            return user_ids
+        entries = {
+            CACHE_PREFIX + user_data['email']: (
+                upserted[user_data['email']], _profile(user_data)
+            )
+            for user_data in changed
+        }
+        # В кеш попадают только зафиксированные пользователи
+        transaction.on_commit(
+            lambda: cache.set_many(entries, settings.FSTR_USER_CACHE_TTL)
+        )
+    return user_ids
+
+
+def forget(email):
+    """Удаляет пользователя из кеша"""
+    cache.delete(CACHE_PREFIX + email)
@@ -1,26 +1,211 @@
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.db import transaction, IntegrityError
-from .models import User, Coords, Level, Pass, Image
-from .serializers import PassSerializer, SubmitDataResponseSerializer
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_safe
+from .models import User, Coords, Pass, Image, Difficulty, LEVEL_SEASONS
+from django.conf import settings
+from .serializers import (
+    PassSerializer, PassLocationSerializer, SubmitDataResponseSerializer
+)
+from .images import ImageBudget, ImageTooLarge, UnsupportedImageType
+from .uploads import UploadConflict, UploadError, load_images
+from . import uploads
+from .bulk import bulk_create_passes
+from .duplicates import find_duplicate_kwargs
+from .pagination import changes_page, keyset_page
+from . import idempotency
+from . import moderation
+from . import geo
+from . import metrics
+from . import export
+from . import stats
+from . import media
+from .logs import summarize_batch, summarize_submission
 import logging
+import math
 
 # Create your views here.
 
 # Настраиваем логирование
 logger = logging.getLogger(__name__)
 
+# Обязательные поля запроса submitData
+REQUIRED_FIELDS = ['title', 'user', 'coords', 'level']
+
+# Сколько кандидатов на каждый из k ближайших перевалов отбирает БД по
+# приближенному расстоянию; запас покрывает его погрешность
+NEAREST_CANDIDATES_PER_RESULT = 2
+
+
+def get_missing_fields(data):
+    """Возвращает список обязательных полей, отсутствующих в данных"""
+    return [field for field in REQUIRED_FIELDS if field not in data]
+
 
 class PassDataHandler:
     """
     Класс для работы с данными перевалов.
-    Реализует методы для добавления новых записей в БД.
+    Реализует методы для добавления и чтения записей в БД.
     """
     
     @staticmethod
-    def create_pass(data):
+    def get_queryset():
+        """
+        Выборка перевалов со всеми связанными данными.
+        
+        Пользователь и координаты загружаются одним JOIN,
+        изображения - одним дополнительным запросом на всю выборку.
+        """
+        return (
+            Pass.objects
+            .select_related('user', 'coords')
+            .prefetch_related('images')
+        )
+    
+    @staticmethod
+    def get_pass(pass_id):
+        """
+        Возвращает перевал по id или None, если запись не найдена.
+        """
+        return PassDataHandler.get_queryset().filter(id=pass_id).first()
+    
+    @staticmethod
+    def get_passes(user_email=None, pass_status=None, cursor=None, limit=None, level=None):
+        """
+        Возвращает страницу перевалов, от новых к старым.
+        
+        Args:
+            user_email (str|None): Фильтр по email пользователя
+            pass_status (str|None): Фильтр по статусу модерации
+            level (tuple|None): Фильтр по категории трудности:
+                (сезон, наименьший код, наибольший код)
+            cursor (str|None): Курсор, полученный с предыдущей страницей
+            limit (int|None): Размер страницы
+            
+        Returns:
+            tuple: (passes: list, next_cursor: str|None)
+            
+        Raises:
+            ValueError: Некорректный курсор
+        """
+        queryset = PassDataHandler.get_queryset()
+        if user_email:
+            queryset = queryset.filter(user__email=user_email)
+        if pass_status:
+            queryset = queryset.filter(status=pass_status)
+        if level:
+            queryset = queryset.with_level(*level)
+        return keyset_page(queryset, cursor, limit or settings.FSTR_PAGE_SIZE)
+    
+    @staticmethod
+    def get_changes(user_email, cursor=None, limit=None):
+        """
+        Возвращает перевалы пользователя, измененные после курсора
+        синхронизации (новые записи и смена статуса модерации).
+        
+        Args:
+            user_email (str): Email пользователя
+            cursor (str|None): Курсор предыдущей синхронизации
+            limit (int|None): Размер страницы
+            
+        Returns:
+            tuple: (passes: list, next_cursor: str, has_more: bool)
+            
+        Raises:
+            ValueError: Некорректный курсор
+        """
+        queryset = PassDataHandler.get_queryset().filter(user__email=user_email)
+        return changes_page(queryset, cursor, limit or settings.FSTR_PAGE_SIZE)
+    
+    @staticmethod
+    def get_passes_in_bbox(min_lat, min_lon, max_lat, max_lon, limit, pass_status=None):
+        """
+        Возвращает перевалы, координаты которых попадают в прямоугольник.
+        
+        Если min_lon > max_lon, прямоугольник пересекает антимеридиан.
+        
+        Returns:
+            list: Не более limit объектов Pass с загруженными координатами
+        """
+        queryset = Pass.objects.select_related('coords').within_boxes(
+            geo.split_antimeridian(min_lat, min_lon, max_lat, max_lon)
+        )
+        if pass_status:
+            queryset = queryset.filter(status=pass_status)
+        # Сортировка по add_time потребовала бы отсортировать все найденное
+        return list(queryset.order_by()[:limit])
+    
+    @staticmethod
+    def get_nearest_passes(latitude, longitude, k, max_radius_km=None):
+        """
+        Возвращает k ближайших к точке перевалов.
+        
+        Поиск идет по кругу растущего радиуса, не больше
+        FSTR_NEAREST_MAX_STEPS шагов: для каждого радиуса кандидаты
+        выбираются по индексу geohash в описанном прямоугольнике, БД
+        сортирует их по приближенному расстоянию и отдает не больше
+        NEAREST_CANDIDATES_PER_RESULT * k. Точное расстояние считается
+        только для них. Как только внутри круга найдено k перевалов,
+        они и есть ближайшие; если шаги закончились, возвращаются
+        найденные.
+        
+        Returns:
+            list: Объекты Pass с атрибутом distance_km, от ближних к дальним
+        """
+        max_radius_km = min(max_radius_km or math.inf, math.pi * geo.EARTH_RADIUS_KM)
+        radius_km = min(settings.FSTR_NEAREST_START_RADIUS_KM, max_radius_km)
+        candidates_limit = k * NEAREST_CANDIDATES_PER_RESULT
+        
+        for _ in range(settings.FSTR_NEAREST_MAX_STEPS):
+            candidates = []
+            for pass_id, lat, lon in (
+                Pass.objects.within_boxes(geo.bounding_box(latitude, longitude, radius_km))
+                .order_by_distance(latitude, longitude)
+                .values_list('id', 'coords__latitude', 'coords__longitude')[:candidates_limit]
+            ):
+                distance = geo.distance_km(latitude, longitude, lat, lon)
+                if distance <= radius_km:
+                    candidates.append((distance, pass_id))
+            
+            if len(candidates) >= k or radius_km >= max_radius_km:
+                break
+            radius_km = min(radius_km * 4, max_radius_km)
+        
+        candidates.sort()
+        distances = dict((pass_id, distance) for distance, pass_id in candidates[:k])
+        passes = Pass.objects.select_related('coords').in_bulk(list(distances))
+        result = []
+        for pass_id, distance in distances.items():
+            pass_instance = passes[pass_id]
+            pass_instance.distance_km = round(distance, 3)
+            result.append(pass_instance)
+        return result
+    
+    @staticmethod
+    def search_passes(query, pass_status=None, limit=None):
+        """
+        Полнотекстовый поиск перевалов по названиям и описанию маршрута.
+        
+        Args:
+            query (str): Поисковый запрос
+            pass_status (str|None): Фильтр по статусу модерации
+            limit (int|None): Максимальное число результатов
+            
+        Returns:
+            list: Перевалы от наиболее релевантных
+        """
+        queryset = Pass.objects.select_related('coords')
+        if pass_status:
+            queryset = queryset.filter(status=pass_status)
+        return list(queryset.search(query)[:limit or settings.FSTR_PAGE_SIZE])
+    
+    @staticmethod
+    def create_pass(data, idempotency_key=None, body_hash=''):
         """
         Создает новую запись о перевале.
         Автоматически устанавливает status = "new" для новых записей.
@@ -28,25 +213,68 @@ class PassDataHandler:
         
         Args:
             data (dict): Данные о перевале в формате JSON
+            idempotency_key (str|None): Ключ идемпотентности запроса; если
+                параллельный повтор успел создать запись, возвращается она
+            body_hash (str): SHA-256 тела запроса, сохраняется с ключом
             
         Returns:
             tuple: (success: bool, result: Pass|str, pass_id: int|None)
         """
         try:
-            with transaction.atomic():
+            with metrics.timer('transaction'), transaction.atomic():
                 # Используем сериализатор для валидации и создания
-                serializer = PassSerializer(data=data)
+                serializer = PassSerializer(
+                    data=data, context={'image_budget': ImageBudget()}
+                )
                 
-                if serializer.is_valid():
-                    pass_instance = serializer.save()
-                    logger.info(f"Создан новый перевал ID: {pass_instance.id}")
+                with metrics.timer('validation'):
+                    is_valid = serializer.is_valid()
+                if is_valid:
+                    # Отмечаем возможный дубликат уже добавленного перевала
+                    duplicate = find_duplicate_kwargs([serializer.validated_data])[0]
+                    pass_instance = serializer.save(**duplicate)
+                    # Номер изменения для синхронизации - после сохранения
+                    # изображений, чтобы не держать блокировку счетчика
+                    Pass.objects.filter(id=pass_instance.id).mark_changed()
+                    stats.record_created([pass_instance])
+                    logger.info(
+                        "Создан новый перевал ID: %s", pass_instance.id,
+                        extra={
+                            'event': 'submit_data.created',
+                            'pass_id': pass_instance.id,
+                            'duplicate_of': pass_instance.duplicate_of_id,
+                        }
+                    )
+                    if idempotency_key:
+                        idempotency.remember(idempotency_key, pass_instance.id, body_hash)
+                        transaction.on_commit(lambda: idempotency.cache_result(
+                            idempotency_key, pass_instance.id, body_hash
+                        ))
                     return True, pass_instance, pass_instance.id
                 else:
                     error_message = "Недостаточно полей или некорректные данные"
-                    logger.error(f"Ошибка валидации: {serializer.errors}")
+                    logger.error("Ошибка валидации: %s", serializer.errors)
                     return False, error_message, None
                     
+        except (ImageTooLarge, UnsupportedImageType, UploadError) as e:
+            error_message = f"Недостаточно полей или некорректные данные: {str(e)}"
+            logger.error(error_message)
+            return False, error_message, None
+            
+        except (ValueError, TypeError) as e:
+            # Некорректный base64 (binascii.Error) или data URI без ";base64,"
+            logger.error("Ошибка декодирования изображений: %s", e)
+            return False, "Недостаточно полей или некорректные данные", None
+            
         except IntegrityError as e:
+            # Параллельный повтор того же запроса успел сохранить запись
+            existing_id = (
+                idempotency.lookup(idempotency_key, body_hash) if idempotency_key else None
+            )
+            if existing_id is not None:
+                logger.info("Повторный запрос, перевал уже создан ID: %s", existing_id)
+                return True, Pass.objects.get(id=existing_id), existing_id
+            
             error_message = f"Ошибка целостности данных: {str(e)}"
             logger.error(error_message)
             return False, error_message, None
@@ -56,29 +284,247 @@ class PassDataHandler:
             logger.error(error_message)
             return False, error_message, None
 
+    @staticmethod
+    def create_passes_batch(records):
+        """
+        Создает пакет записей о перевалах.
+        
+        Записи валидируются по отдельности, изображения декодируются до
+        начала транзакции. Корректные записи сохраняются пакетными вставками
+        в одной транзакции, ошибки возвращаются для каждой записи отдельно.
+        
+        Args:
+            records (list): Список данных о перевалах в формате submitData
+            
+        Returns:
+            list: Для каждой записи dict с полями status, message и id
+        """
+        results = [None] * len(records)
+        valid = []
+        # Ограничение на объем изображений действует на весь запрос
+        budget = ImageBudget()
+        
+        for index, data in enumerate(records):
+            if not isinstance(data, dict):
+                results[index] = {
+                    'status': 400,
+                    'message': "Некорректные данные записи",
+                    'id': None
+                }
+                continue
+            
+            missing_fields = get_missing_fields(data)
+            if missing_fields:
+                results[index] = {
+                    'status': 400,
+                    'message': f"Недостаточно полей. Отсутствуют: {', '.join(missing_fields)}",
+                    'id': None
+                }
+                continue
+            
+            serializer = PassSerializer(data=data)
+            with metrics.timer('validation'):
+                is_valid = serializer.is_valid()
+            if not is_valid:
+                logger.error("Ошибка валидации записи %s: %s", index, serializer.errors)
+                results[index] = {
+                    'status': 400,
+                    'message': "Недостаточно полей или некорректные данные",
+                    'id': None
+                }
+                continue
+            
+            record = serializer.validated_data
+            try:
+                with metrics.timer('image_decode'):
+                    files = load_images(record['images'], budget=budget)
+                record['images'] = [
+                    (image['title'], file)
+                    for image, file in zip(record['images'], files)
+                ]
+            except (ImageTooLarge, UnsupportedImageType, UploadError) as e:
+                logger.error("Ошибка декодирования изображений записи %s: %s", index, e)
+                results[index] = {'status': 400, 'message': str(e), 'id': None}
+                continue
+            except (ValueError, TypeError) as e:
+                logger.error("Ошибка декодирования изображений записи %s: %s", index, e)
+                results[index] = {
+                    'status': 400,
+                    'message': "Некорректные данные изображения",
+                    'id': None
+                }
+                continue
+            valid.append((index, record))
+        
+        if not valid:
+            return results
+        
+        try:
+            with metrics.timer('transaction'), transaction.atomic():
+                records = [record for _, record in valid]
+                for record, duplicate in zip(records, find_duplicate_kwargs(records)):
+                    record.update(duplicate)
+                passes = bulk_create_passes(records)
+        except Exception as e:
+            error_message = f"Ошибка сервера/БД: {str(e)}"
+            logger.error(error_message)
+            for index, _ in valid:
+                results[index] = {'status': 500, 'message': error_message, 'id': None}
+            return results
+        
+        for (index, _), pass_instance in zip(valid, passes):
+            results[index] = {'status': 200, 'message': None, 'id': pass_instance.id}
+            if pass_instance.duplicate_of_id:
+                results[index]['duplicate_of'] = pass_instance.duplicate_of_id
+        logger.info(
+            "Пакетно создано перевалов: %s", len(passes),
+            extra={'event': 'submit_data_batch.created', 'records': len(passes)}
+        )
+        return results
 
-@api_view(['POST'])
+
+def parse_limit(value):
+    """Размер страницы из параметра limit, не больше FSTR_PAGE_MAX_SIZE"""
+    if value is None:
+        return settings.FSTR_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"Некорректный limit: {value}")
+    return min(limit, settings.FSTR_PAGE_MAX_SIZE)
+
+
+def parse_level_filter(params):
+    """
+    Фильтр по категории трудности из параметров season, level_min, level_max.
+    
+    Returns:
+        tuple|None: (сезон, наименьший код, наибольший код) или None без фильтра
+    
+    Raises:
+        ValueError: Некорректный сезон или категория
+    """
+    season = params.get('season')
+    level_min = params.get('level_min')
+    level_max = params.get('level_max')
+    if season is None:
+        if level_min or level_max:
+            raise ValueError("Для фильтра по категории укажите season")
+        return None
+    if season not in LEVEL_SEASONS:
+        raise ValueError(f"Некорректный season: {season}")
+    level_min = Difficulty.parse(level_min) if level_min else None
+    level_max = Difficulty.parse(level_max) if level_max else None
+    return season, level_min, level_max
+
+
+def list_passes(request):
+    """
+    Список перевалов с постраничной навигацией по курсору.
+    
+    Фильтр по категории трудности: season (winter, summer, autumn, spring)
+    и необязательные level_min, level_max (например, 1Б и 2А включительно).
+    
+    Endpoint: GET /submitData/?user__email=&status=&season=&level_min=&level_max=&cursor=&limit=
+    
+    Returns:
+        JSON response with status, message, results and next_cursor fields
+    """
+    params = request.query_params
+    try:
+        limit = parse_limit(params.get('limit'))
+        passes, next_cursor = PassDataHandler.get_passes(
+            user_email=params.get('user__email'),
+            pass_status=params.get('status'),
+            cursor=params.get('cursor'),
+            limit=limit,
+            level=parse_level_filter(params)
+        )
+    except ValueError as e:
+        response_data = {
+            'status': 400,
+            'message': str(e),
+            'results': [],
+            'next_cursor': None
+        }
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = PassSerializer(passes, many=True, context={'request': request})
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': serializer.data,
+        'next_cursor': next_cursor
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'POST'])
 def submit_data(request):
     """
     REST API метод POST submitData.
     
     Получает и сохраняет информацию о перевале от мобильного приложения туриста.
+    GET-запрос возвращает список перевалов (см. list_passes).
     
     Endpoint: POST /submitData
     
     Returns:
         JSON response with status, message and id fields
     """
+    if request.method == 'GET':
+        return list_passes(request)
+    
     try:
-        # Получаем данные из запроса
-        data = request.data
+        # Тело читается до request.data: после разбора оно недоступно,
+        # а хеш тела нужен для ключа идемпотентности
+        body = request.body
+        try:
+            data = request.data
+        except ParseError:
+            # Ответы совпадают с асинхронным submit_data_async
+            response_data = {
+                'status': 400,
+                'message': "Некорректный JSON",
+                'id': None
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            response_data = {
+                'status': 400,
+                'message': "Некорректные данные",
+                'id': None
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
         
-        # Логируем входящий запрос
-        logger.info(f"Получен запрос submitData: {data}")
+        # Повтор уже обработанного запроса (например, после обрыва связи)
+        # получает исходный id без повторной записи и декодирования
+        idempotency_key, body_hash = idempotency.get_request_key(request, body, data)
+        if idempotency_key:
+            existing_id = idempotency.lookup(idempotency_key, body_hash)
+            if existing_id is not None:
+                logger.info(
+                    "Повторный запрос submitData, перевал ID: %s", existing_id,
+                    extra={'event': 'submit_data.replayed', 'pass_id': existing_id}
+                )
+                response_data = {
+                    'status': 200,
+                    'message': None,
+                    'id': existing_id
+                }
+                return Response(
+                    response_data,
+                    status=status.HTTP_200_OK,
+                    headers={'Idempotent-Replayed': 'true'}
+                )
+        
+        # Логируем сводку запроса: тело с base64-изображениями в журнал не пишем
+        logger.info(
+            "Получен запрос submitData",
+            extra={'event': 'submit_data.received', **summarize_submission(data)}
+        )
         
         # Проверяем наличие обязательных полей
-        required_fields = ['title', 'user', 'coords', 'level']
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = get_missing_fields(data)
         
         if missing_fields:
             response_data = {
@@ -89,7 +535,9 @@ def submit_data(request):
             return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
         
         # Создаем запись через класс работы с данными
-        success, result, pass_id = PassDataHandler.create_pass(data)
+        success, result, pass_id = PassDataHandler.create_pass(
+            data, idempotency_key, body_hash
+        )
         
         if success:
             # Успешное сохранение
@@ -98,6 +546,9 @@ def submit_data(request):
                 'message': None,
                 'id': pass_id
             }
+            if result.duplicate_of_id:
+                # Запись похожа на уже добавленный перевал
+                response_data['duplicate_of'] = result.duplicate_of_id
             return Response(response_data, status=status.HTTP_200_OK)
         else:
             # Ошибка при сохранении
@@ -116,6 +567,15 @@ def submit_data(request):
                 }
                 return Response(response_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
                 
+    except idempotency.KeyReused as e:
+        logger.warning("Отклонен повтор submitData: %s", e)
+        response_data = {
+            'status': 422,
+            'message': str(e),
+            'id': None
+        }
+        return Response(response_data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
     except Exception as e:
         # Обработка непредвиденных ошибок
         error_message = f"Ошибка сервера: {str(e)}"
@@ -126,3 +586,536 @@ def submit_data(request):
             'id': None
         }
         return Response(response_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def get_pass(request, pass_id):
+    """
+    REST API метод GET submitData/<id>.
+    
+    Возвращает запись о перевале со всеми связанными данными и статусом модерации.
+    
+    Endpoint: GET /submitData/<id>/
+    
+    Returns:
+        JSON response with pass data
+    """
+    pass_instance = PassDataHandler.get_pass(pass_id)
+    if pass_instance is None:
+        response_data = {
+            'status': 404,
+            'message': f"Перевал с ID {pass_id} не найден",
+            'id': None
+        }
+        return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = PassSerializer(pass_instance, context={'request': request})
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def sync_passes(request):
+    """
+    REST API метод GET submitData/sync.
+    
+    Возвращает перевалы пользователя, добавленные или измененные
+    (в том числе сменившие статус модерации) после курсора. Приложение
+    хранит next_cursor и при следующей синхронизации получает только
+    изменения; пока has_more, запрашивает следующую страницу сразу.
+    
+    Endpoint: GET /submitData/sync/?user__email=<email>&cursor=<cursor>&limit=<n>
+    
+    Returns:
+        JSON response with status, message, results, next_cursor and has_more fields
+    """
+    params = request.query_params
+    try:
+        user_email = params.get('user__email')
+        if not user_email:
+            raise ValueError("Не указан параметр user__email")
+        passes, next_cursor, has_more = PassDataHandler.get_changes(
+            user_email,
+            cursor=params.get('cursor'),
+            limit=parse_limit(params.get('limit'))
+        )
+    except ValueError as e:
+        response_data = {
+            'status': 400,
+            'message': str(e),
+            'results': [],
+            'next_cursor': None,
+            'has_more': False
+        }
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = PassSerializer(passes, many=True, context={'request': request})
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': serializer.data,
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+def parse_coordinate(params, name, bound):
+    """Координата из параметра запроса в пределах [-bound, bound]"""
+    value = params.get(name)
+    if value is None:
+        raise ValueError(f"Не указан параметр {name}")
+    value = float(value)
+    if not -bound <= value <= bound:
+        raise ValueError(f"Некорректное значение {name}: {value}")
+    return value
+
+
+@api_view(['GET'])
+def passes_in_bbox(request):
+    """
+    REST API метод GET submitData/bbox.
+    
+    Возвращает перевалы внутри прямоугольника координат.
+    
+    Endpoint: GET /submitData/bbox/?min_lat=&min_lon=&max_lat=&max_lon=&status=&limit=
+    
+    Returns:
+        JSON response with status, message and results fields
+    """
+    params = request.query_params
+    try:
+        min_lat = parse_coordinate(params, 'min_lat', 90)
+        max_lat = parse_coordinate(params, 'max_lat', 90)
+        min_lon = parse_coordinate(params, 'min_lon', 180)
+        max_lon = parse_coordinate(params, 'max_lon', 180)
+        if min_lat > max_lat:
+            raise ValueError("min_lat больше max_lat")
+        limit = min(
+            int(params.get('limit', settings.FSTR_GEO_MAX_RESULTS)),
+            settings.FSTR_GEO_MAX_RESULTS
+        )
+        if limit < 1:
+            raise ValueError(f"Некорректный limit: {limit}")
+    except ValueError as e:
+        response_data = {'status': 400, 'message': str(e), 'results': []}
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    passes = PassDataHandler.get_passes_in_bbox(
+        min_lat, min_lon, max_lat, max_lon, limit,
+        pass_status=params.get('status')
+    )
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': PassLocationSerializer(passes, many=True).data
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def nearest_passes(request):
+    """
+    REST API метод GET submitData/nearest.
+    
+    Возвращает k ближайших к точке перевалов с расстоянием в километрах.
+    
+    Endpoint: GET /submitData/nearest/?lat=&lon=&k=&radius_km=
+    
+    Returns:
+        JSON response with status, message and results fields
+    """
+    params = request.query_params
+    try:
+        latitude = parse_coordinate(params, 'lat', 90)
+        longitude = parse_coordinate(params, 'lon', 180)
+        k = min(int(params.get('k', 10)), settings.FSTR_GEO_MAX_RESULTS)
+        if k < 1:
+            raise ValueError(f"Некорректный k: {k}")
+        radius_km = params.get('radius_km')
+        radius_km = float(radius_km) if radius_km is not None else None
+        if radius_km is not None and radius_km <= 0:
+            raise ValueError(f"Некорректный radius_km: {radius_km}")
+    except ValueError as e:
+        response_data = {'status': 400, 'message': str(e), 'results': []}
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    passes = PassDataHandler.get_nearest_passes(latitude, longitude, k, radius_km)
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': PassLocationSerializer(passes, many=True).data
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def search_passes(request):
+    """
+    REST API метод GET submitData/search.
+    
+    Полнотекстовый поиск перевалов по названиям и описанию маршрута
+    с учетом форм слов, от наиболее релевантных.
+    
+    Endpoint: GET /submitData/search/?q=&status=&limit=
+    
+    Returns:
+        JSON response with status, message and results fields
+    """
+    params = request.query_params
+    query = params.get('q', '').strip()
+    try:
+        if not query:
+            raise ValueError("Не указан поисковый запрос q")
+        limit = parse_limit(params.get('limit'))
+    except ValueError as e:
+        response_data = {'status': 400, 'message': str(e), 'results': []}
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    passes = PassDataHandler.search_passes(query, params.get('status'), limit)
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': PassLocationSerializer(passes, many=True).data
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def submit_data_batch(request):
+    """
+    REST API метод POST submitData/batch.
+    
+    Принимает массив записей о перевалах, накопленных мобильным приложением
+    без связи, и сохраняет их пакетно.
+    
+    Endpoint: POST /submitData/batch/
+    
+    Returns:
+        JSON response with status, message and results fields,
+        results contains status, message and id for each record
+    """
+    try:
+        records = request.data
+        
+        logger.info(
+            "Получен запрос submitData/batch",
+            extra={
+                'event': 'submit_data_batch.received',
+                **summarize_batch(records if isinstance(records, list) else [])
+            }
+        )
+        
+        if not isinstance(records, list) or not records:
+            response_data = {
+                'status': 400,
+                'message': "Ожидается непустой массив записей",
+                'results': []
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(records) > settings.FSTR_BATCH_MAX_RECORDS:
+            response_data = {
+                'status': 400,
+                'message': f"Слишком много записей. Максимум: {settings.FSTR_BATCH_MAX_RECORDS}",
+                'results': []
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = PassDataHandler.create_passes_batch(records)
+        response_data = {
+            'status': 200,
+            'message': None,
+            'results': results
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        # Обработка непредвиденных ошибок
+        error_message = f"Ошибка сервера: {str(e)}"
+        logger.error(error_message)
+        response_data = {
+            'status': 500,
+            'message': error_message,
+            'results': []
+        }
+        return Response(response_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _upload_response(upload, http_status, message=None):
+    """Ответ с состоянием загрузки; смещение дублируется в заголовке Upload-Offset"""
+    response_data = {
+        'status': http_status,
+        'message': message,
+        'token': upload.token,
+        'offset': upload.offset,
+        'size': upload.size
+    }
+    response = Response(response_data, status=http_status)
+    response['Upload-Offset'] = str(upload.offset)
+    return response
+
+
+@api_view(['POST'])
+def upload_create(request):
+    """
+    REST API метод POST uploads.
+    
+    Начинает загрузку изображения по частям: {"size": <байт>, "filename": "photo.jpg"}.
+    В multipart/form-data с полем file изображение загружается целиком.
+    Полученный token передается в submitData вместо base64:
+    {"title": "...", "upload": "<token>"}.
+    
+    Endpoint: POST /uploads/
+    
+    Returns:
+        JSON response with status, message, token, offset and size fields
+    """
+    try:
+        uploaded_file = request.FILES.get('file')
+        if uploaded_file is not None:
+            upload = uploads.create_upload_from_file(uploaded_file)
+        else:
+            data = request.data if isinstance(request.data, dict) else {}
+            upload = uploads.create_upload(
+                int(data.get('size', 0)), str(data.get('filename', ''))
+            )
+    except (TypeError, ValueError) as e:
+        response_data = {
+            'status': 400,
+            'message': str(e),
+            'token': None,
+            'offset': 0,
+            'size': None
+        }
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    logger.info("Начата загрузка %s, размер %s байт", upload.token[:8], upload.size)
+    return _upload_response(upload, status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'HEAD', 'PATCH'])
+def upload_detail(request, token):
+    """
+    REST API методы GET/HEAD и PATCH uploads/<token>.
+    
+    GET/HEAD возвращают смещение, с которого нужно продолжить загрузку.
+    PATCH дописывает часть: смещение части в заголовке Upload-Offset,
+    байты - в теле запроса. Часть пишется на диск по мере чтения, поэтому
+    после обрыва связи достаточно запросить смещение и продолжить.
+    
+    Endpoint: GET/HEAD/PATCH /uploads/<token>/
+    
+    Returns:
+        JSON response with status, message, token, offset and size fields;
+        409 если Upload-Offset не совпадает с полученным сервером,
+        411 без заголовка Content-Length
+    """
+    try:
+        upload = uploads.get_upload(token)
+    except UploadError as e:
+        response_data = {
+            'status': 404,
+            'message': str(e),
+            'token': token,
+            'offset': 0,
+            'size': None
+        }
+        return Response(response_data, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method != 'PATCH':
+        return _upload_response(upload, status.HTTP_200_OK)
+    
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return _upload_response(
+            upload, status.HTTP_400_BAD_REQUEST, "Не указан заголовок Upload-Offset"
+        )
+    # WSGI читает тело только в пределах Content-Length: без него
+    # (Transfer-Encoding: chunked) часть была бы принята пустой
+    content_length = request.META.get('CONTENT_LENGTH')
+    if not content_length:
+        return _upload_response(
+            upload, status.HTTP_411_LENGTH_REQUIRED, "Не указан заголовок Content-Length"
+        )
+    try:
+        content_length = int(content_length)
+        if content_length < 0:
+            raise ValueError(content_length)
+    except ValueError:
+        return _upload_response(
+            upload, status.HTTP_400_BAD_REQUEST, "Некорректный заголовок Content-Length"
+        )
+    # Тело читается потоком, без разбора парсерами DRF
+    stream = request.stream
+    if stream is None:
+        return _upload_response(upload, status.HTTP_400_BAD_REQUEST, "Пустая часть")
+    
+    try:
+        with metrics.timer('upload_write'):
+            uploads.write_chunk(upload, offset, stream, content_length)
+    except UploadConflict as e:
+        upload.offset = e.offset
+        return _upload_response(upload, status.HTTP_409_CONFLICT, str(e))
+    except UploadError as e:
+        return _upload_response(upload, status.HTTP_400_BAD_REQUEST, str(e))
+    
+    return _upload_response(upload, status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def moderation_claim(request):
+    """
+    REST API метод POST moderation/claim.
+    
+    Выдает модератору следующие новые записи и переводит их в статус pending
+    с арендой на FSTR_MODERATION_LEASE секунд. Доступен только сотрудникам
+    (is_staff); модератор - пользователь, выполнивший запрос.
+    
+    Endpoint: POST /moderation/claim/ {"limit": 10}
+    
+    Returns:
+        JSON response with status, message, results and lease_expires_at fields
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    moderator = request.user.get_username()
+    try:
+        limit = min(int(data.get('limit', 10)), settings.FSTR_PAGE_MAX_SIZE)
+        if limit < 1:
+            raise ValueError(f"Некорректный limit: {limit}")
+    except (TypeError, ValueError) as e:
+        response_data = {'status': 400, 'message': str(e), 'results': []}
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    ids, lease_expires_at = moderation.claim_passes(moderator, limit)
+    logger.info("Модератор %s взял в работу записи: %s", moderator, ids)
+    
+    passes = PassDataHandler.get_queryset().filter(id__in=ids).order_by('add_time', 'id')
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': PassSerializer(passes, many=True, context={'request': request}).data,
+        'lease_expires_at': lease_expires_at
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def moderation_resolve(request):
+    """
+    REST API метод POST moderation/resolve.
+    
+    Принимает или отклоняет арендованные модератором записи одним UPDATE.
+    Записи с истекшей арендой или взятые другим модератором не меняются.
+    Доступен только сотрудникам (is_staff).
+    
+    Endpoint: POST /moderation/resolve/ {"ids": [1, 2], "status": "accepted"}
+    
+    Returns:
+        JSON response with status, message and updated fields
+    """
+    data = request.data
+    moderator = request.user.get_username()
+    try:
+        if not isinstance(data, dict):
+            raise ValueError("Ожидается объект с полями ids и status")
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise ValueError("Ожидается непустой список ids")
+        ids = [int(pass_id) for pass_id in ids]
+        updated = moderation.resolve_passes(moderator, ids, data.get('status'))
+    except (TypeError, ValueError) as e:
+        response_data = {'status': 400, 'message': str(e), 'updated': 0}
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+    
+    logger.info(
+        "Модератор %s установил статус %s: %s записей",
+        moderator, data['status'], updated
+    )
+    response_data = {'status': 200, 'message': None, 'updated': updated}
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@require_GET
+def metrics_endpoint(request):
+    """
+    Метрики производительности в текстовом формате Prometheus.
+    
+    Гистограммы времени обработки запросов и этапов приема перевала
+    (валидация, транзакция, декодирование и запись изображений), числа
+    SQL-запросов и размера тела запроса, суммированные по всем процессам.
+    
+    Endpoint: GET /metrics
+    """
+    # Свои значения записываем сразу, чтобы ответ их не отставал
+    metrics.flush(force=True)
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@api_view(['GET'])
+def stats_endpoint(request):
+    """
+    REST API метод GET stats.
+    
+    Число перевалов по статусам, категориям трудности, диапазонам высот
+    и месяцам добавления. Читается из счетчиков PassStats, которые
+    обновляются вместе с перевалами.
+    
+    Endpoint: GET /stats/
+    
+    Returns:
+        JSON response with status, message and results fields
+    """
+    response_data = {
+        'status': 200,
+        'message': None,
+        'results': stats.get_stats()
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@require_GET
+def export_passes(request):
+    """
+    Потоковая выгрузка перевалов с координатами, категориями трудности
+    и ссылками на изображения.
+    
+    Параметры: format (csv, geojson или jsonl; по умолчанию jsonl),
+    status (по умолчанию accepted; all - все), since и until - дата
+    добавления (ISO 8601, until не включается).
+    
+    Endpoint: GET /export/?format=&status=&since=&until=
+    """
+    params = request.GET
+    export_format = params.get('format', 'jsonl')
+    try:
+        queryset = export.get_queryset(
+            status=export.parse_status(params.get('status', 'accepted')),
+            since=export.parse_moment(params['since'], 'since') if params.get('since') else None,
+            until=export.parse_moment(params['until'], 'until') if params.get('until') else None
+        )
+        lines = export.render(export_format, queryset, base_url=request.build_absolute_uri('/')[:-1])
+    except ValueError as e:
+        return JsonResponse(
+            {'status': 400, 'message': str(e)}, status=400,
+            json_dumps_params={'ensure_ascii': False}
+        )
+    
+    response = StreamingHttpResponse(lines, content_type=export.FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="passes.{export_format}"'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдача изображений перевалов из MEDIA_ROOT с ETag, Range и долгим
+    кешированием; файл передает прокси-сервер, если FSTR_MEDIA_ACCEL не off.
+    
+    Endpoint: GET /media/<path>
+    """
+    return media.serve(request, path)